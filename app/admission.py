@@ -0,0 +1,456 @@
+"""
+Admission control for upstream OpenAI calls.
+
+Every call passes a circuit breaker, a token bucket for requests and one for
+tokens per minute, and an adaptive concurrency limit. The limit grows by one
+for every window of successful calls and is halved when the upstream throttles
+(AIMD), so throughput settles just below the quota instead of oscillating
+between bursts and 429 storms. Throttled and failed calls are retried with
+jittered exponential backoff, honoring Retry-After.
+"""
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Awaitable, Callable, TypeVar
+
+from app.config import get_settings
+from app.metrics import REGISTRY
+
+T = TypeVar("T")
+
+OPENAI_RETRIES = REGISTRY.counter(
+    "openai_retries_total", "Retried OpenAI calls by reason", labels=("reason",)
+)
+OPENAI_REJECTIONS = REGISTRY.counter(
+    "openai_rejections_total", "OpenAI calls rejected by the open circuit breaker"
+)
+
+
+class UpstreamError(Exception):
+    """An OpenAI call failed with an error status, a timeout or a network error."""
+
+    def __init__(
+        self, status: int | None, retry_after: float | None = None, reason: str = ""
+    ) -> None:
+        """
+        Initialize an UpstreamError object.
+
+        Args:
+            status (int | None): The HTTP status, None for network errors.
+            retry_after (float | None): The time in seconds to wait before
+                retrying, if the upstream told.
+            reason (str): A short description of the failure.
+        """
+        super().__init__(reason or f"Upstream answered {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def throttled(self) -> bool:
+        return self.status == 429
+
+    @property
+    def retryable(self) -> bool:
+        return self.status is None or self.status == 429 or self.status >= 500
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """
+    Parse a Retry-After header.
+
+    Args:
+        value (str | None): The header, delay seconds or an HTTP date.
+
+    Returns:
+        float | None: The delay in seconds, or None if missing or invalid.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `per_minute` tokens a minute."""
+
+    def __init__(
+        self, per_minute: float, clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        """
+        Initialize a TokenBucket object.
+
+        Args:
+            per_minute (float): The refill rate, also the bucket capacity.
+            clock (Callable[[], float]): The time source, used by tests.
+        """
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.clock = clock
+        self.tokens = per_minute
+        self._updated_at = clock()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: float = 1) -> None:
+        """
+        Take tokens, waiting until enough are available.
+
+        Waiters are served in arrival order. Requests larger than the bucket
+        wait for a full bucket.
+
+        Args:
+            amount (float): The number of tokens.
+        """
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= amount
+
+    def adjust(self, amount: float) -> None:
+        """
+        Correct an estimate once the real cost is known.
+
+        Args:
+            amount (float): Tokens to take, or to give back if negative.
+        """
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+
+
+class AdaptiveLimiter:
+    """Concurrency limit adapted with additive increase, multiplicative decrease."""
+
+    def __init__(
+        self,
+        initial: int = 16,
+        minimum: int = 1,
+        maximum: int = 100,
+        cooldown: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """
+        Initialize an AdaptiveLimiter object.
+
+        Args:
+            initial (int): The starting limit.
+            minimum (int): The lowest limit.
+            maximum (int): The highest limit.
+            cooldown (float): The minimum time in seconds between two
+                decreases, so one burst of 429s halves the limit once.
+            clock (Callable[[], float]): The time source, used by tests.
+        """
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.cooldown = cooldown
+        self.clock = clock
+        self.in_flight = 0
+        self._decreased_at = float("-inf")
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self) -> None:
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def __aexit__(self, *_) -> None:
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def increase(self) -> None:
+        """Grow the limit by one for every `limit` successful calls."""
+        self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def decrease(self) -> None:
+        """Halve the limit, at most once per cooldown."""
+        now = self.clock()
+        if now - self._decreased_at >= self.cooldown:
+            self.limit = max(self.minimum, self.limit / 2)
+            self._decreased_at = now
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker over consecutive upstream failures.
+
+    After `threshold` consecutive failures the circuit opens and calls are
+    rejected for `reset_timeout` seconds. Then a single trial call is let
+    through: its success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(
+        self,
+        threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """
+        Initialize a CircuitBreaker object.
+
+        Args:
+            threshold (int): The consecutive failures that open the circuit.
+            reset_timeout (float): The time in seconds the circuit stays open.
+            clock (Callable[[], float]): The time source, used by tests.
+        """
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self._opened_at: float | None = None
+        self._trial_at: float | None = None
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self.clock() - self._opened_at < self.reset_timeout:
+            return "open"
+        return "half-open"
+
+    def check(self) -> None:
+        """
+        Let a call through or reject it.
+
+        Raises:
+            UpstreamError: If the circuit is open, or half-open with a trial
+                call in flight.
+        """
+        state = self.state
+        if state == "closed":
+            return
+        # A trial call that never reported back frees its place after a while.
+        now = self.clock()
+        if state == "half-open" and (
+            self._trial_at is None or now - self._trial_at >= self.reset_timeout
+        ):
+            self._trial_at = now
+            return
+        OPENAI_REJECTIONS.inc()
+        # Half-open with the trial call in flight there is no time left to
+        # wait out, callers come back a second later for its outcome.
+        retry_after = max(1.0, self._opened_at + self.reset_timeout - now)
+        raise UpstreamError(503, retry_after, "Circuit breaker is open")
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._opened_at = None
+        self._trial_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._trial_at is not None or self.failures >= self.threshold:
+            self._opened_at = self.clock()
+        self._trial_at = None
+
+
+class AdmissionController:
+    """Gate of all upstream calls, see the module docstring."""
+
+    def __init__(
+        self,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        limiter: AdaptiveLimiter | None = None,
+        breaker: CircuitBreaker | None = None,
+        max_retries: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 20.0,
+    ) -> None:
+        """
+        Initialize an AdmissionController object.
+
+        Args:
+            requests_per_minute (float): The request quota, 0 is unlimited.
+            tokens_per_minute (float): The token quota, 0 is unlimited.
+            limiter (AdaptiveLimiter | None): The concurrency limit.
+            breaker (CircuitBreaker | None): The circuit breaker.
+            max_retries (int): The number of retries of a failed call.
+            base_delay (float): The backoff of the first retry in seconds.
+            max_delay (float): The highest backoff in seconds.
+        """
+        self.requests = (
+            TokenBucket(requests_per_minute) if requests_per_minute else None
+        )
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.limiter = limiter or AdaptiveLimiter()
+        self.breaker = breaker or CircuitBreaker()
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    async def run(self, send: Callable[[], Awaitable[T]], tokens: int = 0) -> T:
+        """
+        Make an upstream call under admission control.
+
+        Args:
+            send (Callable[[], Awaitable[T]]): Makes one attempt of the call.
+                It raises UpstreamError on error statuses, timeouts and
+                network errors.
+            tokens (int): The estimated tokens of the call.
+
+        Returns:
+            T: The result of the first successful attempt.
+
+        Raises:
+            UpstreamError: If the circuit is open, the error is not retryable
+                or the retries are exhausted.
+        """
+        async with self.hold(send, tokens) as result:
+            return result
+
+    @asynccontextmanager
+    async def hold(
+        self, send: Callable[[], Awaitable[T]], tokens: int = 0
+    ) -> AsyncIterator[T]:
+        """
+        Make an upstream call under admission control and hold its slot.
+
+        Like `run`, but the concurrency slot is released when the block exits,
+        so a streamed response counts as in flight until it is read. An
+        UpstreamError raised in the block counts as a failed call, it is not
+        retried.
+
+        Args:
+            send (Callable[[], Awaitable[T]]): Makes one attempt of the call.
+            tokens (int): The estimated tokens of the call.
+
+        Yields:
+            T: The result of the first successful attempt.
+
+        Raises:
+            UpstreamError: If the circuit is open, the error is not retryable
+                or the retries are exhausted.
+        """
+        attempt = 0
+        while True:
+            self.breaker.check()
+            if self.requests is not None:
+                await self.requests.acquire(1)
+            if self.tokens is not None and tokens:
+                await self.tokens.acquire(tokens)
+            async with self.limiter:
+                try:
+                    result = await send()
+                except UpstreamError as e:
+                    self._record_failure(e)
+                    if not e.retryable or attempt >= self.max_retries:
+                        raise
+                    error = e
+                else:
+                    try:
+                        yield result
+                    except UpstreamError as e:
+                        self._record_failure(e)
+                        raise
+                    self.limiter.increase()
+                    self.breaker.record_success()
+                    return
+            OPENAI_RETRIES.labels("throttled" if error.throttled else "error").inc()
+            await asyncio.sleep(self._delay(attempt, error.retry_after))
+            attempt += 1
+
+    def record_usage(self, estimated: int, used: int) -> None:
+        """
+        Correct the token bucket with the real usage of a call.
+
+        Args:
+            estimated (int): The tokens taken before the call.
+            used (int): The tokens reported by the upstream.
+        """
+        if self.tokens is not None and used:
+            self.tokens.adjust(used - estimated)
+
+    def stats(self) -> dict:
+        return {
+            "concurrency_limit": int(self.limiter.limit),
+            "in_flight": self.limiter.in_flight,
+            "breaker": self.breaker.state,
+        }
+
+    def _record_failure(self, error: UpstreamError) -> None:
+        if not error.retryable:
+            # The upstream answered, the request itself is at fault.
+            self.breaker.record_success()
+            return
+        if error.throttled:
+            self.limiter.decrease()
+        self.breaker.record_failure()
+
+    def _delay(self, attempt: int, retry_after: float | None) -> float:
+        # Full jitter spreads the retries of a burst over the backoff window.
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        if retry_after is not None:
+            return min(self.max_delay, retry_after) + backoff / 2
+        return backoff
+
+
+def build_admission_controller(gauges: bool = True) -> AdmissionController:
+    """
+    Build the admission controller configured through environment variables.
+
+    OPENAI_RPM and OPENAI_TPM set the quotas (0 is unlimited),
+    OPENAI_CONCURRENCY_INITIAL, OPENAI_CONCURRENCY_MIN and
+    OPENAI_CONCURRENCY_MAX the adaptive limit, OPENAI_MAX_RETRIES,
+    OPENAI_RETRY_BASE_DELAY and OPENAI_RETRY_MAX_DELAY the retries, and
+    OPENAI_BREAKER_THRESHOLD and OPENAI_BREAKER_RESET the circuit breaker.
+
+    Args:
+        gauges (bool): Whether the limit and breaker gauges report this
+            controller, only one controller can be reported.
+
+    Returns:
+        AdmissionController: The configured controller.
+    """
+    settings = get_settings()
+    controller = AdmissionController(
+        requests_per_minute=settings.get_float("OPENAI_RPM", 0),
+        tokens_per_minute=settings.get_float("OPENAI_TPM", 0),
+        limiter=AdaptiveLimiter(
+            initial=settings.get_int("OPENAI_CONCURRENCY_INITIAL", 16),
+            minimum=settings.get_int("OPENAI_CONCURRENCY_MIN", 1),
+            maximum=settings.get_int("OPENAI_CONCURRENCY_MAX", 100),
+        ),
+        breaker=CircuitBreaker(
+            threshold=settings.get_int("OPENAI_BREAKER_THRESHOLD", 5),
+            reset_timeout=settings.get_float("OPENAI_BREAKER_RESET", 30),
+        ),
+        max_retries=settings.get_int("OPENAI_MAX_RETRIES", 3),
+        base_delay=settings.get_float("OPENAI_RETRY_BASE_DELAY", 0.5),
+        max_delay=settings.get_float("OPENAI_RETRY_MAX_DELAY", 20),
+    )
+    if not gauges:
+        return controller
+    REGISTRY.gauge(
+        "openai_concurrency_limit",
+        "Adaptive concurrency limit of OpenAI calls",
+        lambda: int(controller.limiter.limit),
+    )
+    REGISTRY.gauge(
+        "openai_in_flight",
+        "OpenAI calls in flight",
+        lambda: controller.limiter.in_flight,
+    )
+    REGISTRY.gauge(
+        "openai_circuit_open",
+        "1 while the circuit breaker rejects OpenAI calls",
+        lambda: int(controller.breaker.state == "open"),
+    )
+    return controller
@@ -0,0 +1,445 @@
+"""
+Translation backends and hedged requests across them.
+
+A backend has the interface of `OpenAIClient`: `ask_gpt3`, `stream_gpt3` and
+`ask_batch`, and is started and closed as an async context manager. Backends
+are registered by name, TRANSLATION_BACKENDS lists the enabled ones with the
+primary first.
+"""
+import asyncio
+import re
+import time
+from collections import deque
+from contextlib import AsyncExitStack
+from typing import AsyncIterator, Callable, Protocol
+
+from app.admission import UpstreamError
+from app.config import get_settings
+from app.metrics import REGISTRY
+from app.openai import build_openai_client
+
+BACKEND_SECONDS = REGISTRY.histogram(
+    "translation_backend_seconds",
+    "Time of successful translations by backend",
+    labels=("backend",),
+)
+HEDGES = REGISTRY.counter(
+    "translation_hedges_total",
+    "Translations sent to more than one backend, by the backend that answered",
+    labels=("winner",),
+)
+
+
+class Backend(Protocol):
+    async def __aenter__(self) -> "Backend":
+        ...
+
+    async def __aexit__(self, *_) -> None:
+        ...
+
+    async def ask_gpt3(self, prompt: str, animal: str) -> tuple[str, str]:
+        ...
+
+    def stream_gpt3(self, prompt: str, animal: str) -> AsyncIterator[str]:
+        ...
+
+    async def ask_batch(
+        self, tasks: list[tuple[str, str]]
+    ) -> dict[int, tuple[str, str]]:
+        ...
+
+
+class UnsupportedTranslation(UpstreamError):
+    """The backend can not translate between the two languages."""
+
+    def __init__(self, source: str, language: str) -> None:
+        super().__init__(422, reason=f"No rule translates {source} to {language}")
+
+
+ANIMAL_SOUNDS = {
+    "bird": "tweet",
+    "cat": "meow",
+    "cow": "moo",
+    "dog": "woof",
+    "duck": "quack",
+    "fish": "blob",
+    "frog": "ribbit",
+    "horse": "neigh",
+    "mouse": "squeak",
+    "owl": "hoot",
+    "pig": "oink",
+    "sheep": "baa",
+}
+_WORD = re.compile(r"[^\W\d_]+")
+_REPEATS = re.compile(r"(.)\1+")
+
+
+def _squeeze(word: str) -> str:
+    # "Mooooo" and "moo" are the same sound.
+    return _REPEATS.sub(r"\1", word.casefold())
+
+
+_SOUND_ANIMALS = {_squeeze(sound): animal for animal, sound in ANIMAL_SOUNDS.items()}
+
+
+class RuleBasedBackend:
+    """
+    Local engine translating animal sounds without upstream calls.
+
+    The source is the animal every word of the text is the sound of, or
+    "Human". A text is translated to an animal by replacing every word with
+    the sound of the animal, and a text already in the target language is
+    returned unchanged. Other translations raise `UnsupportedTranslation`.
+    """
+
+    async def __aenter__(self) -> "RuleBasedBackend":
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        pass
+
+    def detect(self, text: str) -> str:
+        """
+        Detect the source of a text.
+
+        Args:
+            text (str): The text.
+
+        Returns:
+            str: The capitalized animal name, or "Human".
+        """
+        animals = {_SOUND_ANIMALS.get(_squeeze(word)) for word in _WORD.findall(text)}
+        if len(animals) == 1 and None not in animals:
+            return animals.pop().capitalize()
+        return "Human"
+
+    def translate(self, text: str, language: str) -> tuple[str, str]:
+        """
+        Translate a text.
+
+        Args:
+            text (str): The text to translate.
+            language (str): The language to translate to.
+
+        Raises:
+            UnsupportedTranslation: If no rule covers the translation.
+
+        Returns:
+            tuple[str, str]: The detected source language and the translated text.
+        """
+        source = self.detect(text)
+        if source.casefold() == language.casefold():
+            return (source, text)
+        sound = ANIMAL_SOUNDS.get(language.casefold())
+        if sound is None:
+            raise UnsupportedTranslation(source, language)
+
+        def replace(match: re.Match) -> str:
+            return sound.capitalize() if match[0][0].isupper() else sound
+
+        return (source, _WORD.sub(replace, text))
+
+    async def ask_gpt3(self, prompt: str, animal: str) -> tuple[str, str]:
+        return self.translate(prompt, animal)
+
+    async def stream_gpt3(self, prompt: str, animal: str) -> AsyncIterator[str]:
+        source, translation = self.translate(prompt, animal)
+        yield f"Animal: {source}\n"
+        yield f"Translation: {translation}"
+
+    async def ask_batch(
+        self, tasks: list[tuple[str, str]]
+    ) -> dict[int, tuple[str, str]]:
+        results = {}
+        for index, (prompt, animal) in enumerate(tasks):
+            try:
+                results[index] = self.translate(prompt, animal)
+            except UnsupportedTranslation:
+                continue
+        return results
+
+
+class LatencyStats:
+    """Latencies of the last calls of a backend."""
+
+    def __init__(self, window: int = 256) -> None:
+        """
+        Initialize a LatencyStats object.
+
+        Args:
+            window (int): The number of latencies kept.
+        """
+        self.samples: deque[float] = deque(maxlen=window)
+        self.errors = 0
+
+    def observe(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def quantile(self, q: float) -> float | None:
+        """
+        Get a latency quantile of the kept calls.
+
+        Args:
+            q (float): The quantile, between 0 and 1.
+
+        Returns:
+            float | None: The latency in seconds, None without calls.
+        """
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def stats(self) -> dict:
+        return {
+            "samples": len(self.samples),
+            "errors": self.errors,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+        }
+
+
+class HedgedBackend:
+    """
+    Send translations to a primary backend and hedge slow calls.
+
+    When the primary has not answered within its latency quantile (p95 by
+    default), the translation is also sent to the fastest other backend. The
+    first valid answer is returned and the other call is cancelled. A failed
+    call is replaced by the next backend right away. Until the primary has
+    `min_samples` latencies, `default_delay` is used as the hedge delay.
+
+    Streams and batches are sent to the primary only.
+    """
+
+    def __init__(
+        self,
+        backends: dict[str, Backend],
+        quantile: float = 0.95,
+        min_delay: float = 0.05,
+        default_delay: float = 2.0,
+        min_samples: int = 20,
+        clock: Callable[[], float] = time.perf_counter,
+    ) -> None:
+        """
+        Initialize a HedgedBackend object.
+
+        Args:
+            backends (dict[str, Backend]): The backends by name, the primary first.
+            quantile (float): The latency quantile of the primary after which
+                a call is hedged.
+            min_delay (float): The minimal hedge delay in seconds.
+            default_delay (float): The hedge delay in seconds while the
+                primary has too few latencies.
+            min_samples (int): The latencies needed to compute the hedge delay.
+            clock (Callable[[], float]): The time source, used by tests.
+        """
+        self.backends = backends
+        self.primary = next(iter(backends))
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self.default_delay = default_delay
+        self.min_samples = min_samples
+        self.clock = clock
+        self.latency = {name: LatencyStats() for name in backends}
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._stack = AsyncExitStack()
+
+    async def __aenter__(self) -> "HedgedBackend":
+        for backend in self.backends.values():
+            await self._stack.enter_async_context(backend)
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """Close all backends."""
+        await self._stack.aclose()
+
+    def hedge_delay(self) -> float:
+        """
+        Get the time a call waits for the primary before it is hedged.
+
+        Returns:
+            float: The delay in seconds.
+        """
+        stats = self.latency[self.primary]
+        if len(stats.samples) < self.min_samples:
+            return self.default_delay
+        return max(self.min_delay, stats.quantile(self.quantile))
+
+    async def ask_gpt3(self, prompt: str, animal: str) -> tuple[str, str]:
+        """
+        Translate a text, hedging a slow primary.
+
+        Args:
+            prompt (str): The text to translate.
+            animal (str): The language to translate to.
+
+        Returns:
+            tuple[str, str]: The detected source language and the translated text.
+        """
+        names = iter(self._candidates())
+        pending: dict[asyncio.Task, str] = {}
+        errors: list[Exception] = []
+        hedged = False
+        self._launch(next(names), prompt, animal, pending)
+        try:
+            while pending:
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=None if hedged else self.hedge_delay(),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    hedged = True
+                    self._launch(next(names, None), prompt, animal, pending)
+                    continue
+                for task in done:
+                    name = pending.pop(task)
+                    if task.exception() is None:
+                        self._count_win(name, hedged or bool(errors))
+                        return task.result()
+                    errors.append(task.exception())
+                    self._launch(next(names, None), prompt, animal, pending)
+            raise errors[0]
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def stream_gpt3(self, prompt: str, animal: str) -> AsyncIterator[str]:
+        return self.backends[self.primary].stream_gpt3(prompt, animal)
+
+    async def ask_batch(
+        self, tasks: list[tuple[str, str]]
+    ) -> dict[int, tuple[str, str]]:
+        return await self.backends[self.primary].ask_batch(tasks)
+
+    def stats(self) -> dict:
+        """
+        Get hedging counters.
+
+        Returns:
+            dict: The hedge delay, the number of hedged calls and of calls
+                answered by another backend than the primary, and the
+                latencies of every backend.
+        """
+        return {
+            "primary": self.primary,
+            "hedge_delay": self.hedge_delay(),
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "backends": {name: stats.stats() for name, stats in self.latency.items()},
+        }
+
+    def _candidates(self) -> list[str]:
+        # Backends without latencies yet sort first, so they get measured.
+        others = sorted(
+            (name for name in self.backends if name != self.primary),
+            key=lambda name: self.latency[name].quantile(self.quantile) or 0.0,
+        )
+        return [self.primary, *others]
+
+    def _launch(
+        self,
+        name: str | None,
+        prompt: str,
+        animal: str,
+        pending: dict[asyncio.Task, str],
+    ) -> None:
+        if name is None:
+            return
+        if name != self.primary:
+            self.hedges += 1
+        pending[asyncio.create_task(self._call(name, prompt, animal))] = name
+
+    async def _call(self, name: str, prompt: str, animal: str) -> tuple[str, str]:
+        stats = self.latency[name]
+        started = self.clock()
+        try:
+            result = await self.backends[name].ask_gpt3(prompt, animal)
+        except asyncio.CancelledError:
+            # A lower bound, leaving cancelled calls out would hide slow answers.
+            stats.observe(self.clock() - started)
+            raise
+        except Exception:
+            stats.errors += 1
+            raise
+        elapsed = self.clock() - started
+        stats.observe(elapsed)
+        BACKEND_SECONDS.labels(name).observe(elapsed)
+        return result
+
+    def _count_win(self, name: str, hedged: bool) -> None:
+        if not hedged:
+            return
+        HEDGES.labels(name).inc()
+        if name != self.primary:
+            self.hedge_wins += 1
+
+
+BACKENDS: dict[str, Callable[[], Backend]] = {}
+
+
+def register_backend(name: str, factory: Callable[[], Backend]) -> None:
+    """
+    Register a backend, a backend with the same name is replaced.
+
+    Args:
+        name (str): The name used in TRANSLATION_BACKENDS.
+        factory (Callable[[], Backend]): Builds the not yet started backend.
+    """
+    BACKENDS[name] = factory
+
+
+register_backend("openai", build_openai_client)
+register_backend(
+    "openai_fallback",
+    lambda: build_openai_client(
+        model=get_settings().get("OPENAI_FALLBACK_MODEL", "gpt-4o-mini"),
+        endpoint=get_settings().get("OPENAI_FALLBACK_URL"),
+        gauges=False,
+    ),
+)
+register_backend("rules", RuleBasedBackend)
+
+
+def build_backend() -> Backend:
+    """
+    Build the translation backend configured through environment variables.
+
+    TRANSLATION_BACKENDS is the comma separated list of backend names, the
+    first is the primary. With more than one backend calls are hedged,
+    HEDGE_QUANTILE sets the latency quantile of the primary after which a
+    call is hedged, HEDGE_MIN_DELAY_MS the minimal delay and
+    HEDGE_DEFAULT_DELAY_MS the delay until enough latencies are known.
+
+    Raises:
+        ValueError: If a backend name is not registered.
+
+    Returns:
+        Backend: The not yet started backend.
+    """
+    settings = get_settings()
+    names = [
+        name.strip()
+        for name in settings.get("TRANSLATION_BACKENDS", "openai").split(",")
+        if name.strip()
+    ]
+    unknown = [name for name in names if name not in BACKENDS]
+    if unknown or not names:
+        raise ValueError(
+            f"Unknown translation backends {unknown}, expected {sorted(BACKENDS)}"
+        )
+    backends = {name: BACKENDS[name]() for name in names}
+    if len(backends) == 1:
+        return backends[names[0]]
+    return HedgedBackend(
+        backends,
+        quantile=settings.get_float("HEDGE_QUANTILE", 0.95),
+        min_delay=settings.get_float("HEDGE_MIN_DELAY_MS", 50) / 1000,
+        default_delay=settings.get_float("HEDGE_DEFAULT_DELAY_MS", 2000) / 1000,
+    )
@@ -0,0 +1,181 @@
+import asyncio
+from typing import AsyncIterator
+
+from app.backends import Backend
+from app.config import get_settings
+
+
+class _PendingTranslation:
+    def __init__(self, prompt: str, animal: str, future: asyncio.Future) -> None:
+        self.prompt = prompt
+        self.animal = animal
+        self.future = future
+
+
+class TranslationBatcher:
+    """
+    Collect translation requests and send them as one chat completion.
+
+    Requests are buffered until `max_size` of them are pending or `window`
+    seconds have passed since the first one, whichever comes first. Items the
+    batched answer does not cover are translated with individual calls.
+
+    The batcher has the same `ask_gpt3` interface as a `Backend`, so the
+    `Translator` can use either of them.
+    """
+
+    def __init__(
+        self, client: Backend, max_size: int = 16, window: float = 0.02
+    ) -> None:
+        """
+        Initialize a TranslationBatcher object.
+
+        Args:
+            client (Backend): The backend used for upstream calls.
+            max_size (int): The maximum number of translations in one batch.
+            window (float): The time in seconds to wait for a batch to fill.
+        """
+        self.client = client
+        self.max_size = max_size
+        self.window = window
+        self.batches = 0
+        self.batched_items = 0
+        self.fallbacks = 0
+        self._pending: list[_PendingTranslation] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def __aenter__(self) -> "TranslationBatcher":
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        await self.close()
+
+    async def ask_gpt3(self, prompt: str, animal: str) -> tuple[str, str]:
+        """
+        Translate a text as part of the next batch.
+
+        Args:
+            prompt (str): The text to translate.
+            animal (str): The language to translate to.
+
+        Returns:
+            tuple[str, str]: The detected source language and the translated text.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(_PendingTranslation(prompt, animal, future))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def stream_gpt3(self, prompt: str, animal: str) -> AsyncIterator[str]:
+        """
+        Translate a text in stream mode, streamed requests are not batched.
+
+        Args:
+            prompt (str): The text to translate.
+            animal (str): The language to translate to.
+
+        Returns:
+            AsyncIterator[str]: The content deltas of the answer.
+        """
+        return self.client.stream_gpt3(prompt, animal)
+
+    async def close(self) -> None:
+        """Send the pending requests and wait for all batches in flight."""
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        """
+        Get batching counters.
+
+        Returns:
+            dict: The number of batches, of items sent in batches and of items
+                that fell back to an individual call.
+        """
+        return {
+            "batches": self.batches,
+            "batched_items": self.batched_items,
+            "fallbacks": self.fallbacks,
+        }
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: list[_PendingTranslation]) -> None:
+        # Requests whose callers were cancelled while waiting are dropped.
+        batch = [item for item in batch if not item.future.done()]
+        if not batch:
+            return
+        if len(batch) == 1:
+            await self._send_one(batch[0])
+            return
+
+        try:
+            results = await self.client.ask_batch(
+                [(item.prompt, item.animal) for item in batch]
+            )
+        except KeyError:
+            # The upstream answered with an error body instead of choices.
+            results = {}
+        except Exception as e:
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.batched_items += len(results)
+        fallbacks = []
+        for index, item in enumerate(batch):
+            if item.future.done():
+                continue
+            if index in results:
+                item.future.set_result(results[index])
+            else:
+                fallbacks.append(self._send_one(item))
+        self.fallbacks += len(fallbacks)
+        await asyncio.gather(*fallbacks)
+
+    async def _send_one(self, item: _PendingTranslation) -> None:
+        try:
+            result = await self.client.ask_gpt3(item.prompt, item.animal)
+        except Exception as e:
+            if not item.future.done():
+                item.future.set_exception(e)
+        else:
+            if not item.future.done():
+                item.future.set_result(result)
+
+
+def build_translation_batcher(client: Backend) -> TranslationBatcher | None:
+    """
+    Build the translation batcher configured through environment variables.
+
+    Batching is enabled when TRANSLATION_BATCH_SIZE is greater than 1,
+    TRANSLATION_BATCH_WINDOW_MS sets the time to wait for a batch to fill.
+
+    Args:
+        client (Backend): The backend used for upstream calls.
+
+    Returns:
+        TranslationBatcher | None: The configured batcher, or None if disabled.
+    """
+    settings = get_settings()
+    max_size = settings.get_int("TRANSLATION_BATCH_SIZE", 1)
+    if max_size <= 1:
+        return None
+    window = settings.get_float("TRANSLATION_BATCH_WINDOW_MS", 20) / 1000
+    return TranslationBatcher(client, max_size=max_size, window=window)
@@ -0,0 +1,166 @@
+import asyncio
+import json
+import logging
+from typing import AsyncIterator, Iterable
+
+from pydantic import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.admission import UpstreamError
+from app.crud import Create
+from app.metrics import TRANSLATIONS
+from app.pydantic_models import TranslateInput, TranslateOutput
+from app.registry import LanguageRegistry
+from app.translator import Translator
+
+logger = logging.getLogger(__name__)
+
+# A parsed bulk item, or the error message reported for it.
+BulkItem = TranslateInput | str
+
+
+def parse_bulk_body(body: bytes) -> list[BulkItem]:
+    """
+    Parse the body of a bulk translation request.
+
+    The body is either a JSON array or NDJSON, one `TranslateInput` per line.
+    Items that are not valid translation inputs are kept as error messages,
+    so they can be reported inline.
+
+    Args:
+        body (bytes): The raw request body.
+
+    Returns:
+        list[BulkItem]: The parsed items in request order.
+
+    Raises:
+        ValueError: If the body is neither a JSON array nor NDJSON.
+    """
+    text = body.decode()
+    if text.lstrip().startswith("["):
+        raw_items = json.loads(text)
+    else:
+        raw_items = []
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            try:
+                raw_items.append(json.loads(line))
+            except ValueError:
+                raw_items.append(None)
+
+    items: list[BulkItem] = []
+    for raw_item in raw_items:
+        if not isinstance(raw_item, dict):
+            items.append("Item is not a JSON object")
+            continue
+        try:
+            items.append(TranslateInput(**raw_item))
+        except ValidationError as e:
+            items.append(str(e))
+    return items
+
+
+async def translate_bulk(
+    items: list[BulkItem],
+    translator: Translator,
+    session: AsyncSession,
+    language_registry: LanguageRegistry,
+    concurrency: int,
+    chunk_size: int = 100,
+    dedup: bool = False,
+) -> AsyncIterator[bytes]:
+    """
+    Translate bulk items and stream the results as NDJSON.
+
+    At most `concurrency` translations run at once. Finished translations are
+    persisted with multi-row inserts of up to `chunk_size` rows and reported
+    as soon as they are stored. Each line carries the index of its item,
+    failed items get an "error" field instead of a result.
+
+    Args:
+        items (list[BulkItem]): The parsed items, see `parse_bulk_body`.
+        translator (Translator): The translation pipeline.
+        session (AsyncSession): The async SQLAlchemy session.
+        language_registry (LanguageRegistry): The registry told about the
+            languages registered with the translations.
+        concurrency (int): The maximum number of translations in flight.
+        chunk_size (int): The maximum number of rows per insert.
+        dedup (bool): Whether repeated texts reuse stored rows, see
+            `Create.register_translations`.
+
+    Yields:
+        bytes: One NDJSON line per item, in completion order.
+    """
+    results: asyncio.Queue = asyncio.Queue()
+    pending = iter(enumerate(items))
+
+    async def worker(work: Iterable[tuple[int, BulkItem]]) -> None:
+        for index, item in work:
+            if isinstance(item, str):
+                await results.put((index, None, item))
+                continue
+            try:
+                language, text, source = await translator.translate(
+                    item.text, item.translate_to_language
+                )
+            except (KeyError, UpstreamError):
+                await results.put((index, item, "OpenAI error occured"))
+                continue
+            except Exception:
+                await results.put((index, item, "Translation failed"))
+                continue
+            if len(language) > 30:
+                await results.put((index, item, "Length too big"))
+                continue
+            TRANSLATIONS.labels(source).inc()
+            output = TranslateOutput(
+                id=-1, translated_from=language, text=text, source=source
+            )
+            await results.put((index, item, output))
+
+    workers = [
+        asyncio.create_task(worker(pending))
+        for _ in range(min(concurrency, len(items)))
+    ]
+    create_unit = Create(session)
+    try:
+        received = 0
+        while received < len(items):
+            chunk = [await results.get()]
+            while len(chunk) < chunk_size and not results.empty():
+                chunk.append(results.get_nowait())
+            received += len(chunk)
+
+            done = [
+                (index, item, out)
+                for index, item, out in chunk
+                if isinstance(out, TranslateOutput)
+            ]
+            try:
+                ids = await create_unit.register_translations(
+                    [(item, out) for _, item, out in done], dedup=dedup
+                )
+                stored = dict(zip([index for index, _, _ in done], ids))
+                for _, item, out in done:
+                    language_registry.add(
+                        item.translate_to_language, out.translated_from
+                    )
+            except SQLAlchemyError:
+                logger.exception("Could not store %s bulk translations", len(done))
+                stored = {}
+
+            for index, item, out in chunk:
+                if not isinstance(out, TranslateOutput):
+                    line = {"index": index, "error": out}
+                elif index not in stored:
+                    line = {"index": index, "error": "Could not store translation"}
+                else:
+                    out.id = stored[index]
+                    line = {"index": index, **out.dict()}
+                yield (json.dumps(line, ensure_ascii=False) + "\n").encode()
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
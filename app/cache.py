@@ -0,0 +1,251 @@
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.config import get_settings
+from app.crud import Read
+
+CacheKey = tuple[str, str]
+CachedTranslation = tuple[str, str]
+
+
+def normalize_key(text: str, language: str) -> CacheKey:
+    """
+    Build a cache key for a translation request.
+
+    Whitespace is collapsed and the text is brought to NFC form, the target
+    language is compared case-insensitively.
+
+    Args:
+        text (str): The text to translate.
+        language (str): The language to translate to.
+
+    Returns:
+        CacheKey: The normalized (text, language) pair.
+    """
+    text = unicodedata.normalize("NFC", " ".join(text.split()))
+    return text, language.strip().casefold()
+
+
+class TranslationCache:
+    """
+    Base class for translation caches.
+
+    A cache maps a normalized (text, language) key to the
+    (translated_from, translated_text) pair returned by the translator.
+    """
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: CacheKey) -> CachedTranslation | None:
+        """
+        Get a cached translation.
+
+        Args:
+            key (CacheKey): The normalized key, see `normalize_key`.
+
+        Returns:
+            CachedTranslation | None: The cached translation, or None on a miss.
+        """
+        value = await self._get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: CacheKey, value: CachedTranslation) -> None:
+        """
+        Store a translation in the cache.
+
+        Args:
+            key (CacheKey): The normalized key, see `normalize_key`.
+            value (CachedTranslation): The (translated_from, translated_text) pair.
+        """
+        await self._set(key, value)
+
+    def stats(self) -> dict:
+        """
+        Get cache counters.
+
+        Returns:
+            dict: Hit and miss counters of the cache.
+        """
+        return {"hits": self.hits, "misses": self.misses}
+
+    def close(self) -> None:
+        """Release the resources of the cache."""
+
+    async def _get(self, key: CacheKey) -> CachedTranslation | None:
+        raise NotImplementedError
+
+    async def _set(self, key: CacheKey, value: CachedTranslation) -> None:
+        raise NotImplementedError
+
+
+class LRUTranslationCache(TranslationCache):
+    """In-process cache with bounded size, LRU eviction and a TTL."""
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """
+        Initialize a LRUTranslationCache object.
+
+        Args:
+            maxsize (int): The maximum number of entries kept in the cache.
+            ttl (float): The time in seconds an entry stays valid.
+            clock (Callable[[], float]): The time source, used by tests.
+        """
+        super().__init__()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.evictions = 0
+        self._entries: OrderedDict[
+            CacheKey, tuple[float, CachedTranslation]
+        ] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def _get(self, key: CacheKey) -> CachedTranslation | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= self.clock():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def _set(self, key: CacheKey, value: CachedTranslation) -> None:
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = (self.clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "evictions": self.evictions,
+        }
+
+
+class DatabaseTranslationCache(TranslationCache):
+    """Cache tier backed by the already stored `Translation` rows."""
+
+    def __init__(self, session_maker: async_sessionmaker) -> None:
+        """
+        Initialize a DatabaseTranslationCache object.
+
+        Args:
+            session_maker (async_sessionmaker): The factory for database sessions.
+        """
+        super().__init__()
+        self.session_maker = session_maker
+
+    async def _get(self, key: CacheKey) -> CachedTranslation | None:
+        text, language = key
+        row = await Read(self.session_maker()).find_translation(text, language)
+        if row is None:
+            return None
+        return row.origin_language, row.translated_text
+
+    async def _set(self, key: CacheKey, value: CachedTranslation) -> None:
+        # Rows are written by the create_translation endpoint itself.
+        pass
+
+
+class TieredTranslationCache(TranslationCache):
+    """Cache that looks up several tiers in order and backfills faster ones."""
+
+    def __init__(self, *tiers: TranslationCache) -> None:
+        """
+        Initialize a TieredTranslationCache object.
+
+        Args:
+            *tiers (TranslationCache): The cache tiers, fastest first.
+        """
+        super().__init__()
+        self.tiers = tiers
+
+    async def _get(self, key: CacheKey) -> CachedTranslation | None:
+        for index, tier in enumerate(self.tiers):
+            value = await tier.get(key)
+            if value is not None:
+                for faster_tier in self.tiers[:index]:
+                    await faster_tier.set(key, value)
+                return value
+        return None
+
+    async def _set(self, key: CacheKey, value: CachedTranslation) -> None:
+        for tier in self.tiers:
+            await tier.set(key, value)
+
+    def close(self) -> None:
+        for tier in self.tiers:
+            tier.close()
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "tiers": [
+                {"name": type(tier).__name__, **tier.stats()} for tier in self.tiers
+            ],
+        }
+
+
+def build_translation_cache(session_maker: async_sessionmaker) -> TranslationCache:
+    """
+    Build the translation cache configured through environment variables.
+
+    TRANSLATION_CACHE_SIZE and TRANSLATION_CACHE_TTL configure the in-process
+    tier. TRANSLATION_SHARED_CACHE_PATH adds a tier shared by the workers of
+    the host in that file, TRANSLATION_SHARED_CACHE_BYTES sets its byte budget
+    and TRANSLATION_SHARED_CACHE_SLOT_BYTES the bytes per entry.
+    TRANSLATION_CACHE_DB_TIER=1 adds the `Translation` table as the last tier.
+
+    Args:
+        session_maker (async_sessionmaker): The factory for database sessions.
+
+    Returns:
+        TranslationCache: The configured cache.
+    """
+    from app.shared_cache import SharedTranslationCache
+
+    settings = get_settings()
+
+    ttl = settings.get_float("TRANSLATION_CACHE_TTL", 3600)
+    tiers = [
+        LRUTranslationCache(
+            maxsize=settings.get_int("TRANSLATION_CACHE_SIZE", 1024), ttl=ttl
+        )
+    ]
+    shared_path = settings.get("TRANSLATION_SHARED_CACHE_PATH")
+    if shared_path:
+        tiers.append(
+            SharedTranslationCache(
+                shared_path,
+                size=settings.get_int("TRANSLATION_SHARED_CACHE_BYTES", 64 << 20),
+                slot_size=settings.get_int("TRANSLATION_SHARED_CACHE_SLOT_BYTES", 1024),
+                ttl=ttl,
+            )
+        )
+    if settings.get_flag("TRANSLATION_CACHE_DB_TIER"):
+        tiers.append(DatabaseTranslationCache(session_maker))
+    return TieredTranslationCache(*tiers)
@@ -0,0 +1,138 @@
+"""
+Application settings.
+
+Settings are read from the environment when they are first used, after the
+.env file is loaded. Importing a module has no side effects, a missing
+variable fails the component that needs it when it is built.
+"""
+import os
+from functools import cached_property, lru_cache
+
+from dotenv import load_dotenv
+
+DEFAULT_OPENAI_URL = "https://api.openai.com/v1/chat/completions"
+
+
+class MissingEnvironmentVariable(Exception):
+    pass
+
+
+class Settings:
+    """Lazily resolved settings of the application."""
+
+    def get(self, name: str, default: str | None = None) -> str | None:
+        """
+        Get an optional setting.
+
+        Args:
+            name (str): The environment variable.
+            default (str | None): The value if the variable is not set.
+
+        Returns:
+            str | None: The value of the setting.
+        """
+        return os.environ.get(name, default)
+
+    def get_int(self, name: str, default: int) -> int:
+        """
+        Get an optional integer setting.
+
+        Args:
+            name (str): The environment variable.
+            default (int): The value if the variable is not set.
+
+        Returns:
+            int: The value of the setting.
+        """
+        value = self.get(name)
+        return default if value is None else int(value)
+
+    def get_float(self, name: str, default: float) -> float:
+        """
+        Get an optional number setting.
+
+        Args:
+            name (str): The environment variable.
+            default (float): The value if the variable is not set.
+
+        Returns:
+            float: The value of the setting.
+        """
+        value = self.get(name)
+        return default if value is None else float(value)
+
+    def get_flag(self, name: str, default: bool = False) -> bool:
+        """
+        Get an optional on/off setting, "1" turns it on.
+
+        Args:
+            name (str): The environment variable.
+            default (bool): The value if the variable is not set.
+
+        Returns:
+            bool: The value of the setting.
+        """
+        value = self.get(name)
+        return default if value is None else value == "1"
+
+    def require(self, name: str) -> str:
+        """
+        Get a required setting.
+
+        Args:
+            name (str): The environment variable.
+
+        Raises:
+            MissingEnvironmentVariable: If the variable is not set or empty.
+
+        Returns:
+            str: The value of the setting.
+        """
+        value = os.environ.get(name)
+        if not value:
+            raise MissingEnvironmentVariable(name)
+        return value
+
+    @cached_property
+    def database_url(self) -> str:
+        return self.require("DATABASE_URL")
+
+    @cached_property
+    def database_replica_url(self) -> str | None:
+        return self.get("DATABASE_REPLICA_URL") or None
+
+    @cached_property
+    def api_key(self) -> str:
+        return self.require("API_KEY")
+
+    @cached_property
+    def openai_url(self) -> str:
+        return self.get("OPENAI_URL", DEFAULT_OPENAI_URL)
+
+    @cached_property
+    def share_translation_rows(self) -> bool:
+        # Coalesced callers share one Translation row instead of inserting
+        # their own.
+        return self.get_flag("TRANSLATION_SHARE_ROWS")
+
+    @cached_property
+    def dedup_translations(self) -> bool:
+        # Repeated texts to the same language return the stored row instead
+        # of a new one.
+        return self.get_flag("TRANSLATION_DEDUP")
+
+    @cached_property
+    def bulk_concurrency(self) -> int:
+        return self.get_int("BULK_TRANSLATION_CONCURRENCY", 16)
+
+
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """
+    Get the settings, the .env file is loaded on the first call.
+
+    Returns:
+        Settings: The settings of the application.
+    """
+    load_dotenv()
+    return Settings()
@@ -1,10 +1,45 @@
-from sqlalchemy import delete, select
+from typing import AsyncIterator, NamedTuple
+
+from sqlalchemy import (
+    ColumnElement,
+    Insert,
+    Integer,
+    Row,
+    Select,
+    String,
+    case,
+    column,
+    delete,
+    func,
+    insert,
+    literal_column,
+    or_,
+    select,
+    table,
+    update,
+    values,
+)
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.sql.base import exc
+from sqlalchemy.sql.dml import Update as UpdateStatement
 
-from app.models import Language, Translation
+from app.metrics import STAGE_SECONDS
+from app.models import SEARCH_DOCUMENT, Language, Translation, content_hash
 from app.pydantic_models import LanguageInput, TranslateInput, TranslateOutput
 
+_LANGUAGE_UPSERT = STAGE_SECONDS.labels("language_upsert")
+_TRANSLATION_INSERT = STAGE_SECONDS.labels("translation_insert")
+
+
+class StoredTranslation(NamedTuple):
+    """A translation as stored, with whether an existing row was reused."""
+
+    id: int
+    translated_from: str
+    text: str
+    reused: bool = False
+
 
 class CRUDManager:
     def __init__(self, session: AsyncSession) -> None:
@@ -16,6 +51,20 @@ class CRUDManager:
         """
         self.session = session
 
+    def insert_ignore(self, model: type) -> Insert:
+        """
+        Build an INSERT that skips rows conflicting with existing ones.
+
+        Args:
+            model (type): The mapped class to insert into.
+
+        Returns:
+            Insert: INSERT ... ON CONFLICT DO NOTHING for the session dialect.
+        """
+        if self.session.bind.dialect.name == "postgresql":
+            return postgresql.insert(model).on_conflict_do_nothing()
+        return sqlite.insert(model).on_conflict_do_nothing()
+
 
 class Create(CRUDManager):
     async def register_language(self, language: LanguageInput):
@@ -35,39 +84,193 @@ class Create(CRUDManager):
             self.session.add(language_obj)
 
     async def register_translation(
-        self, inp: TranslateInput, out: TranslateOutput
-    ) -> int:
+        self,
+        inp: TranslateInput,
+        out: TranslateOutput,
+        register_languages=True,
+        dedup=False,
+    ) -> StoredTranslation:
         """
         Register a translation.
 
-        This method is used to register a translation in the database.
+        This method registers both languages, unless they already exist, and
+        the translation in a single transaction.
 
         Args:
             inp (TranslateInput): The input data for translation.
             out (TranslateOutput): The output data for translation.
+            register_languages (bool): Whether to register the languages, False
+                when they are known to exist.
+            dedup (bool): Whether to return the ID of a stored translation of
+                the same text to the same language instead of inserting.
 
         Returns:
-            int: The ID of the registered translation.
+            StoredTranslation: The registered translation, or the stored one
+                with reused set when dedup found it. No language is
+                registered then.
         """
         async with self.session, self.session.begin():
-            language_received = (
-                await self.session.scalars(
-                    select(Language).where(Language.name == out.translated_from)
+            return await self.add_translation(inp, out, register_languages, dedup)
+
+    async def add_translation(
+        self,
+        inp: TranslateInput,
+        out: TranslateOutput,
+        register_languages=True,
+        dedup=False,
+    ) -> StoredTranslation:
+        """
+        Register a translation inside the transaction of the caller.
+
+        Args:
+            inp (TranslateInput): The input data for translation.
+            out (TranslateOutput): The output data for translation.
+            register_languages (bool): Whether to register the languages.
+            dedup (bool): Whether to reuse a stored translation of the same
+                text to the same language, see `register_translation`.
+
+        Returns:
+            StoredTranslation: The registered or reused translation.
+        """
+        if dedup:
+            existing = await self._find_duplicates(
+                {(content_hash(inp.text), inp.translate_to_language.lower())}
+            )
+            if existing:
+                id = existing.popitem()[1]
+                stored = await self.session.execute(
+                    select(
+                        Translation.origin_language, Translation.translated_text
+                    ).where(Translation.id == id)
+                )
+                return StoredTranslation(id, *stored.one(), reused=True)
+        if register_languages:
+            with _LANGUAGE_UPSERT.time():
+                await self._register_languages(
+                    {out.translated_from, inp.translate_to_language}
                 )
-            ).one()
-            language_result = (
-                await self.session.scalars(
-                    select(Language).where(Language.name == inp.translate_to_language)
+        with _TRANSLATION_INSERT.time():
+            id = await self.session.scalar(
+                insert(Translation)
+                .values(
+                    origin_language=out.translated_from,
+                    translated_language=inp.translate_to_language,
+                    text=inp.text,
+                    translated_text=out.text,
                 )
-            ).one()
-            translation = Translation(
-                origin_language=language_received.name,
-                translated_language=language_result.name,
-                text=inp.text,
-                translated_text=out.text,
+                .returning(Translation.id)
             )
-            self.session.add(translation)
-        return translation.id
+        return StoredTranslation(id, out.translated_from, out.text)
+
+    async def register_translations(
+        self,
+        translations: list[tuple[TranslateInput, TranslateOutput]],
+        dedup=False,
+    ) -> list[int]:
+        """
+        Register several translations at once.
+
+        This method registers the missing languages and the translations with
+        multi-row inserts in a single transaction.
+
+        Args:
+            translations (list[tuple[TranslateInput, TranslateOutput]]): The
+                input and output data of every translation.
+            dedup (bool): Whether to reuse the IDs of stored translations of
+                the same text to the same language, and to insert repeated
+                items only once.
+
+        Returns:
+            list[int]: The IDs of the registered translations, in input order.
+        """
+        if not translations:
+            return []
+        rows = [
+            {
+                "origin_language": out.translated_from,
+                "translated_language": inp.translate_to_language,
+                "text": inp.text,
+                "translated_text": out.text,
+                "content_hash": content_hash(inp.text),
+            }
+            for inp, out in translations
+        ]
+        async with self.session, self.session.begin():
+            return await self.add_translation_rows(rows, dedup)
+
+    async def add_translation_rows(self, rows: list[dict], dedup=False) -> list[int]:
+        """
+        Register translation rows inside the transaction of the caller.
+
+        The languages of the rows are registered first, then the rows with
+        one multi-row insert.
+
+        Args:
+            rows (list[dict]): The column values of every translation,
+                content_hash included.
+            dedup (bool): Whether to reuse stored translations, see
+                `register_translations`.
+
+        Returns:
+            list[int]: The IDs of the registered translations, in row order.
+        """
+        if not rows:
+            return []
+        languages = {row["origin_language"] for row in rows} | {
+            row["translated_language"] for row in rows
+        }
+        keys = [
+            (row["content_hash"], row["translated_language"].lower()) for row in rows
+        ]
+        # With dedup, items with the same key share one row.
+        slots = keys if dedup else range(len(keys))
+        new_rows = {}
+        for slot, row in zip(slots, rows):
+            new_rows.setdefault(slot, row)
+        ids = await self._find_duplicates(set(keys)) if dedup else {}
+        for key in ids:
+            del new_rows[key]
+        with _LANGUAGE_UPSERT.time():
+            await self._register_languages(languages)
+        if new_rows:
+            with _TRANSLATION_INSERT.time():
+                inserted = await self.session.scalars(
+                    insert(Translation).returning(
+                        Translation.id, sort_by_parameter_order=True
+                    ),
+                    list(new_rows.values()),
+                )
+            ids.update(zip(new_rows, inserted))
+        return [ids[slot] for slot in slots]
+
+    async def _find_duplicates(
+        self, keys: set[tuple[str, str]]
+    ) -> dict[tuple[str, str], int]:
+        # The newest stored translation of every (content_hash, lowercased
+        # language) key, looked up through
+        # ix_translation_content_hash_lower_language.
+        # Languages compare case-insensitively, as in Read.find_translation.
+        language = func.lower(Translation.translated_language)
+        stmt = (
+            select(Translation.content_hash, language, func.max(Translation.id))
+            .where(Translation.content_hash.in_({hash for hash, _ in keys}))
+            .group_by(Translation.content_hash, language)
+        )
+        rows = await self.session.execute(stmt)
+        return {
+            (hash, language): id
+            for hash, language, id in rows
+            if (hash, language) in keys
+        }
+
+    async def _register_languages(self, names: set[str]) -> None:
+        # One multi-row INSERT ... ON CONFLICT DO NOTHING, run inside the
+        # transaction of the caller.
+        await self.session.execute(
+            self.insert_ignore(Language).values(
+                [{"name": name} for name in sorted(names)]
+            )
+        )
 
 
 class Read(CRUDManager):
@@ -86,6 +289,25 @@ class Read(CRUDManager):
         async with self.session, self.session.begin():
             return await self.session.get(Language, name)
 
+    async def count_language_translations(self, name: str) -> int:
+        """
+        Count the translations from or to a language.
+
+        Args:
+            name (str): The name of the language.
+
+        Returns:
+            int: The number of translations, locked rows included.
+        """
+        stmt = select(func.count()).where(
+            or_(
+                Translation.origin_language == name,
+                Translation.translated_language == name,
+            )
+        )
+        async with self.session, self.session.begin():
+            return await self.session.scalar(stmt)
+
     async def get_all_languages(self):
         """
         Get all languages.
@@ -99,6 +321,19 @@ class Read(CRUDManager):
         async with self.session, self.session.begin():
             return (await self.session.scalars(stmt)).all()
 
+    async def get_all_language_names(self) -> list[str]:
+        """
+        Get the names of all languages.
+
+        This method retrieves only the language names, without loading objects.
+
+        Returns:
+            list[str]: The names of all languages.
+        """
+        stmt = select(Language.name)
+        async with self.session, self.session.begin():
+            return list(await self.session.scalars(stmt))
+
     async def get_all_translations(self):
         """
         Get all translations.
@@ -112,6 +347,161 @@ class Read(CRUDManager):
         async with self.session, self.session.begin():
             return (await self.session.scalars(stmt)).all()
 
+    async def get_translations_page(
+        self,
+        limit: int,
+        after_id: int | None = None,
+        origin_language: str | None = None,
+        translated_language: str | None = None,
+    ) -> list[Row]:
+        """
+        Get a page of translations.
+
+        This method uses keyset pagination: the page starts right after the
+        translation with ID `after_id`, so the cost does not grow with the
+        position of the page.
+
+        Args:
+            limit (int): The maximum number of translations in the page.
+            after_id (int | None): The ID of the last translation of the
+                previous page, or None for the first page.
+            origin_language (str | None): Only translations from this language.
+            translated_language (str | None): Only translations to this language.
+
+        Returns:
+            list[Row]: The translation rows, ordered by ID.
+        """
+        stmt = self._translations_query(
+            after_id, origin_language, translated_language
+        ).limit(limit)
+        async with self.session, self.session.begin():
+            return list(await self.session.execute(stmt))
+
+    async def stream_translations(
+        self,
+        after_id: int | None = None,
+        origin_language: str | None = None,
+        translated_language: str | None = None,
+        batch_size: int = 1000,
+    ) -> AsyncIterator[Row]:
+        """
+        Stream translations through a server-side cursor.
+
+        This method fetches `batch_size` rows at a time, so memory usage does
+        not depend on the number of matching translations.
+
+        Args:
+            after_id (int | None): Only translations with a greater ID.
+            origin_language (str | None): Only translations from this language.
+            translated_language (str | None): Only translations to this language.
+            batch_size (int): The number of rows fetched per round trip.
+
+        Yields:
+            Row: The translation rows, ordered by ID.
+        """
+        stmt = self._translations_query(
+            after_id, origin_language, translated_language
+        ).execution_options(yield_per=batch_size)
+        async with self.session, self.session.begin():
+            async for row in await self.session.stream(stmt):
+                yield row
+
+    def _translations_query(
+        self,
+        after_id: int | None,
+        origin_language: str | None,
+        translated_language: str | None,
+    ) -> Select:
+        stmt = select(
+            Translation.id,
+            Translation.origin_language,
+            Translation.translated_language,
+            Translation.text,
+            Translation.translated_text,
+        ).order_by(Translation.id)
+        if after_id is not None:
+            stmt = stmt.where(Translation.id > after_id)
+        if origin_language is not None:
+            stmt = stmt.where(Translation.origin_language == origin_language)
+        if translated_language is not None:
+            stmt = stmt.where(Translation.translated_language == translated_language)
+        return stmt
+
+    async def search_translations(
+        self,
+        query: str,
+        limit: int,
+        offset: int = 0,
+        origin_language: str | None = None,
+        translated_language: str | None = None,
+    ) -> list[Row]:
+        """
+        Search translations by their original and translated text.
+
+        On PostgreSQL this method matches the words of the query against the
+        full-text index and tolerates typos through the trigram indexes, the
+        rank is the better of both scores. Other databases match the words
+        against the FTS5 table and rank with bm25.
+
+        Args:
+            query (str): The words to look for.
+            limit (int): The maximum number of translations in the page.
+            offset (int): The number of best matches to skip.
+            origin_language (str | None): Only translations from this language.
+            translated_language (str | None): Only translations to this language.
+
+        Returns:
+            list[Row]: The translation rows with a rank, best matches first.
+        """
+        if not query.split():
+            return []
+        if self.session.bind.dialect.name == "postgresql":
+            stmt, rank = self._postgresql_search(query)
+        else:
+            stmt, rank = self._sqlite_search(query)
+        if origin_language is not None:
+            stmt = stmt.where(Translation.origin_language == origin_language)
+        if translated_language is not None:
+            stmt = stmt.where(Translation.translated_language == translated_language)
+        stmt = stmt.order_by(None).order_by(rank.desc(), Translation.id)
+        async with self.session, self.session.begin():
+            return list(await self.session.execute(stmt.limit(limit).offset(offset)))
+
+    def _postgresql_search(self, query: str) -> tuple[Select, ColumnElement]:
+        document = literal_column(SEARCH_DOCUMENT)
+        tsquery = func.plainto_tsquery("simple", query)
+        rank = func.greatest(
+            func.ts_rank(document, tsquery),
+            func.similarity(Translation.text, query),
+            func.similarity(Translation.translated_text, query),
+        )
+        stmt = (
+            self._translations_query(None, None, None)
+            .add_columns(rank.label("rank"))
+            .where(
+                or_(
+                    document.op("@@")(tsquery),
+                    Translation.text.op("%")(query),
+                    Translation.translated_text.op("%")(query),
+                )
+            )
+        )
+        return stmt, rank
+
+    def _sqlite_search(self, query: str) -> tuple[Select, ColumnElement]:
+        fts = table("translation_fts", column("rowid"))
+        # Every word is quoted, so FTS5 operators in the query match literally.
+        words = " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+        match = literal_column("translation_fts")
+        rank = -func.bm25(match)
+        stmt = (
+            self._translations_query(None, None, None)
+            .add_columns(rank.label("rank"))
+            .join(fts, fts.c.rowid == Translation.id)
+            .where(match.op("MATCH")(words))
+        )
+        return stmt, rank
+
     async def get_translation(self, id: int) -> Translation | None:
         """
         Get a translation by ID.
@@ -127,6 +517,61 @@ class Read(CRUDManager):
         async with self.session, self.session.begin():
             return await self.session.get(Translation, id)
 
+    async def get_translation_row(self, id: int) -> Row | None:
+        """
+        Get the public columns of a translation by ID.
+
+        Unlike `get_translation` this method loads no ORM object, the row
+        holds the columns of a translation page.
+
+        Args:
+            id (int): The ID of the translation.
+
+        Returns:
+            Row | None: The translation row, or None if not found.
+        """
+        stmt = self._translations_query(None, None, None).where(Translation.id == id)
+        async with self.session, self.session.begin():
+            return (await self.session.execute(stmt)).first()
+
+    async def get_last_translation_id(self) -> int | None:
+        """
+        Get the greatest translation ID.
+
+        Returns:
+            int | None: The ID, or None if there are no translations.
+        """
+        async with self.session, self.session.begin():
+            return await self.session.scalar(select(func.max(Translation.id)))
+
+    async def find_translation(self, text: str, language: str) -> Row | None:
+        """
+        Find the latest stored translation of a text.
+
+        This method looks for a translation of the given text to the given
+        language by content hash, so the text is compared after whitespace
+        normalization and the language case-insensitively.
+
+        Args:
+            text (str): The original text.
+            language (str): The language the text was translated to.
+
+        Returns:
+            Row | None: The origin_language and translated_text of the newest
+                matching translation, or None if not found.
+        """
+        stmt = (
+            select(Translation.origin_language, Translation.translated_text)
+            .where(
+                Translation.content_hash == content_hash(text),
+                func.lower(Translation.translated_language) == language.lower(),
+            )
+            .order_by(Translation.id.desc())
+            .limit(1)
+        )
+        async with self.session, self.session.begin():
+            return (await self.session.execute(stmt)).one_or_none()
+
 
 class Update(CRUDManager):
     async def update_translation(self, id: int, new_translation: str):
@@ -139,15 +584,54 @@ class Update(CRUDManager):
             id (int): The ID of the translation to update.
             new_translation (str): The new translation text.
 
+        Raises:
+            NoResultFound: If the translation does not exist.
+
         Returns:
             None
         """
-        async with self.session, self.session.begin():
-            translation = await self.session.get(Translation, id)
-            if not translation:
-                raise exc.NoResultFound
+        if not await self.update_translations({id: new_translation}):
+            raise exc.NoResultFound
+
+    async def update_translations(self, new_translations: dict[int, str]) -> list[int]:
+        """
+        Update the translated text of several translations.
+
+        This method runs a single UPDATE ... RETURNING statement, the IDs
+        missing from the result do not exist.
 
-            translation.translated_text = new_translation
+        Args:
+            new_translations (dict[int, str]): The new translated text by
+                translation ID.
+
+        Returns:
+            list[int]: The IDs of the updated translations.
+        """
+        if not new_translations:
+            return []
+        stmt = self._update_translated_texts(new_translations).returning(Translation.id)
+        async with self.session, self.session.begin():
+            return list(await self.session.scalars(stmt))
+
+    def _update_translated_texts(
+        self, new_translations: dict[int, str]
+    ) -> UpdateStatement:
+        if self.session.bind.dialect.name == "postgresql":
+            # UPDATE ... FROM (VALUES ...) joins the new texts by id.
+            new = values(
+                column("id", Integer), column("translated_text", String), name="new"
+            ).data(list(new_translations.items()))
+            return (
+                update(Translation)
+                .where(Translation.id == new.c.id)
+                .values(translated_text=new.c.translated_text)
+            )
+        # SQLite names the columns of VALUES itself, a CASE picks the texts.
+        return (
+            update(Translation)
+            .where(Translation.id.in_(list(new_translations)))
+            .values(translated_text=case(new_translations, value=Translation.id))
+        )
 
 
 class Delete(CRUDManager):
@@ -155,17 +639,73 @@ class Delete(CRUDManager):
         """
         Delete a language.
 
-        This method is used to delete a language from the database.
+        This method is used to delete a language from the database. The
+        database deletes the translations from and to the language in the same
+        statement, see app/purge.py for languages with many translations.
 
         Args:
             name (str): The name of the language to delete.
 
         Returns:
-            int | None: The ID of the deleted language, or None if not found.
+            str | None: The name of the deleted language, or None if not found.
+        """
+        deleted = await self.delete_languages([name])
+        return deleted[0] if deleted else None
+
+    async def delete_languages(self, names: list[str]) -> list[str]:
         """
-        stmt = delete(Language).where(Language.name == name)
+        Delete several languages.
+
+        This method runs a single DELETE ... RETURNING statement, the names
+        missing from the result do not exist. The database deletes the
+        translations from and to the languages in the same statement.
+
+        Args:
+            names (list[str]): The names of the languages to delete.
+
+        Returns:
+            list[str]: The names of the deleted languages.
+        """
+        if not names:
+            return []
+        stmt = delete(Language).where(Language.name.in_(names)).returning(Language.name)
         async with self.session, self.session.begin():
-            await self.session.execute(stmt)
+            return list(await self.session.scalars(stmt))
+
+    async def delete_language_translations(self, name: str, batch_size: int) -> int:
+        """
+        Delete a batch of the translations from or to a language.
+
+        This method deletes at most `batch_size` rows in a short transaction,
+        so it holds few row locks and concurrent writes do not wait long.
+        Rows locked by other transactions are skipped on PostgreSQL.
+
+        Args:
+            name (str): The name of the language.
+            batch_size (int): The maximum number of translations to delete.
+
+        Returns:
+            int: The number of deleted translations.
+        """
+        ids = (
+            select(Translation.id)
+            .where(
+                or_(
+                    Translation.origin_language == name,
+                    Translation.translated_language == name,
+                )
+            )
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        async with self.session, self.session.begin():
+            batch = list(await self.session.scalars(ids))
+            if not batch:
+                return 0
+            result = await self.session.execute(
+                delete(Translation).where(Translation.id.in_(batch))
+            )
+            return result.rowcount
 
     async def delete_translation(self, id: int):
         """
@@ -179,6 +719,26 @@ class Delete(CRUDManager):
         Returns:
             int | None: The ID of the deleted translation, or None if not found.
         """
-        stmt = delete(Translation).where(Translation.id == id).returning(Translation.id)
+        deleted = await self.delete_translations([id])
+        return deleted[0] if deleted else None
+
+    async def delete_translations(self, ids: list[int]) -> list[int]:
+        """
+        Delete several translations.
+
+        This method runs a single DELETE ... RETURNING statement, the IDs
+        missing from the result do not exist.
+
+        Args:
+            ids (list[int]): The IDs of the translations to delete.
+
+        Returns:
+            list[int]: The IDs of the deleted translations.
+        """
+        if not ids:
+            return []
+        stmt = (
+            delete(Translation).where(Translation.id.in_(ids)).returning(Translation.id)
+        )
         async with self.session, self.session.begin():
-            return (await self.session.scalars(stmt)).one_or_none()
+            return list(await self.session.scalars(stmt))
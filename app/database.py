@@ -1,25 +1,172 @@
-import os
+from functools import cached_property, lru_cache
 
-from dotenv import load_dotenv
+from sqlalchemy import event, make_url
 from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
+from app.config import Settings, get_settings
+from app.metrics import POOL_CHECKOUT_SECONDS, REGISTRY
 from app.models import Base
 
 
-class MissingEnvironmentVariable(Exception):
-    pass
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Connection pool that observes how long checkouts wait."""
+
+    checkout_timer = POOL_CHECKOUT_SECONDS.labels("primary")
+
+    def _do_get(self):
+        with self.checkout_timer.time():
+            return super()._do_get()
+
+
+# Engines by name, their pools are read by the saturation gauges.
+engines: dict[str, AsyncEngine] = {}
+
+
+def _pool_values(method: str) -> dict[tuple[str, ...], float]:
+    return {
+        (name,): getattr(engine.pool, method)()
+        for name, engine in engines.items()
+        if isinstance(engine.pool, AsyncAdaptedQueuePool)
+    }
+
+
+REGISTRY.gauge(
+    "db_pool_size",
+    "Size of the database pool",
+    lambda: _pool_values("size"),
+    labels=("engine",),
+)
+REGISTRY.gauge(
+    "db_pool_checked_out",
+    "Connections checked out of the pool",
+    lambda: _pool_values("checkedout"),
+    labels=("engine",),
+)
+REGISTRY.gauge(
+    "db_pool_overflow",
+    "Connections opened above the pool size",
+    lambda: _pool_values("overflow"),
+    labels=("engine",),
+)
+
+
+def _enable_foreign_keys(dbapi_connection, _) -> None:
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+def enable_sqlite_foreign_keys(engine: AsyncEngine) -> None:
+    """
+    Enforce foreign keys, and their ON DELETE rules, on SQLite connections.
+
+    SQLite ignores foreign keys unless every connection turns them on.
+
+    Args:
+        engine (AsyncEngine): The engine, other databases are left alone.
+    """
+    if engine.dialect.name == "sqlite":
+        event.listen(engine.sync_engine, "connect", _enable_foreign_keys)
+
+
+def build_engine(url: str, name: str, prefix: str, **options) -> AsyncEngine:
+    """
+    Build an engine with pool settings read from environment variables.
+
+    {prefix}_POOL_SIZE, {prefix}_MAX_OVERFLOW, {prefix}_POOL_TIMEOUT and
+    {prefix}_POOL_RECYCLE configure the pool. SQLite uses a static pool in
+    memory and no pool for files, so the settings do not apply to it.
+
+    Args:
+        url (str): The database URL.
+        name (str): The engine name used in metrics, e.g. "primary".
+        prefix (str): The prefix of the environment variables.
+        **options: Further options for `create_async_engine`.
+
+    Returns:
+        AsyncEngine: The engine.
+    """
+    settings = get_settings()
+    if make_url(url).get_backend_name() != "sqlite":
+        options.update(
+            poolclass=type(
+                "InstrumentedQueuePool",
+                (InstrumentedQueuePool,),
+                {"checkout_timer": POOL_CHECKOUT_SECONDS.labels(name)},
+            ),
+            pool_size=settings.get_int(f"{prefix}_POOL_SIZE", 5),
+            max_overflow=settings.get_int(f"{prefix}_MAX_OVERFLOW", 10),
+            pool_timeout=settings.get_float(f"{prefix}_POOL_TIMEOUT", 30),
+            pool_recycle=settings.get_int(f"{prefix}_POOL_RECYCLE", -1),
+        )
+    engine = create_async_engine(
+        url, echo=settings.get_flag("DATABASE_ECHO"), **options
+    )
+    enable_sqlite_foreign_keys(engine)
+    engines[name] = engine
+    return engine
 
 
 async def init_models(engine: AsyncEngine):
+    """Create all tables from the models, used by tests. See app/migrations.py."""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
 
 
-load_dotenv()
-DATABASE_URL = os.environ.get("DATABASE_URL")
+class Database:
+    """
+    Engines and session factories, built when they are first used.
+
+    Read-only queries go to the replica when DATABASE_REPLICA_URL is set,
+    otherwise the read engine and session factory are the primary ones.
+    """
+
+    def __init__(self, settings: Settings) -> None:
+        """
+        Initialize a Database object.
+
+        Args:
+            settings (Settings): The settings with the database URLs.
+        """
+        self.settings = settings
+
+    @cached_property
+    def engine(self) -> AsyncEngine:
+        return build_engine(self.settings.database_url, "primary", "DATABASE")
+
+    @cached_property
+    def maker(self) -> async_sessionmaker:
+        return async_sessionmaker(self.engine, expire_on_commit=False)
+
+    @cached_property
+    def read_engine(self) -> AsyncEngine | None:
+        url = self.settings.database_replica_url
+        if not url:
+            return None
+        return build_engine(url, "replica", "DATABASE_REPLICA", pool_pre_ping=True)
+
+    @cached_property
+    def read_maker(self) -> async_sessionmaker:
+        if self.read_engine is None:
+            return self.maker
+        return async_sessionmaker(self.read_engine, expire_on_commit=False)
+
+    async def dispose(self) -> None:
+        """Close the connections of the engines built so far."""
+        for name in ("engine", "read_engine"):
+            # Engines not built yet are not built for disposal.
+            engine = self.__dict__.get(name)
+            if engine is not None:
+                await engine.dispose()
+
 
-if not DATABASE_URL:
-    raise MissingEnvironmentVariable
+@lru_cache(maxsize=None)
+def get_database() -> Database:
+    """
+    Get the database of the application.
 
-engine = create_async_engine(DATABASE_URL, echo=True)
-maker = async_sessionmaker(engine, expire_on_commit=False)
+    Returns:
+        Database: The database configured by the settings.
+    """
+    return Database(get_settings())
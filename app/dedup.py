@@ -0,0 +1,156 @@
+"""
+Backfill of content hashes and collapse of duplicate translations.
+
+Rows stored before the content_hash column existed have no hash, `backfill`
+computes it in batches. `collapse` then keeps the newest row of every
+(content_hash, translated_language) group, points translation jobs at it and
+deletes the other rows. Languages compare case-insensitively, as in the
+request path. Every batch is its own transaction, so both commands
+can run next to the application and be interrupted at any time.
+
+Usage:
+    python -m app.dedup backfill
+    python -m app.dedup collapse --batch-size 500
+    python -m app.dedup all
+"""
+import argparse
+import asyncio
+import logging
+import sys
+
+from sqlalchemy import delete, func, select, tuple_, update
+
+from app.crud import CRUDManager
+from app.models import Translation, TranslationJob, content_hash
+
+logger = logging.getLogger(__name__)
+
+
+class Deduplicator(CRUDManager):
+    async def backfill(self, batch_size: int = 1000) -> int:
+        """
+        Compute the missing content hashes.
+
+        This method walks the rows without a hash in id order and updates
+        `batch_size` of them per transaction.
+
+        Args:
+            batch_size (int): The number of rows per batch.
+
+        Returns:
+            int: The number of updated rows.
+        """
+        total = 0
+        last_id = 0
+        async with self.session:
+            while True:
+                async with self.session.begin():
+                    rows = (
+                        await self.session.execute(
+                            select(Translation.id, Translation.text)
+                            .where(
+                                Translation.content_hash.is_(None),
+                                Translation.id > last_id,
+                            )
+                            .order_by(Translation.id)
+                            .limit(batch_size)
+                        )
+                    ).all()
+                    if not rows:
+                        break
+                    await self.session.execute(
+                        update(Translation),
+                        [
+                            {"id": row.id, "content_hash": content_hash(row.text)}
+                            for row in rows
+                        ],
+                    )
+                last_id = rows[-1].id
+                total += len(rows)
+                logger.info("Backfilled %s content hashes", total)
+        return total
+
+    async def collapse(self, batch_size: int = 500) -> int:
+        """
+        Delete duplicate translations.
+
+        This method walks the (content_hash, translated_language) groups with
+        more than one row in index order, `batch_size` groups per
+        transaction. The newest row of a group is kept, translation jobs of
+        the other rows are moved to it.
+
+        Args:
+            batch_size (int): The number of duplicate groups per batch.
+
+        Returns:
+            int: The number of deleted rows.
+        """
+        language = func.lower(Translation.translated_language)
+        key = tuple_(Translation.content_hash, language)
+        total = 0
+        last_key = None
+        async with self.session:
+            while True:
+                stmt = (
+                    select(
+                        Translation.content_hash,
+                        language.label("language"),
+                        func.max(Translation.id).label("keep"),
+                    )
+                    .where(Translation.content_hash.is_not(None))
+                    .group_by(Translation.content_hash, language)
+                    .having(func.count() > 1)
+                    .order_by(Translation.content_hash, language)
+                    .limit(batch_size)
+                )
+                if last_key is not None:
+                    stmt = stmt.where(key > tuple_(*last_key))
+                async with self.session.begin():
+                    groups = (await self.session.execute(stmt)).all()
+                    if not groups:
+                        break
+                    for group in groups:
+                        total += await self._collapse_group(group)
+                last_key = (groups[-1].content_hash, groups[-1].language)
+                logger.info("Deleted %s duplicate translations", total)
+        return total
+
+    async def _collapse_group(self, group) -> int:
+        duplicates = select(Translation.id).where(
+            Translation.content_hash == group.content_hash,
+            func.lower(Translation.translated_language) == group.language,
+            Translation.id != group.keep,
+        )
+        await self.session.execute(
+            update(TranslationJob)
+            .where(TranslationJob.translation_id.in_(duplicates))
+            .values(translation_id=group.keep)
+        )
+        result = await self.session.execute(
+            delete(Translation).where(Translation.id.in_(duplicates))
+        )
+        return result.rowcount
+
+
+async def main(args: argparse.Namespace) -> None:
+    from app.database import get_database
+
+    database = get_database()
+    try:
+        if args.command in ("backfill", "all"):
+            count = await Deduplicator(database.maker()).backfill(args.batch_size)
+            print(f"Backfilled {count} content hashes", file=sys.stderr)
+        if args.command in ("collapse", "all"):
+            count = await Deduplicator(database.maker()).collapse(args.batch_size)
+            print(f"Deleted {count} duplicate translations", file=sys.stderr)
+    finally:
+        await database.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("command", choices=("backfill", "collapse", "all"))
+    parser.add_argument("--batch-size", type=int, default=1000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,455 @@
+"""
+Durable queue of translation jobs.
+
+Jobs are rows of the translation_job table, so they survive a restart of the
+process. Workers claim pending jobs with SELECT ... FOR UPDATE SKIP LOCKED and
+hold them for a lease; a job whose worker died is claimed again once its lease
+expires. Failed attempts are retried with an exponential backoff until
+`max_attempts` is reached. The result is stored in the translation table in
+the same transaction that marks the job done.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import Row, and_, insert, or_, select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.admission import UpstreamError
+from app.config import get_settings
+from app.crud import Create, CRUDManager, StoredTranslation
+from app.metrics import TRANSLATIONS
+from app.models import Translation, TranslationJob
+from app.pydantic_models import TranslateInput, TranslateOutput
+from app.registry import LanguageRegistry
+from app.translator import Translator
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class Jobs(CRUDManager):
+    async def enqueue(self, inp: TranslateInput) -> int:
+        """
+        Add a translation job.
+
+        Args:
+            inp (TranslateInput): The text and the language to translate to.
+
+        Returns:
+            int: The ID of the job.
+        """
+        async with self.session, self.session.begin():
+            return await self.session.scalar(
+                insert(TranslationJob)
+                .values(text=inp.text, translate_to_language=inp.translate_to_language)
+                .returning(TranslationJob.id)
+            )
+
+    async def get(self, id: int) -> Row | None:
+        """
+        Get a job with its translation.
+
+        Args:
+            id (int): The ID of the job.
+
+        Returns:
+            Row | None: The job columns and the origin_language and
+                translated_text of its translation, or None if not found.
+        """
+        stmt = (
+            select(
+                TranslationJob.id,
+                TranslationJob.status,
+                TranslationJob.attempts,
+                TranslationJob.error,
+                TranslationJob.translation_id,
+                Translation.origin_language,
+                Translation.translated_text,
+            )
+            .outerjoin(Translation, Translation.id == TranslationJob.translation_id)
+            .where(TranslationJob.id == id)
+        )
+        async with self.session, self.session.begin():
+            return (await self.session.execute(stmt)).one_or_none()
+
+    async def claim(self, limit: int, lease: float) -> list[Row]:
+        """
+        Claim jobs for processing.
+
+        This method locks available jobs with FOR UPDATE SKIP LOCKED, so
+        concurrent workers claim different jobs without waiting on each other,
+        and marks them running until the lease expires.
+
+        Args:
+            limit (int): The maximum number of jobs to claim.
+            lease (float): The time in seconds the jobs are held.
+
+        Returns:
+            list[Row]: The id, text, translate_to_language and attempts of
+                the claimed jobs.
+        """
+        now = datetime.utcnow()
+        available = or_(
+            and_(TranslationJob.status == PENDING, TranslationJob.available_at <= now),
+            and_(TranslationJob.status == RUNNING, TranslationJob.locked_until < now),
+        )
+        candidates = (
+            select(TranslationJob.id)
+            .where(available)
+            .order_by(TranslationJob.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        async with self.session, self.session.begin():
+            ids = list(await self.session.scalars(candidates))
+            if not ids:
+                return []
+            # The condition is checked again, so databases without row locks
+            # cannot hand one job to two workers.
+            result = await self.session.execute(
+                update(TranslationJob)
+                .where(TranslationJob.id.in_(ids), available)
+                .values(
+                    status=RUNNING,
+                    attempts=TranslationJob.attempts + 1,
+                    locked_until=now + timedelta(seconds=lease),
+                    last_updated=now,
+                )
+                .returning(
+                    TranslationJob.id,
+                    TranslationJob.text,
+                    TranslationJob.translate_to_language,
+                    TranslationJob.attempts,
+                )
+            )
+            return sorted(result, key=lambda row: row.id)
+
+    async def complete(
+        self,
+        id: int,
+        attempt: int,
+        translated_from: str,
+        translated_text: str,
+        dedup: bool = False,
+    ) -> StoredTranslation | None:
+        """
+        Store the result of a job.
+
+        This method registers the languages and the translation and marks the
+        job done in a single transaction.
+
+        Args:
+            id (int): The ID of the job.
+            attempt (int): The attempt the result belongs to.
+            translated_from (str): The detected source language.
+            translated_text (str): The translated text.
+            dedup (bool): Whether to reuse a stored translation of the same
+                text to the same language, see `Create.register_translation`.
+
+        Returns:
+            StoredTranslation | None: The registered or reused translation, or
+                None if the lease of the attempt expired and the job was
+                claimed again.
+        """
+        async with self.session, self.session.begin():
+            job = await self.session.get(TranslationJob, id, with_for_update=True)
+            if job.status != RUNNING or job.attempts != attempt:
+                return None
+            stored = await Create(self.session).add_translation(
+                TranslateInput(
+                    text=job.text, translate_to_language=job.translate_to_language
+                ),
+                TranslateOutput(
+                    id=-1, translated_from=translated_from, text=translated_text
+                ),
+                dedup=dedup,
+            )
+            job.status = DONE
+            job.error = None
+            job.translation_id = stored.id
+            job.locked_until = None
+            job.last_updated = datetime.utcnow()
+            return stored
+
+    async def fail(
+        self, id: int, attempt: int, error: str, retry_in: float | None
+    ) -> None:
+        """
+        Record a failed attempt of a job.
+
+        Args:
+            id (int): The ID of the job.
+            attempt (int): The failed attempt, ignored if the job was
+                claimed again since.
+            error (str): The error message.
+            retry_in (float | None): The time in seconds until the next
+                attempt, or None to fail the job for good.
+        """
+        now = datetime.utcnow()
+        values = {"error": error[:255], "locked_until": None, "last_updated": now}
+        if retry_in is None:
+            values["status"] = FAILED
+        else:
+            values["status"] = PENDING
+            values["available_at"] = now + timedelta(seconds=retry_in)
+        async with self.session, self.session.begin():
+            await self.session.execute(
+                update(TranslationJob)
+                .where(
+                    TranslationJob.id == id,
+                    TranslationJob.status == RUNNING,
+                    TranslationJob.attempts == attempt,
+                )
+                .values(values)
+            )
+
+
+class JobWorker:
+    """
+    Pool of in-process workers processing translation jobs.
+
+    Every worker claims one job at a time. Workers sleep for `poll_interval`
+    seconds when no job is available, jobs enqueued by this process wake them
+    right away.
+    """
+
+    def __init__(
+        self,
+        session_maker: async_sessionmaker,
+        translator: Translator,
+        language_registry: LanguageRegistry | None = None,
+        concurrency: int = 4,
+        poll_interval: float = 1.0,
+        lease: float = 60.0,
+        max_attempts: int = 5,
+        retry_backoff: float = 1.0,
+        dedup: bool = False,
+    ) -> None:
+        """
+        Initialize a JobWorker object.
+
+        Args:
+            session_maker (async_sessionmaker): The factory for database sessions.
+            translator (Translator): The translation pipeline.
+            language_registry (LanguageRegistry | None): The registry told about
+                languages registered with the translations.
+            concurrency (int): The number of jobs processed at the same time,
+                0 only enqueues jobs for other processes.
+            poll_interval (float): The time in seconds between polls for jobs.
+            lease (float): The time in seconds a claimed job is held.
+            max_attempts (int): The number of attempts before a job fails.
+            retry_backoff (float): The delay in seconds before the first retry,
+                doubled for every further attempt.
+            dedup (bool): Whether results reuse stored translations of the
+                same text to the same language.
+        """
+        self.session_maker = session_maker
+        self.translator = translator
+        self.language_registry = language_registry
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.dedup = dedup
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+        self._wakeup = asyncio.Event()
+        self._finished = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    async def __aenter__(self) -> "JobWorker":
+        self.start()
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        await self.close()
+
+    def start(self) -> None:
+        """Start the workers."""
+        self._tasks = [
+            asyncio.create_task(self._run()) for _ in range(self.concurrency)
+        ]
+
+    async def close(self) -> None:
+        """
+        Stop the workers.
+
+        Jobs in progress are abandoned and claimed again once their lease
+        expires.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def enqueue(self, inp: TranslateInput) -> int:
+        """
+        Add a translation job and wake a worker.
+
+        Args:
+            inp (TranslateInput): The text and the language to translate to.
+
+        Returns:
+            int: The ID of the job.
+        """
+        job_id = await Jobs(self.session_maker()).enqueue(inp)
+        self._wakeup.set()
+        return job_id
+
+    async def wait(self, id: int, timeout: float) -> Row | None:
+        """
+        Wait until a job is done or failed.
+
+        Jobs finished by this process are noticed right away, jobs of other
+        processes when the job is read again after `poll_interval` seconds.
+
+        Args:
+            id (int): The ID of the job.
+            timeout (float): The maximum time in seconds to wait.
+
+        Returns:
+            Row | None: The job as returned by `Jobs.get`, or None if not found.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            finished = self._finished
+            job = await Jobs(self.session_maker()).get(id)
+            remaining = deadline - time.monotonic()
+            if job is None or job.status in (DONE, FAILED) or remaining <= 0:
+                return job
+            try:
+                await asyncio.wait_for(
+                    finished.wait(), min(remaining, self.poll_interval)
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> dict:
+        """
+        Get job counters.
+
+        Returns:
+            dict: The number of completed, retried and failed jobs.
+        """
+        return {
+            "workers": len(self._tasks),
+            "completed": self.completed,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                jobs = await Jobs(self.session_maker()).claim(1, self.lease)
+            except Exception:
+                logger.exception("Could not claim translation jobs")
+                jobs = []
+            if not jobs:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            for job in jobs:
+                await self._process(job)
+
+    async def _process(self, job: Row) -> None:
+        try:
+            language, text, source = await self.translator.translate(
+                job.text, job.translate_to_language
+            )
+            if len(language) > 30:
+                await self._fail(job, "Length too big", retry=False)
+                return
+            stored = await Jobs(self.session_maker()).complete(
+                job.id, job.attempts, language, text, self.dedup
+            )
+        except KeyError:
+            await self._fail(job, "OpenAI error occured", retry=True)
+            return
+        except UpstreamError as e:
+            await self._fail(
+                job, "OpenAI error occured", e.retryable, retry_after=e.retry_after
+            )
+            return
+        except Exception as e:
+            logger.exception("Translation job %s failed", job.id)
+            await self._fail(job, f"Translation failed: {type(e).__name__}", retry=True)
+            return
+        if stored is None:
+            logger.warning("Lease of translation job %s expired", job.id)
+            return
+        self.completed += 1
+        TRANSLATIONS.labels(source).inc()
+        if self.language_registry is not None and not stored.reused:
+            self.language_registry.add(language, job.translate_to_language)
+        self._notify_finished()
+
+    async def _fail(
+        self, job: Row, error: str, retry: bool, retry_after: float | None = None
+    ) -> None:
+        retry_in = None
+        if retry and job.attempts < self.max_attempts:
+            retry_in = max(
+                self.retry_backoff * 2 ** (job.attempts - 1), retry_after or 0
+            )
+        try:
+            await Jobs(self.session_maker()).fail(job.id, job.attempts, error, retry_in)
+        except Exception:
+            # The lease expires and the job is claimed again.
+            logger.exception("Could not record the failure of job %s", job.id)
+            return
+        if retry_in is None:
+            self.failed += 1
+            self._notify_finished()
+        else:
+            self.retried += 1
+
+    def _notify_finished(self) -> None:
+        self._finished.set()
+        self._finished = asyncio.Event()
+
+
+def build_job_worker(
+    session_maker: async_sessionmaker,
+    translator: Translator,
+    language_registry: LanguageRegistry | None = None,
+) -> JobWorker:
+    """
+    Build the job worker configured through environment variables.
+
+    TRANSLATION_JOB_WORKERS sets the number of concurrent jobs,
+    TRANSLATION_JOB_POLL_INTERVAL, TRANSLATION_JOB_LEASE and
+    TRANSLATION_JOB_MAX_ATTEMPTS the polling, lease and retry behaviour.
+    TRANSLATION_DEDUP=1 makes results reuse stored translations.
+
+    Args:
+        session_maker (async_sessionmaker): The factory for database sessions.
+        translator (Translator): The translation pipeline.
+        language_registry (LanguageRegistry | None): The registry told about
+            languages registered with the translations.
+
+    Returns:
+        JobWorker: The configured, not yet started worker.
+    """
+    settings = get_settings()
+    return JobWorker(
+        session_maker,
+        translator,
+        language_registry,
+        concurrency=settings.get_int("TRANSLATION_JOB_WORKERS", 4),
+        poll_interval=settings.get_float("TRANSLATION_JOB_POLL_INTERVAL", 1),
+        lease=settings.get_float("TRANSLATION_JOB_LEASE", 60),
+        max_attempts=settings.get_int("TRANSLATION_JOB_MAX_ATTEMPTS", 5),
+        dedup=settings.dedup_translations,
+    )
@@ -1,50 +1,166 @@
-from contextlib import asynccontextmanager
-from typing import Annotated, Tuple
+import bisect
+import json
+import logging
+import math
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Annotated, AsyncIterator, Literal, Tuple
 
-from fastapi import Depends, FastAPI, HTTPException, status
-from sqlalchemy.exc import IntegrityError
+from fastapi import (
+    Body,
+    Depends,
+    FastAPI,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    status,
+)
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy import Row
+from sqlalchemy.exc import DBAPIError, IntegrityError, SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.crud import Create, Delete, Read, Update
-from app.database import engine, init_models, maker
-from app.openai import ask_gpt3
+from app.admission import UpstreamError
+from app.backends import build_backend
+from app.batching import build_translation_batcher
+from app.bulk import parse_bulk_body, translate_bulk
+from app.cache import build_translation_cache, normalize_key
+from app.config import get_settings
+from app.crud import Create, Delete, Read, StoredTranslation, Update
+from app.database import get_database
+from app.jobs import DONE, JobWorker, build_job_worker
+from app.memory import build_translation_memory
+from app.metrics import REGISTRY, TRANSLATIONS, MetricsMiddleware
+from app.migrations import migrate
+from app.purge import LanguagePurger, Purge, build_language_purger
 from app.pydantic_models import (
+    JobOutput,
     LanguageInput,
     LanguageOutput,
+    LanguageStatusOutput,
+    PurgeOutput,
+    SearchOutput,
     SpeechOutput,
     TranslateInput,
     TranslateOutput,
     TranslateUpdate,
+    TranslationStatusOutput,
 )
+from app.registry import LanguageRegistry, configure_language_registry
+from app.replica import ReplicaRouter, StickyPrimaryMiddleware, build_replica_router
+from app.serialization import FastJSONResponse, dumps, rows_response
+from app.singleflight import SingleFlight
+from app.transfer import ImportFormatError, Transfer
+from app.translator import Translator
+
+logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
-async def lifespan(_: FastAPI):
-    await init_models(engine)
-    yield
+async def lifespan(app: FastAPI):
+    configure_language_registry(language_registry)
+    database = get_database()
+    await migrate(database.engine)
+    async with AsyncExitStack() as stack:
+        stack.push_async_callback(database.dispose)
+        app.state.replica_router = build_replica_router(database.read_engine)
+        client = await stack.enter_async_context(build_backend())
+        batcher = build_translation_batcher(client)
+        if batcher is not None:
+            client = await stack.enter_async_context(batcher)
+        memory = build_translation_memory(database.read_maker)
+        if memory is not None:
+            await memory.refresh()
+        cache = build_translation_cache(database.read_maker)
+        stack.callback(cache.close)
+        app.state.translator = Translator(client, cache, SingleFlight(), memory)
+        app.state.job_worker = await stack.enter_async_context(
+            build_job_worker(database.maker, app.state.translator, language_registry)
+        )
+        app.state.language_purger = await stack.enter_async_context(
+            build_language_purger(database.maker, language_registry)
+        )
+        yield
 
 
 application = FastAPI(lifespan=lifespan)
+application.add_middleware(MetricsMiddleware)
+application.add_middleware(StickyPrimaryMiddleware)
+row_flight = SingleFlight()
+language_registry = LanguageRegistry()
+# The maximum number of ids or names of a batch update or delete.
+MAX_BATCH_ITEMS = 1000
+# Keys of the fast responses, in the order of the selected columns.
+LANGUAGE_FIELDS = tuple(LanguageOutput.__fields__)
+SPEECH_FIELDS = tuple(SpeechOutput.__fields__)
+SEARCH_FIELDS = tuple(SearchOutput.__fields__)
 
 
 async def db_connection():
-    db = maker()
+    db = get_database().maker()
     try:
         yield db
     finally:
         await db.close()
 
 
-async def translation(input: TranslateInput):
+def get_replica_router(request: Request) -> ReplicaRouter | None:
+    return getattr(request.app.state, "replica_router", None)
+
+
+async def read_db_connection(
+    request: Request,
+    session: AsyncSession = Depends(db_connection),
+    replica_router: ReplicaRouter | None = Depends(get_replica_router),
+):
+    connection = (
+        await replica_router.connect(request) if replica_router is not None else None
+    )
+    if connection is None:
+        yield session
+        return
+    try:
+        yield AsyncSession(bind=connection, expire_on_commit=False)
+    finally:
+        await connection.close()
+
+
+def get_translator(request: Request) -> Translator:
+    return request.app.state.translator
+
+
+def get_job_worker(request: Request) -> JobWorker:
+    return request.app.state.job_worker
+
+
+def get_language_purger(request: Request) -> LanguagePurger:
+    return request.app.state.language_purger
+
+
+async def translation(
+    input: TranslateInput, translator: Translator = Depends(get_translator)
+):
     try:
-        language, text = await ask_gpt3(input.text, input.translate_to_language)
+        language, text, source = await translator.translate(
+            input.text, input.translate_to_language
+        )
     except KeyError:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="OpenAI error occured",
         )
+    except UpstreamError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="OpenAI error occured",
+            headers=None
+            if e.retry_after is None
+            else {"Retry-After": str(math.ceil(e.retry_after))},
+        )
+    TRANSLATIONS.labels(source).inc()
     return (
-        TranslateOutput(id=-1, translated_from=language, text=text),
+        TranslateOutput(id=-1, translated_from=language, text=text, source=source),
         input,
     )
 
@@ -64,6 +180,7 @@ async def create_language(
     create_unit = Create(session)
     try:
         await create_unit.register_language(language)
+        language_registry.add(language.language)
         return LanguageOutput(language=language.language)
     except IntegrityError:
         raise HTTPException(
@@ -92,24 +209,254 @@ async def create_translation(
             status_code=status.HTTP_507_INSUFFICIENT_STORAGE, detail="Length too big"
         )
 
+    if get_settings().share_translation_rows:
+        key = (
+            normalize_key(origin.text, origin.translate_to_language),
+            translation.translated_from,
+            translation.text,
+        )
+        # The shared insert must not depend on the session of the caller
+        # that started it, that caller may be cancelled before it finishes.
+        stored = await row_flight.do(
+            key,
+            lambda: persist_translation(
+                AsyncSession(session.bind, expire_on_commit=False),
+                origin,
+                translation,
+            ),
+        )
+    else:
+        stored = await persist_translation(session, origin, translation)
+    return stored_output(translation, stored)
+
+
+def stored_output(
+    translation: TranslateOutput, stored: StoredTranslation
+) -> TranslateOutput:
+    # A reused row answers with its own language and text, not the new answer.
+    translation.id = stored.id
+    if stored.reused:
+        translation.translated_from = stored.translated_from
+        translation.text = stored.text
+        translation.source = "stored"
+    return translation
+
+
+async def persist_translation(
+    session: AsyncSession, origin: TranslateInput, translation: TranslateOutput
+) -> StoredTranslation:
     create_unit = Create(session)
+    dedup = get_settings().dedup_translations
+    languages = (origin.translate_to_language, translation.translated_from)
+    if language_registry.knows(languages):
+        try:
+            return await create_unit.register_translation(
+                origin, translation, register_languages=False, dedup=dedup
+            )
+        except IntegrityError:
+            # One of the languages was deleted by another worker.
+            language_registry.invalidate()
+    stored = await create_unit.register_translation(origin, translation, dedup=dedup)
+    if not stored.reused:
+        # A reused row registers no language.
+        language_registry.add(*languages)
+    return stored
+
+
+def server_sent_event(event: str, data: dict) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode()
+
+
+async def translation_events(
+    origin: TranslateInput, translator: Translator, session: AsyncSession
+):
+    language, tokens, source = None, [], "model"
     try:
-        await create_unit.register_language(
-            LanguageInput(language=origin.translate_to_language)
-        )
-    except IntegrityError:
-        pass
+        async for event, value in translator.stream(
+            origin.text, origin.translate_to_language
+        ):
+            if event == "source":
+                source = value
+            elif event == "language":
+                language = value
+                if len(language) > 30:
+                    yield server_sent_event("error", {"detail": "Length too big"})
+                    return
+                yield server_sent_event("language", {"translated_from": language})
+            else:
+                tokens.append(value)
+                yield server_sent_event("token", {"text": value})
+    except (KeyError, UpstreamError):
+        yield server_sent_event("error", {"detail": "OpenAI error occured"})
+        return
+    if not language:
+        yield server_sent_event("error", {"detail": "OpenAI error occured"})
+        return
+
+    TRANSLATIONS.labels(source).inc()
+    translation = TranslateOutput(
+        id=-1, translated_from=language, text="".join(tokens).strip(), source=source
+    )
     try:
-        await create_unit.register_language(
-            LanguageInput(language=translation.translated_from)
+        stored = await persist_translation(session, origin, translation)
+    except SQLAlchemyError:
+        logger.exception("Could not store the streamed translation")
+        yield server_sent_event("error", {"detail": "Could not store translation"})
+        return
+    yield server_sent_event("done", stored_output(translation, stored).dict())
+
+
+@application.post(
+    "/api/v1/create_translation/stream",
+    status_code=status.HTTP_200_OK,
+    description="Create language translation, streaming the detected language "
+    "and the translation tokens as server-sent events",
+    response_class=StreamingResponse,
+    responses={
+        status.HTTP_200_OK: {
+            "content": {"text/event-stream": {}},
+            "description": "language, token, done and error events",
+        },
+    },
+)
+async def create_translation_stream(
+    origin: TranslateInput,
+    translator: Translator = Depends(get_translator),
+    session: AsyncSession = Depends(db_connection),
+):
+    return StreamingResponse(
+        translation_events(origin, translator, session),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+@application.post(
+    "/api/v1/create_translations_bulk",
+    status_code=status.HTTP_200_OK,
+    description="Create translations from a JSON array or NDJSON body of "
+    "translation inputs, results are streamed back as NDJSON",
+    response_class=StreamingResponse,
+    responses={
+        status.HTTP_200_OK: {
+            "content": {"application/x-ndjson": {}},
+            "description": "One result or error line per item",
+        },
+        status.HTTP_422_UNPROCESSABLE_ENTITY: {"description": "Malformed body"},
+    },
+)
+async def create_translations_bulk(
+    request: Request,
+    translator: Translator = Depends(get_translator),
+    session: AsyncSession = Depends(db_connection),
+):
+    try:
+        items = parse_bulk_body(await request.body())
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Body must be a JSON array or NDJSON",
         )
-    except IntegrityError:
-        pass
-    translation.id = await create_unit.register_translation(
-        origin,
-        translation,
+    settings = get_settings()
+    return StreamingResponse(
+        translate_bulk(
+            items,
+            translator,
+            session,
+            language_registry,
+            settings.bulk_concurrency,
+            dedup=settings.dedup_translations,
+        ),
+        media_type="application/x-ndjson",
+    )
+
+
+def job_output(job: Row) -> JobOutput:
+    translation = None
+    if job.status == DONE and job.translation_id is not None:
+        translation = TranslateOutput(
+            id=job.translation_id,
+            translated_from=job.origin_language,
+            text=job.translated_text,
+        )
+    return JobOutput(
+        id=job.id,
+        status=job.status,
+        attempts=job.attempts,
+        error=job.error,
+        translation=translation,
+    )
+
+
+@application.post(
+    "/api/v1/translation_jobs",
+    status_code=status.HTTP_202_ACCEPTED,
+    description="Queue a translation, the Location header points to the job",
+    responses={status.HTTP_202_ACCEPTED: {"model": JobOutput}},
+)
+async def create_translation_job(
+    origin: TranslateInput,
+    response: Response,
+    job_worker: JobWorker = Depends(get_job_worker),
+) -> JobOutput:
+    job_id = await job_worker.enqueue(origin)
+    response.headers["Location"] = f"/api/v1/translation_jobs/{job_id}"
+    return JobOutput(id=job_id, status="pending", attempts=0)
+
+
+@application.get(
+    "/api/v1/translation_jobs/{id}",
+    status_code=status.HTTP_200_OK,
+    description="Get a translation job, with wait set the request is held "
+    "up to that many seconds until the job is done or failed",
+    responses={
+        status.HTTP_200_OK: {"model": JobOutput},
+        status.HTTP_404_NOT_FOUND: {"description": "Job not found"},
+    },
+)
+async def get_translation_job(
+    id: int,
+    wait: float = Query(default=0, ge=0, le=30),
+    job_worker: JobWorker = Depends(get_job_worker),
+) -> JobOutput:
+    job = await job_worker.wait(id, wait)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_output(job)
+
+
+@application.get(
+    "/api/v1/stats",
+    status_code=status.HTTP_200_OK,
+    description="Get translation cache and request coalescing counters",
+)
+async def stats(
+    translator: Translator = Depends(get_translator),
+    job_worker: JobWorker = Depends(get_job_worker),
+    language_purger: LanguagePurger = Depends(get_language_purger),
+    replica_router: ReplicaRouter | None = Depends(get_replica_router),
+) -> dict:
+    stats = {
+        **translator.stats(),
+        "shared_rows": row_flight.stats(),
+        "jobs": job_worker.stats(),
+        "purges": language_purger.stats(),
+    }
+    if replica_router is not None:
+        stats["replica"] = replica_router.stats()
+    return stats
+
+
+@application.get(
+    "/metrics",
+    status_code=status.HTTP_200_OK,
+    description="Get latency histograms and counters in the Prometheus text format",
+    response_class=PlainTextResponse,
+)
+async def metrics():
+    return PlainTextResponse(
+        REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
     )
-    return translation
 
 
 @application.get(
@@ -122,33 +469,184 @@ async def create_translation(
     },
 )
 async def get_language(
-    name: str, session: AsyncSession = Depends(db_connection)
+    name: str, session: AsyncSession = Depends(read_db_connection)
 ) -> LanguageOutput:
-    read_unit = Read(session)
-    language = await read_unit.get_language(name)
-    if not language:
+    if not await language_registry.contains(session, name):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Language not found"
         )
 
-    return LanguageOutput(language=language.name)
+    return LanguageOutput(language=name)
 
 
 @application.get(
     "/api/v1/get_all_languages",
     status_code=status.HTTP_200_OK,
-    description="Get all languages",
-    responses={status.HTTP_200_OK: {"model": list[LanguageOutput]}},
+    description="Get all languages, or a page of them when limit is given. "
+    "The X-Next-Cursor header holds the cursor of the next page.",
+    responses={
+        status.HTTP_200_OK: {"model": list[LanguageOutput]},
+        status.HTTP_304_NOT_MODIFIED: {"description": "Languages not modified"},
+    },
 )
 async def get_all_languages(
-    session: AsyncSession = Depends(db_connection),
+    limit: int | None = Query(default=None, ge=1, le=1000),
+    cursor: str | None = None,
+    if_none_match: str | None = Header(default=None),
+    session: AsyncSession = Depends(read_db_connection),
 ) -> list[LanguageOutput]:
+    names = await language_registry.names(session)
+    if limit is not None:
+        start = bisect.bisect_right(names, cursor) if cursor is not None else 0
+        page = names[start : start + limit]
+        headers = {"X-Next-Cursor": page[-1]} if start + limit < len(names) else None
+        return rows_response(LANGUAGE_FIELDS, zip(page), headers)
+
+    etag = await language_registry.etag(session)
+    if if_none_match and (
+        if_none_match.strip() == "*"
+        or etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    ):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+        )
+
+    return rows_response(LANGUAGE_FIELDS, zip(names), {"ETag": etag})
+
+
+async def serialize_rows(rows: AsyncIterator[Row], format: str) -> AsyncIterator[bytes]:
+    if format == "ndjson":
+        async for row in rows:
+            yield dumps(row._asdict()) + b"\n"
+        return
+
+    separator = b"["
+    async for row in rows:
+        yield separator + dumps(row._asdict())
+        separator = b","
+    yield b"[]" if separator == b"[" else b"]"
+
+
+@application.get(
+    "/api/v1/get_all_translations",
+    status_code=status.HTTP_200_OK,
+    description="Get a page of translations, optionally filtered by language. "
+    "The X-Next-Cursor header holds the cursor of the next page. With stream "
+    "set, all matching translations after the cursor are streamed as a JSON "
+    "array or NDJSON.",
+    responses={
+        status.HTTP_200_OK: {
+            "model": list[SpeechOutput],
+            "content": {"application/x-ndjson": {}},
+        },
+    },
+)
+async def get_all_translations(
+    origin_language: str | None = None,
+    translated_language: str | None = None,
+    limit: int = Query(default=100, ge=1, le=1000),
+    cursor: int | None = None,
+    stream: Literal["json", "ndjson"] | None = None,
+    session: AsyncSession = Depends(read_db_connection),
+) -> list[SpeechOutput]:
     read_unit = Read(session)
-    languages = await read_unit.get_all_languages()
-    languages_output: list[LanguageOutput] = [
-        LanguageOutput(language=language.name) for language in languages
-    ]
-    return languages_output
+    if stream is not None:
+        rows = read_unit.stream_translations(
+            cursor, origin_language, translated_language
+        )
+        return StreamingResponse(
+            serialize_rows(rows, stream),
+            media_type="application/json"
+            if stream == "json"
+            else "application/x-ndjson",
+        )
+
+    rows = await read_unit.get_translations_page(
+        limit, cursor, origin_language, translated_language
+    )
+    headers = {"X-Next-Cursor": str(rows[-1].id)} if len(rows) == limit else None
+    return rows_response(SPEECH_FIELDS, rows, headers)
+
+
+@application.get(
+    "/api/v1/search_translations",
+    status_code=status.HTTP_200_OK,
+    description="Search translations by words of the original or translated "
+    "text, best matches first",
+    responses={status.HTTP_200_OK: {"model": list[SearchOutput]}},
+)
+async def search_translations(
+    q: str = Query(min_length=1, max_length=512),
+    origin_language: str | None = None,
+    translated_language: str | None = None,
+    limit: int = Query(default=20, ge=1, le=100),
+    offset: int = Query(default=0, ge=0),
+    session: AsyncSession = Depends(read_db_connection),
+) -> list[SearchOutput]:
+    rows = await Read(session).search_translations(
+        q, limit, offset, origin_language, translated_language
+    )
+    return rows_response(SEARCH_FIELDS, rows)
+
+
+@application.get(
+    "/api/v1/export/{table}",
+    status_code=status.HTTP_200_OK,
+    description="Export the language or translation table as CSV or NDJSON",
+    response_class=StreamingResponse,
+    responses={
+        status.HTTP_200_OK: {
+            "content": {"text/csv": {}, "application/x-ndjson": {}},
+        },
+    },
+)
+async def export_table(
+    table: Literal["language", "translation"],
+    format: Literal["csv", "ndjson"] = "csv",
+    session: AsyncSession = Depends(read_db_connection),
+):
+    return StreamingResponse(
+        Transfer(session).export_table(table, format),
+        media_type="text/csv" if format == "csv" else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{table}.{format}"'},
+    )
+
+
+@application.post(
+    "/api/v1/import/{table}",
+    status_code=status.HTTP_201_CREATED,
+    description="Import CSV with a header line or NDJSON into the language or "
+    "translation table, missing languages are registered",
+    responses={
+        status.HTTP_201_CREATED: {"description": "Number of imported rows"},
+        status.HTTP_422_UNPROCESSABLE_ENTITY: {"description": "Malformed data"},
+    },
+)
+async def import_table(
+    table: Literal["language", "translation"],
+    request: Request,
+    format: Literal["csv", "ndjson"] = "csv",
+    session: AsyncSession = Depends(db_connection),
+):
+    try:
+        count = await Transfer(session).import_table(
+            table,
+            format,
+            request.stream(),
+            dedup=get_settings().dedup_translations,
+        )
+    except ImportFormatError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e)
+        )
+    except DBAPIError:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Rows could not be imported",
+        )
+    finally:
+        language_registry.invalidate()
+    return {"imported": count}
 
 
 @application.get(
@@ -161,20 +659,14 @@ async def get_all_languages(
     },
 )
 async def get_translate(
-    id: int, session: AsyncSession = Depends(db_connection)
+    id: int, session: AsyncSession = Depends(read_db_connection)
 ) -> SpeechOutput:
     read_unit = Read(session)
-    translate = await read_unit.get_translation(id)
+    translate = await read_unit.get_translation_row(id)
     if not translate:
         raise HTTPException(status_code=404, detail="Translation not found")
 
-    return SpeechOutput(
-        id=translate.id,
-        origin_language=translate.origin_language,
-        translated_language=translate.translated_language,
-        text=translate.text,
-        translated_text=translate.translated_text,
-    )
+    return FastJSONResponse(dict(zip(SPEECH_FIELDS, translate)))
 
 
 @application.put(
@@ -190,15 +682,59 @@ async def update_translate(
     new_translation: TranslateUpdate, session: AsyncSession = Depends(db_connection)
 ):
     update_unit = Update(session)
-    read_unit = Read(session)
-    is_there_translation = await read_unit.get_translation(new_translation.id)
-    if not is_there_translation:
+    updated = await update_unit.update_translations(
+        {new_translation.id: new_translation.new_translation}
+    )
+    if not updated:
         raise HTTPException(status_code=404, detail="Translation not found")
+    return {"status": "updated"}
+
 
-    await update_unit.update_translation(
-        new_translation.id, new_translation.new_translation
+@application.patch(
+    "/api/v1/translations",
+    status_code=status.HTTP_200_OK,
+    description="Update the translated text of several translations in one "
+    "statement, the status of every item is updated or not_found",
+    responses={status.HTTP_200_OK: {"model": list[TranslationStatusOutput]}},
+)
+async def update_translations(
+    new_translations: Annotated[
+        list[TranslateUpdate], Body(min_items=1, max_items=MAX_BATCH_ITEMS)
+    ],
+    session: AsyncSession = Depends(db_connection),
+) -> list[TranslationStatusOutput]:
+    # A repeated id gets the text of its last item.
+    updated = set(
+        await Update(session).update_translations(
+            {item.id: item.new_translation for item in new_translations}
+        )
     )
-    return {"status": "updated"}
+    return [
+        TranslationStatusOutput(
+            id=item.id, status="updated" if item.id in updated else "not_found"
+        )
+        for item in new_translations
+    ]
+
+
+@application.delete(
+    "/api/v1/translations",
+    status_code=status.HTTP_200_OK,
+    description="Delete several translations by id in one statement, the "
+    "status of every id is deleted or not_found",
+    responses={status.HTTP_200_OK: {"model": list[TranslationStatusOutput]}},
+)
+async def delete_translations(
+    id: list[int] = Query(min_items=1, max_items=MAX_BATCH_ITEMS),
+    session: AsyncSession = Depends(db_connection),
+) -> list[TranslationStatusOutput]:
+    deleted = set(await Delete(session).delete_translations(id))
+    return [
+        TranslationStatusOutput(
+            id=item, status="deleted" if item in deleted else "not_found"
+        )
+        for item in id
+    ]
 
 
 @application.delete(
@@ -212,26 +748,91 @@ async def update_translate(
 )
 async def delete_translate(id: int, session: AsyncSession = Depends(db_connection)):
     delete_unit = Delete(session)
-    deleted_id = await delete_unit.delete_translation(id)
-    if not deleted_id:
+    if not await delete_unit.delete_translations([id]):
         raise HTTPException(status_code=404, detail="Translation not found")
     return {"status": "deleted"}
 
 
+def purge_output(purge: Purge) -> PurgeOutput:
+    return PurgeOutput(
+        language=purge.language,
+        status=purge.status,
+        deleted=purge.deleted,
+        batches=purge.batches,
+        elapsed=purge.elapsed(),
+        error=purge.error,
+    )
+
+
 @application.delete(
     "/api/v1/delete_language/{name}",
     status_code=status.HTTP_200_OK,
-    description="Delete language by name",
+    description="Delete language by name with its translations. With purge "
+    "set, the translations are deleted in batches in the background and the "
+    "Location header points to the progress of the purge.",
     responses={
         status.HTTP_404_NOT_FOUND: {"description": "Language not found"},
         status.HTTP_200_OK: {"status": "deleted"},
+        status.HTTP_202_ACCEPTED: {"model": PurgeOutput},
     },
 )
-async def delete_language(name: str, session: AsyncSession = Depends(db_connection)):
-    delete_unit = Delete(session)
-    read_unit = Read(session)
-    is_there_language = await read_unit.get_language(name)
-    if not is_there_language:
+async def delete_language(
+    name: str,
+    response: Response,
+    purge: bool = False,
+    session: AsyncSession = Depends(db_connection),
+    language_purger: LanguagePurger = Depends(get_language_purger),
+):
+    if purge:
+        started = await language_purger.start(name)
+        if started is None:
+            raise HTTPException(status_code=404, detail="Language not found")
+        response.status_code = status.HTTP_202_ACCEPTED
+        response.headers["Location"] = f"/api/v1/language_purges/{name}"
+        return purge_output(started)
+
+    if not await Delete(session).delete_languages([name]):
         raise HTTPException(status_code=404, detail="Language not found")
-    await delete_unit.delete_language(name)
+    language_registry.invalidate()
     return {"status": "deleted"}
+
+
+@application.delete(
+    "/api/v1/languages",
+    status_code=status.HTTP_200_OK,
+    description="Delete several languages with their translations in one "
+    "statement, the status of every name is deleted or not_found",
+    responses={status.HTTP_200_OK: {"model": list[LanguageStatusOutput]}},
+)
+async def delete_languages(
+    name: list[str] = Query(min_items=1, max_items=MAX_BATCH_ITEMS),
+    session: AsyncSession = Depends(db_connection),
+) -> list[LanguageStatusOutput]:
+    deleted = set(await Delete(session).delete_languages(name))
+    if deleted:
+        language_registry.invalidate()
+    return [
+        LanguageStatusOutput(
+            language=item, status="deleted" if item in deleted else "not_found"
+        )
+        for item in name
+    ]
+
+
+@application.get(
+    "/api/v1/language_purges/{name}",
+    status_code=status.HTTP_200_OK,
+    description="Get the progress of the latest purge of a language started "
+    "by this process",
+    responses={
+        status.HTTP_200_OK: {"model": PurgeOutput},
+        status.HTTP_404_NOT_FOUND: {"description": "Purge not found"},
+    },
+)
+async def get_language_purge(
+    name: str, language_purger: LanguagePurger = Depends(get_language_purger)
+) -> PurgeOutput:
+    purge = language_purger.get(name)
+    if purge is None:
+        raise HTTPException(status_code=404, detail="Purge not found")
+    return purge_output(purge)
@@ -0,0 +1,335 @@
+import asyncio
+import random
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+from typing import Callable, NamedTuple
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.config import get_settings
+from app.crud import Read
+
+# Mersenne prime modulus of the MinHash permutations.
+_PRIME = (1 << 61) - 1
+# IDs below the greatest indexed one read again by every refresh.
+REFRESH_OVERLAP = 1000
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize a text for translation memory lookups.
+
+    The text is brought to NFKC form and casefolded, punctuation is dropped and
+    whitespace is collapsed, so inputs that differ only in these respects match.
+
+    Args:
+        text (str): The text to normalize.
+
+    Returns:
+        str: The normalized text.
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = "".join(
+        " " if unicodedata.category(char).startswith("P") else char for char in text
+    )
+    return " ".join(text.split())
+
+
+def shingles(text: str, size: int = 3) -> frozenset[str]:
+    """
+    Split a normalized text into overlapping character n-grams.
+
+    Args:
+        text (str): The normalized text.
+        size (int): The length of the n-grams.
+
+    Returns:
+        frozenset[str]: The n-grams, texts shorter than `size` are one n-gram.
+    """
+    padded = f" {text} "
+    if len(padded) <= size:
+        return frozenset([padded])
+    return frozenset(padded[i : i + size] for i in range(len(padded) - size + 1))
+
+
+def jaccard(a: frozenset[str], b: frozenset[str]) -> float:
+    return len(a & b) / len(a | b)
+
+
+class MemoryMatch(NamedTuple):
+    origin_language: str
+    translated_text: str
+    similarity: float
+
+
+class _Entry(NamedTuple):
+    language: str
+    text: str
+    origin_language: str
+    translated_text: str
+
+
+class TranslationMemory:
+    """
+    In-memory index of the stored translations for near-duplicate reuse.
+
+    Texts are normalized with `normalize_text` and indexed per target language
+    in an exact map and in a MinHash LSH index over character n-grams. A
+    lookup returns the stored translation of an exact match, or of the most
+    similar candidate whose n-gram Jaccard similarity reaches `threshold`.
+
+    The index holds the newest `max_entries` translations, older ones are
+    evicted first. It is loaded by `refresh`, or lazily by the first lookup,
+    and refreshed with the rows added since the last refresh once
+    `refresh_interval` seconds have passed. Lookups during a refresh use the
+    entries loaded so far instead of waiting for it.
+
+    A refresh reads the rows above the greatest indexed ID minus
+    `REFRESH_OVERLAP`, there is no commit timestamp to read from. A row that
+    commits after a refresh saw `REFRESH_OVERLAP` greater IDs is never
+    indexed, the memory only misses a reuse then.
+    """
+
+    def __init__(
+        self,
+        session_maker: async_sessionmaker,
+        threshold: float = 0.9,
+        num_perm: int = 64,
+        bands: int = 16,
+        ngram: int = 3,
+        refresh_interval: float = 30.0,
+        max_entries: int = 100_000,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """
+        Initialize a TranslationMemory object.
+
+        Args:
+            session_maker (async_sessionmaker): The factory for database sessions.
+            threshold (float): The minimum similarity of a reused translation.
+            num_perm (int): The number of MinHash permutations.
+            bands (int): The number of LSH bands, must divide `num_perm`.
+            ngram (int): The length of the character n-grams.
+            refresh_interval (float): The time in seconds between refreshes.
+            max_entries (int): The maximum number of indexed translations.
+            clock (Callable[[], float]): The time source, used by tests.
+        """
+        if num_perm % bands:
+            raise ValueError("bands must divide num_perm")
+        self.session_maker = session_maker
+        self.threshold = threshold
+        self.bands = bands
+        self.ngram = ngram
+        self.refresh_interval = refresh_interval
+        self.max_entries = max_entries
+        self.clock = clock
+        self.lookups = 0
+        self.exact_hits = 0
+        self.fuzzy_hits = 0
+        self.refreshes = 0
+        self.evictions = 0
+        rng = random.Random(0)
+        self._perms = [
+            (rng.randrange(1, _PRIME), rng.randrange(_PRIME)) for _ in range(num_perm)
+        ]
+        self._rows = num_perm // bands
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()
+        self._exact: dict[tuple[str, str], int] = {}
+        self._buckets: dict[tuple, set[int]] = {}
+        self._last_id: int | None = None
+        self._evicted_id = 0
+        self._refreshed_at: float | None = None
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def lookup(self, text: str, language: str) -> MemoryMatch | None:
+        """
+        Find a stored translation of the same or a similar text.
+
+        Args:
+            text (str): The text to translate.
+            language (str): The language to translate to.
+
+        Returns:
+            MemoryMatch | None: The best match, or None if no stored text is
+                similar enough.
+        """
+        await self._ensure_fresh()
+        self.lookups += 1
+        language = language.strip().casefold()
+        normalized = normalize_text(text)
+
+        entry_id = self._exact.get((language, normalized))
+        if entry_id is not None:
+            self.exact_hits += 1
+            entry = self._entries[entry_id]
+            return MemoryMatch(entry.origin_language, entry.translated_text, 1.0)
+
+        if self.threshold >= 1:
+            return None
+        grams = shingles(normalized, self.ngram)
+        best, best_similarity = None, self.threshold
+        for entry_id in self._candidates(language, grams):
+            entry = self._entries[entry_id]
+            similarity = jaccard(grams, shingles(entry.text, self.ngram))
+            if similarity >= best_similarity:
+                best, best_similarity = entry, similarity
+        if best is None:
+            return None
+        self.fuzzy_hits += 1
+        return MemoryMatch(best.origin_language, best.translated_text, best_similarity)
+
+    def add(
+        self,
+        id: int,
+        text: str,
+        language: str,
+        origin_language: str,
+        translated_text: str,
+    ) -> None:
+        """
+        Index a stored translation.
+
+        Args:
+            id (int): The ID of the translation.
+            text (str): The original text.
+            language (str): The language the text was translated to.
+            origin_language (str): The detected source language.
+            translated_text (str): The translated text.
+        """
+        if id in self._entries or id <= self._evicted_id:
+            return
+        language = language.strip().casefold()
+        normalized = normalize_text(text)
+        self._entries[id] = _Entry(
+            language, normalized, origin_language, translated_text
+        )
+        # The newest translation of a text wins.
+        if self._exact.get((language, normalized), -1) < id:
+            self._exact[(language, normalized)] = id
+        for band in self._bands(language, shingles(normalized, self.ngram)):
+            self._buckets.setdefault(band, set()).add(id)
+        while len(self._entries) > self.max_entries:
+            self._evict()
+
+    async def refresh(self) -> None:
+        """Index the translations stored since the last refresh."""
+        async with self._lock:
+            await self._refresh()
+
+    def stats(self) -> dict:
+        """
+        Get translation memory counters.
+
+        Returns:
+            dict: The number of lookups, of exact and fuzzy hits, the match
+                rate, the number of indexed and evicted translations and of
+                refreshes.
+        """
+        hits = self.exact_hits + self.fuzzy_hits
+        return {
+            "lookups": self.lookups,
+            "exact_hits": self.exact_hits,
+            "fuzzy_hits": self.fuzzy_hits,
+            "match_rate": hits / self.lookups if self.lookups else 0.0,
+            "size": len(self._entries),
+            "evictions": self.evictions,
+            "refreshes": self.refreshes,
+        }
+
+    async def _ensure_fresh(self) -> None:
+        if not self._stale():
+            return
+        if self._lock.locked() and self._refreshed_at is not None:
+            return
+        async with self._lock:
+            if self._stale():
+                await self._refresh()
+
+    def _stale(self) -> bool:
+        return (
+            self._refreshed_at is None
+            or self.clock() - self._refreshed_at >= self.refresh_interval
+        )
+
+    async def _refresh(self) -> None:
+        if self._last_id is None:
+            last_id = await Read(self.session_maker()).get_last_translation_id()
+            after_id = None if last_id is None else last_id - self.max_entries
+        else:
+            after_id = self._last_id - REFRESH_OVERLAP
+        async for row in Read(self.session_maker()).stream_translations(
+            after_id=after_id
+        ):
+            self.add(
+                row.id,
+                row.text,
+                row.translated_language,
+                row.origin_language,
+                row.translated_text,
+            )
+            self._last_id = max(self._last_id or 0, row.id)
+        self.refreshes += 1
+        self._refreshed_at = self.clock()
+
+    def _evict(self) -> None:
+        id, entry = self._entries.popitem(last=False)
+        self._evicted_id = max(self._evicted_id, id)
+        self.evictions += 1
+        if self._exact.get((entry.language, entry.text)) == id:
+            del self._exact[(entry.language, entry.text)]
+        for band in self._bands(entry.language, shingles(entry.text, self.ngram)):
+            bucket = self._buckets[band]
+            bucket.discard(id)
+            if not bucket:
+                del self._buckets[band]
+
+    def _signature(self, grams: frozenset[str]) -> list[int]:
+        hashes = [zlib.crc32(gram.encode()) for gram in grams]
+        return [min((a * h + b) % _PRIME for h in hashes) for a, b in self._perms]
+
+    def _bands(self, language: str, grams: frozenset[str]) -> list[tuple]:
+        signature = self._signature(grams)
+        return [
+            (language, band, *signature[band * self._rows : (band + 1) * self._rows])
+            for band in range(self.bands)
+        ]
+
+    def _candidates(self, language: str, grams: frozenset[str]) -> set[int]:
+        candidates = set()
+        for band in self._bands(language, grams):
+            candidates.update(self._buckets.get(band, ()))
+        return candidates
+
+
+def build_translation_memory(
+    session_maker: async_sessionmaker,
+) -> TranslationMemory | None:
+    """
+    Build the translation memory configured through environment variables.
+
+    TRANSLATION_MEMORY=1 enables the memory, TRANSLATION_MEMORY_THRESHOLD sets
+    the minimum similarity of a reused translation (1 allows exact matches of
+    the normalized text only), TRANSLATION_MEMORY_REFRESH the time in seconds
+    between refreshes and TRANSLATION_MEMORY_SIZE the maximum number of
+    indexed translations.
+
+    Args:
+        session_maker (async_sessionmaker): The factory for database sessions.
+
+    Returns:
+        TranslationMemory | None: The configured memory, or None if disabled.
+    """
+    settings = get_settings()
+    if not settings.get_flag("TRANSLATION_MEMORY"):
+        return None
+    return TranslationMemory(
+        session_maker,
+        threshold=settings.get_float("TRANSLATION_MEMORY_THRESHOLD", 0.9),
+        refresh_interval=settings.get_float("TRANSLATION_MEMORY_REFRESH", 30),
+        max_entries=settings.get_int("TRANSLATION_MEMORY_SIZE", 100_000),
+    )
@@ -0,0 +1,370 @@
+"""
+Lightweight Prometheus-style metrics.
+
+Metrics live in process memory and are rendered in the Prometheus text format
+by the /metrics endpoint. Recording a value is a dictionary lookup and a few
+arithmetic operations, label children are created once and can be bound to
+module constants on hot paths.
+"""
+import time
+from bisect import bisect_left
+from typing import Callable, Iterable
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = []
+    for name, value in zip(names, values):
+        value = (
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base class of metrics with an optional set of label names."""
+
+    type = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()) -> None:
+        """
+        Initialize a Metric object.
+
+        Args:
+            name (str): The metric name.
+            help (str): The description rendered as HELP.
+            labels (tuple[str, ...]): The label names.
+        """
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self._children: dict[tuple[str, ...], object] = {}
+
+    def labels(self, *values: str):
+        """
+        Get the child of a label combination.
+
+        Args:
+            *values (str): The label values, in the order of the label names.
+
+        Returns:
+            The child metric, created on first use.
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name} expects labels {self.label_names}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _render_child(self, values: tuple[str, ...], child) -> list[str]:
+        raise NotImplementedError
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1) -> None:
+        """Increment the counter of a metric without labels."""
+        self.labels().inc(amount)
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def _render_child(self, values: tuple[str, ...], child: _CounterChild) -> list[str]:
+        labels = _format_labels(self.label_names, values)
+        return [f"{self.name}{labels} {_format_value(child.value)}"]
+
+
+class _Timer:
+    __slots__ = ("child", "started")
+
+    def __init__(self, child: "_HistogramChild") -> None:
+        self.child = child
+
+    def __enter__(self) -> "_Timer":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.child.observe(time.perf_counter() - self.started)
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self) -> _Timer:
+        """Time a block of code, the duration is observed in seconds."""
+        return _Timer(self)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> None:
+        """
+        Initialize a Histogram object.
+
+        Args:
+            name (str): The metric name.
+            help (str): The description rendered as HELP.
+            labels (tuple[str, ...]): The label names.
+            buckets (tuple[float, ...]): The sorted upper bounds of the buckets.
+        """
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float) -> None:
+        """Observe a value of a metric without labels."""
+        self.labels().observe(value)
+
+    def time(self) -> _Timer:
+        """Time a block of code for a metric without labels."""
+        return self.labels().time()
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def _render_child(
+        self, values: tuple[str, ...], child: _HistogramChild
+    ) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip((*self.buckets, float("inf")), child.counts):
+            cumulative += count
+            labels = _format_labels(
+                (*self.label_names, "le"), (*values, _format_value(bound))
+            )
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.label_names, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class Gauge(Metric):
+    """Gauge whose value is read from a callback when metrics are rendered."""
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        callback: Callable[[], float | dict[tuple[str, ...], float]],
+        labels: tuple[str, ...] = (),
+    ) -> None:
+        """
+        Initialize a Gauge object.
+
+        Args:
+            name (str): The metric name.
+            help (str): The description rendered as HELP.
+            callback (Callable[[], float | dict[tuple[str, ...], float]]): The
+                function returning the value, or the values by label values
+                if the gauge has labels.
+            labels (tuple[str, ...]): The label names.
+        """
+        super().__init__(name, help, labels)
+        self.callback = callback
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        values = self.callback() if self.label_names else {(): self.callback()}
+        for label_values, value in sorted(values.items()):
+            labels = _format_labels(self.label_names, label_values)
+            lines.append(f"{self.name}{labels} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of the metrics exposed by the /metrics endpoint."""
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        """
+        Add a metric, a metric with the same name is replaced.
+
+        Args:
+            metric (Metric): The metric to add.
+
+        Returns:
+            Metric: The added metric.
+        """
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def gauge(
+        self,
+        name: str,
+        help: str,
+        callback: Callable[[], float | dict[tuple[str, ...], float]],
+        labels: tuple[str, ...] = (),
+    ) -> Gauge:
+        return self.register(Gauge(name, help, callback, labels))
+
+    def render(self) -> str:
+        """
+        Render all metrics.
+
+        Returns:
+            str: The metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "translator_stage_seconds",
+    "Time spent in the stages of a translation",
+    labels=("stage",),
+)
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds",
+    "Time to serve HTTP requests, streamed bodies included",
+    labels=("method", "route", "status"),
+)
+OPENAI_RESPONSES = REGISTRY.counter(
+    "openai_responses_total",
+    "Responses of the OpenAI API by HTTP status",
+    labels=("status",),
+)
+OPENAI_TOKENS = REGISTRY.counter(
+    "openai_tokens_total",
+    "Tokens reported by the OpenAI API",
+    labels=("type",),
+)
+TRANSLATIONS = REGISTRY.counter(
+    "translations_total",
+    "Translations by the stage that produced them",
+    labels=("source",),
+)
+POOL_CHECKOUT_SECONDS = REGISTRY.histogram(
+    "db_pool_checkout_seconds",
+    "Time to check a connection out of the database pool",
+    labels=("engine",),
+)
+
+
+def record_usage(response_data: dict) -> None:
+    """
+    Count the tokens of an OpenAI chat completion.
+
+    Args:
+        response_data (dict): The decoded completion.
+    """
+    usage = response_data.get("usage") or {}
+    for kind in ("prompt_tokens", "completion_tokens"):
+        if usage.get(kind):
+            OPENAI_TOKENS.labels(kind.removesuffix("_tokens")).inc(usage[kind])
+
+
+class MetricsMiddleware:
+    """ASGI middleware observing the duration of every HTTP request."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # The route template keeps the number of label values bounded.
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.labels(
+                scope["method"],
+                route.path if route is not None else "unmatched",
+                str(status),
+            ).observe(time.perf_counter() - started)
@@ -0,0 +1,211 @@
+"""
+Versioned schema migrations.
+
+The schema_version table holds the version of the schema. At startup
+`migrate` reads it and applies the pending migrations in one transaction, so
+an up-to-date database costs a version check and no reflection of the
+tables. A new database is created from the models and stamped with the
+latest version. A database created by create_all before versions existed
+starts at version 0, the migrations skip the objects it already has.
+
+Every schema change of app/models.py needs a migration: append a function
+to MIGRATIONS, its version is its position in the list.
+
+Usage:
+    python -m app.migrations
+"""
+import asyncio
+import logging
+from typing import Callable
+
+from sqlalchemy import (
+    Column,
+    Connection,
+    Integer,
+    MetaData,
+    Table,
+    insert,
+    inspect,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.models import SQLITE_SEARCH_DDL, Base, Translation, TranslationJob
+
+logger = logging.getLogger(__name__)
+
+# Not part of Base.metadata, create_all leaves the version to `migrate`.
+schema_version = Table(
+    "schema_version", MetaData(), Column("version", Integer, nullable=False)
+)
+# Key of the PostgreSQL advisory lock held while migrating.
+MIGRATION_LOCK = 0x7472616E
+
+
+def _create_indexes(
+    connection: Connection, *names: str, checkfirst: bool = True
+) -> None:
+    indexes = {index.name: index for index in Translation.__table__.indexes}
+    for name in names:
+        indexes[name].create(connection, checkfirst=checkfirst)
+
+
+def _keyset_indexes(connection: Connection) -> None:
+    """Indexes for keyset pagination filtered by language"""
+    _create_indexes(
+        connection,
+        "ix_translation_origin_language_id",
+        "ix_translation_translated_language_id",
+    )
+
+
+def _search_indexes(connection: Connection) -> None:
+    """Full-text and trigram search indexes"""
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        _create_indexes(
+            connection,
+            "ix_translation_search_document",
+            "ix_translation_text_trgm",
+            "ix_translation_translated_text_trgm",
+        )
+    elif connection.dialect.name == "sqlite":
+        if inspect(connection).has_table("translation_fts"):
+            return
+        for statement in SQLITE_SEARCH_DDL:
+            connection.execute(text(statement))
+        connection.execute(
+            text("INSERT INTO translation_fts(translation_fts) VALUES ('rebuild')")
+        )
+
+
+def _translation_jobs(connection: Connection) -> None:
+    """Durable translation job queue"""
+    TranslationJob.__table__.create(connection, checkfirst=True)
+
+
+def _content_hash(connection: Connection) -> None:
+    """Content hash of translations"""
+    columns = {
+        column["name"] for column in inspect(connection).get_columns("translation")
+    }
+    if "content_hash" not in columns:
+        connection.execute(
+            text("ALTER TABLE translation ADD COLUMN content_hash VARCHAR(64)")
+        )
+        logger.warning(
+            "Run `python -m app.dedup backfill` to hash the stored translations"
+        )
+
+
+def _cascade_language_deletes(connection: Connection) -> None:
+    """ON DELETE CASCADE on the language foreign keys of translations"""
+    foreign_keys = [
+        foreign_key
+        for foreign_key in inspect(connection).get_foreign_keys("translation")
+        if foreign_key["referred_table"] == "language"
+        and foreign_key.get("options", {}).get("ondelete", "").upper() != "CASCADE"
+    ]
+    if not foreign_keys:
+        return
+    if connection.dialect.name != "postgresql":
+        # SQLite cannot alter constraints, app/purge.py does not need them.
+        logger.warning("Foreign keys of the translation table left unchanged")
+        return
+    for foreign_key in foreign_keys:
+        name = foreign_key["name"]
+        (column,) = foreign_key["constrained_columns"]
+        connection.execute(
+            text(
+                f'ALTER TABLE translation DROP CONSTRAINT "{name}", '
+                f'ADD CONSTRAINT "{name}" FOREIGN KEY ({column}) '
+                "REFERENCES language (name) ON DELETE CASCADE"
+            )
+        )
+
+
+def _case_insensitive_content_hash_index(connection: Connection) -> None:
+    """Content hash lookup index on the lowercased language"""
+    connection.execute(
+        text("DROP INDEX IF EXISTS ix_translation_content_hash_language")
+    )
+    # New in this version, and SQLite does not reflect expression indexes for
+    # checkfirst to find.
+    _create_indexes(
+        connection, "ix_translation_content_hash_lower_language", checkfirst=False
+    )
+
+
+MIGRATIONS: list[Callable[[Connection], None]] = [
+    _keyset_indexes,
+    _search_indexes,
+    _translation_jobs,
+    _content_hash,
+    _cascade_language_deletes,
+    _case_insensitive_content_hash_index,
+]
+
+
+def _current_version(connection: Connection) -> int | None:
+    if not inspect(connection).has_table("schema_version"):
+        return None
+    return connection.scalar(select(schema_version.c.version)) or 0
+
+
+def _migrate(connection: Connection) -> int:
+    if connection.dialect.name == "postgresql":
+        # Workers starting together migrate one after the other.
+        connection.execute(
+            text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK}
+        )
+    head = len(MIGRATIONS)
+    version = _current_version(connection)
+    if version == head:
+        return head
+
+    if version is None:
+        schema_version.create(connection)
+        connection.execute(insert(schema_version).values(version=0))
+        if not inspect(connection).has_table("translation"):
+            logger.info("Creating schema version %s", head)
+            Base.metadata.create_all(connection)
+            connection.execute(update(schema_version).values(version=head))
+            return head
+        version = 0
+
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        logger.info("Applying migration %s: %s", number, migration.__doc__)
+        migration(connection)
+    connection.execute(update(schema_version).values(version=head))
+    return head
+
+
+async def migrate(engine: AsyncEngine) -> int:
+    """
+    Bring the schema of a database to the latest version.
+
+    Args:
+        engine (AsyncEngine): The engine of the database.
+
+    Returns:
+        int: The schema version after the migration.
+    """
+    async with engine.begin() as connection:
+        return await connection.run_sync(_migrate)
+
+
+async def main() -> None:
+    from app.database import get_database
+
+    database = get_database()
+    try:
+        print(f"Schema version {await migrate(database.engine)}")
+    finally:
+        await database.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -1,10 +1,37 @@
+import hashlib
+import unicodedata
 from datetime import datetime
 from typing import List
 
-from sqlalchemy import DateTime, String
+from sqlalchemy import DDL, DateTime, Index, String, event, text
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from sqlalchemy.orm.properties import ForeignKey
 
+# Full-text search document of a translation. Queries must use the same
+# expression as the index for PostgreSQL to pick it.
+SEARCH_DOCUMENT = "to_tsvector('simple', text || ' ' || translated_text)"
+
+
+def content_hash(text: str) -> str:
+    """
+    Hash a text to translate for duplicate lookups.
+
+    Whitespace is collapsed and the text is brought to NFC form first, like
+    the keys of the translation cache.
+
+    Args:
+        text (str): The original text.
+
+    Returns:
+        str: The hex SHA-256 digest of the normalized text.
+    """
+    normalized = unicodedata.normalize("NFC", " ".join(text.split()))
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+def _content_hash_default(context) -> str:
+    return content_hash(context.get_current_parameters()["text"])
+
 
 class Base(DeclarativeBase):
     pass
@@ -14,8 +41,12 @@ class Language(Base):
     __tablename__ = "language"
 
     name: Mapped[str] = mapped_column(String(55), primary_key=True)
+    # The database deletes the translations from and to the language, see
+    # app/purge.py for languages with many translations.
     translations: Mapped[List["Translation"]] = relationship(
-        cascade="all, delete", foreign_keys="Translation.origin_language"
+        cascade="all, delete",
+        foreign_keys="Translation.origin_language",
+        passive_deletes=True,
     )
     created_at: Mapped[DateTime] = mapped_column(DateTime, default=datetime.utcnow)
     last_updated: Mapped[DateTime] = mapped_column(DateTime, default=datetime.utcnow)
@@ -23,9 +54,107 @@ class Language(Base):
 
 class Translation(Base):
     __tablename__ = "translation"
+    __table_args__ = (
+        # Keyset pagination filtered by language walks these in id order.
+        Index("ix_translation_origin_language_id", "origin_language", "id"),
+        Index("ix_translation_translated_language_id", "translated_language", "id"),
+        # "Have we translated this before" lookups and duplicate detection,
+        # languages compare case-insensitively.
+        Index(
+            "ix_translation_content_hash_lower_language",
+            "content_hash",
+            text("lower(translated_language)"),
+        ),
+        # Search indexes, SQLite uses the translation_fts table below instead.
+        Index(
+            "ix_translation_search_document",
+            text(SEARCH_DOCUMENT),
+            postgresql_using="gin",
+        ).ddl_if(dialect="postgresql"),
+        Index(
+            "ix_translation_text_trgm",
+            "text",
+            postgresql_using="gin",
+            postgresql_ops={"text": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+        Index(
+            "ix_translation_translated_text_trgm",
+            "translated_text",
+            postgresql_using="gin",
+            postgresql_ops={"translated_text": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    origin_language: Mapped[str] = mapped_column(ForeignKey("language.name"))
-    translated_language: Mapped[str] = mapped_column(ForeignKey("language.name"))
+    origin_language: Mapped[str] = mapped_column(
+        ForeignKey("language.name", ondelete="CASCADE")
+    )
+    translated_language: Mapped[str] = mapped_column(
+        ForeignKey("language.name", ondelete="CASCADE")
+    )
     text: Mapped[str] = mapped_column(String(512))
     translated_text: Mapped[str] = mapped_column(String(512))
+    # Set on insert, NULL for rows stored before the column existed until
+    # `python -m app.dedup backfill` runs.
+    content_hash: Mapped[str | None] = mapped_column(
+        String(64), default=_content_hash_default
+    )
+
+
+class TranslationJob(Base):
+    __tablename__ = "translation_job"
+    __table_args__ = (
+        # Workers claim the oldest available pending jobs.
+        Index("ix_translation_job_status_available_at", "status", "available_at"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    text: Mapped[str] = mapped_column(String(512))
+    translate_to_language: Mapped[str] = mapped_column(String(55))
+    # pending, running, done or failed
+    status: Mapped[str] = mapped_column(String(16), default="pending")
+    attempts: Mapped[int] = mapped_column(default=0)
+    error: Mapped[str | None] = mapped_column(String(255))
+    translation_id: Mapped[int | None] = mapped_column(
+        ForeignKey("translation.id", ondelete="SET NULL")
+    )
+    available_at: Mapped[DateTime] = mapped_column(DateTime, default=datetime.utcnow)
+    locked_until: Mapped[DateTime | None] = mapped_column(DateTime)
+    created_at: Mapped[DateTime] = mapped_column(DateTime, default=datetime.utcnow)
+    last_updated: Mapped[DateTime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+event.listen(
+    Translation.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+
+# FTS5 index of the translation table for SQLite, kept up to date by triggers.
+SQLITE_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE translation_fts USING fts5("
+    "text, translated_text, content='translation', content_rowid='id')",
+    "CREATE TRIGGER translation_fts_insert AFTER INSERT ON translation BEGIN "
+    "INSERT INTO translation_fts(rowid, text, translated_text) "
+    "VALUES (new.id, new.text, new.translated_text); END",
+    "CREATE TRIGGER translation_fts_delete AFTER DELETE ON translation BEGIN "
+    "INSERT INTO translation_fts(translation_fts, rowid, text, translated_text) "
+    "VALUES ('delete', old.id, old.text, old.translated_text); END",
+    "CREATE TRIGGER translation_fts_update AFTER UPDATE OF text, translated_text "
+    "ON translation BEGIN "
+    "INSERT INTO translation_fts(translation_fts, rowid, text, translated_text) "
+    "VALUES ('delete', old.id, old.text, old.translated_text); "
+    "INSERT INTO translation_fts(rowid, text, translated_text) "
+    "VALUES (new.id, new.text, new.translated_text); END",
+]
+for statement in SQLITE_SEARCH_DDL:
+    event.listen(
+        Translation.__table__,
+        "after_create",
+        DDL(statement).execute_if(dialect="sqlite"),
+    )
+event.listen(
+    Translation.__table__,
+    "before_drop",
+    DDL("DROP TABLE IF EXISTS translation_fts").execute_if(dialect="sqlite"),
+)
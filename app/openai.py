@@ -1,83 +1,399 @@
-import os
-import re
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, TypeVar
 
 import aiohttp
-from dotenv import load_dotenv
 
-# Set up your API credentials
-load_dotenv()
-api_key = os.environ.get("API_KEY")
-if not api_key:
-    exit(1)
+from app.admission import (
+    AdmissionController,
+    UpstreamError,
+    build_admission_controller,
+    parse_retry_after,
+)
+from app.config import DEFAULT_OPENAI_URL, get_settings
+from app.metrics import OPENAI_RESPONSES, STAGE_SECONDS, record_usage
+from app.prompts import (
+    BATCH_SYSTEM_PROMPT,
+    AnswerFormatError,
+    PromptTemplate,
+    count_message_tokens,
+    count_tokens,
+    get_template,
+    parse_batch_answer,
+)
 
-# Define the endpoint URL
-url = "https://api.openai.com/v1/chat/completions"
+T = TypeVar("T")
 
+_OPENAI_REQUEST = STAGE_SECONDS.labels("openai_request")
+_ANSWER_PARSE = STAGE_SECONDS.labels("answer_parse")
 
-async def ask_gpt3(prompt, animal: str):
-    headers = {"Content-Type": "application/json", "Authorization": "Bearer " + api_key}
 
-    data = {
-        "model": "gpt-3.5-turbo",
-        "messages": [
-            {
-                "role": "system",
-                "content": """You are a translator that came from future and can translate from any language to any language, even from animal to animal.
-                You can translate any animal-like sound to another human language as well.
-                Send only plain-text translation, do not write anything but translation. Be creative with translation.
-                Always try to translate, even when specified species are very different from each other.
+class AnswerStreamParser:
+    """
+    Incremental parser for a streamed "Animal: ... / Translation: ..." answer.
 
-                You must use this format of dialogue:
-                Receive: "Mooo! Mooo! to ENGLISH"
-                Answer: "Animal: Cow
-                         Translation: Hi, how are you?"
+    Content deltas are fed as they arrive. The parser emits a ("language", name)
+    event once the source language line is complete, and ("token", text)
+    events for every piece of the translation after its label.
+    """
 
-                Receive: "Mooo! Mooo! to RUSSIAN"
-                Answer: "Animal: Cow
-                         Translation: Устал."
+    def __init__(self) -> None:
+        self.language: str | None = None
+        self.translation = ""
+        self._state = "language"
+        self._buffer = ""
 
-                Receive: "Mooo! Mooo!? to COW"
-                Answer: "Animal: Cow
-                         Translation: Mooo! Mooo!?"
+    def feed(self, delta: str) -> list[tuple[str, str]]:
+        """
+        Feed a content delta to the parser.
 
-                Receive: "Mooo! Mooo! to FISH"
-                Answer: "Animal: Cow
-                         Translation: Blob blob blob. Blob."
+        Args:
+            delta (str): The next piece of the answer.
 
-                Receive: "'Hi, I am John' to ENGLISH"
-                Answer: "Animal: Human
-                         Translation: Hi, I am John"
+        Returns:
+            list[tuple[str, str]]: The events completed by this delta.
+        """
+        self._buffer += delta
+        events = []
+        if self._state == "language" and "\n" in self._buffer:
+            line, self._buffer = self._buffer.split("\n", 1)
+            events.append(self._set_language(line))
+            self._state = "label"
+        if self._state == "label" and ":" in self._buffer:
+            self._buffer = self._buffer.split(":", 1)[1]
+            self._state = "translation"
+        if self._state == "translation" and not self.translation:
+            self._buffer = self._buffer.lstrip()
+        if self._state == "translation" and self._buffer:
+            events.append(self._add_token(self._buffer))
+            self._buffer = ""
+        return events
 
-                Receive: "'Hi, I am John' to COW"
-                Answer: "Animal: Human
-                         Translation: Moooooooo!! Mooo."
+    def finish(self) -> list[tuple[str, str]]:
+        """
+        Flush the parser at the end of the stream.
 
-                Receive: "'Moooo.' to CAT"
-                Answer: "Animal: Cow
-                         Translation: Meow-meow."
+        Returns:
+            list[tuple[str, str]]: The events left in the buffer.
+        """
+        events = []
+        if self._state == "language":
+            events.append(self._set_language(self._buffer))
+        elif self._state == "label" and self._buffer.strip():
+            events.append(self._add_token(self._buffer.strip()))
+        self._buffer = ""
+        self.translation = self.translation.strip()
+        return events
 
-                When you will generate translate – look at it again, to be sure you are sending a good translation.
+    def _set_language(self, line: str) -> tuple[str, str]:
+        self.language = line.split(":", 1)[-1].strip()
+        return ("language", self.language)
 
-                Your first translation task
-                Receive:
-                """,
+    def _add_token(self, text: str) -> tuple[str, str]:
+        self.translation += text
+        return ("token", text)
+
+
+def estimate_tokens(data: dict) -> int:
+    """
+    Estimate the tokens of a chat completion before it is sent.
+
+    The prompt tokens are counted, the answer is assumed about as long as
+    the user message.
+
+    Args:
+        data (dict): The request body.
+
+    Returns:
+        int: The estimated prompt and completion tokens.
+    """
+    prompt = count_message_tokens(data["messages"])
+    answer = count_tokens(data["messages"][-1]["content"])
+    return prompt + answer + 16
+
+
+def _stream_delta(payload: bytes) -> str | None:
+    try:
+        return json.loads(payload)["choices"][0]["delta"].get("content")
+    except (ValueError, LookupError, TypeError, AttributeError) as e:
+        raise AnswerFormatError(payload.decode(errors="replace")) from e
+
+
+class OpenAIClient:
+    """
+    Long-lived client for the OpenAI chat completions API.
+
+    The client owns one aiohttp session, so connections are pooled and kept
+    alive between translations. It is created and closed in the application
+    lifespan.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        url: str = DEFAULT_OPENAI_URL,
+        model: str = "gpt-3.5-turbo",
+        pool_size: int = 100,
+        per_host_limit: int = 0,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 60.0,
+        keepalive_timeout: float = 30.0,
+        admission: AdmissionController | None = None,
+        template: str = "compact",
+        stream_template: str = "compact_lines",
+    ) -> None:
+        """
+        Initialize an OpenAIClient object.
+
+        Args:
+            api_key (str): The OpenAI API key.
+            url (str): The chat completions endpoint.
+            model (str): The chat model.
+            pool_size (int): The total number of pooled connections, 0 is unlimited.
+            per_host_limit (int): The number of connections per host, 0 is unlimited.
+            connect_timeout (float): The timeout in seconds to open a connection.
+            read_timeout (float): The timeout in seconds between two reads.
+            keepalive_timeout (float): The time in seconds idle connections are kept.
+            admission (AdmissionController | None): The rate, concurrency and
+                retry policy of calls, None sends every call once right away.
+            template (str): The name of the prompt template of translations.
+            stream_template (str): The name of the prompt template of streamed
+                translations, its answer must be in the line format of
+                `AnswerStreamParser`.
+
+        Raises:
+            ValueError: If a template is unknown or the stream template
+                requests JSON output.
+        """
+        self.api_key = api_key
+        self.url = url
+        self.model = model
+        self.pool_size = pool_size
+        self.per_host_limit = per_host_limit
+        self.timeout = aiohttp.ClientTimeout(
+            total=None, sock_connect=connect_timeout, sock_read=read_timeout
+        )
+        self.keepalive_timeout = keepalive_timeout
+        self.admission = admission
+        self.template: PromptTemplate = get_template(template)
+        self.stream_template: PromptTemplate = get_template(stream_template)
+        if self.stream_template.json_output:
+            raise ValueError(f"{stream_template!r} can not be streamed")
+        self.session: aiohttp.ClientSession | None = None
+
+    async def __aenter__(self) -> "OpenAIClient":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        await self.close()
+
+    async def start(self) -> None:
+        """Open the pooled HTTP session."""
+        connector = aiohttp.TCPConnector(
+            limit=self.pool_size,
+            limit_per_host=self.per_host_limit,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=self.timeout,
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": "Bearer " + self.api_key,
             },
-            {"role": "user", "content": f"'{prompt}' to {animal}"},
-        ],
-    }
+        )
+
+    async def close(self) -> None:
+        """Close the pooled HTTP session and all of its connections."""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def ask_gpt3(self, prompt: str, animal: str) -> tuple[str, str]:
+        """
+        Translate a text with ChatGPT.
+
+        Args:
+            prompt (str): The text to translate.
+            animal (str): The language to translate to.
+
+        Raises:
+            AnswerFormatError: If the answer does not match the template.
+
+        Returns:
+            tuple[str, str]: The detected source language and the translated text.
+        """
+        if self.session is None:
+            raise RuntimeError("OpenAIClient is not started")
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, headers=headers, json=data) as response:
-            response_data = await response.json()
+        data = {
+            "model": self.model,
+            **self.template.request(prompt, animal),
+        }
+        response_data = await self._post(data)
 
-            # Extract and return the generated answer
+        # Extract and return the generated answer
         answer = response_data["choices"][0]["message"]["content"]
+        with _ANSWER_PARSE.time():
+            return self.template.parse(answer)
+
+    async def stream_gpt3(self, prompt: str, animal: str) -> AsyncIterator[str]:
+        """
+        Translate a text with ChatGPT in stream mode.
+
+        Args:
+            prompt (str): The text to translate.
+            animal (str): The language to translate to.
+
+        Raises:
+            UpstreamError: If the stream breaks off.
+            AnswerFormatError: If a streamed chunk is malformed.
+
+        Yields:
+            str: The content deltas of the answer, see `AnswerStreamParser`.
+        """
+        if self.session is None:
+            raise RuntimeError("OpenAIClient is not started")
+
+        data = {
+            "model": self.model,
+            "stream": True,
+            **self.stream_template.request(prompt, animal),
+        }
+        # The admission slot is held until the stream is read.
+        admitted = self._hold(lambda: self._open(data), estimate_tokens(data))
+        async with admitted as response, response:
+            try:
+                async for line in response.content:
+                    line = line.strip()
+                    if not line.startswith(b"data:"):
+                        continue
+                    payload = line[len(b"data:") :].strip()
+                    if payload == b"[DONE]":
+                        break
+                    content = _stream_delta(payload)
+                    if content:
+                        yield content
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                raise UpstreamError(None, reason=f"OpenAI stream failed: {e!r}") from e
+
+    async def ask_batch(
+        self, tasks: list[tuple[str, str]]
+    ) -> dict[int, tuple[str, str]]:
+        """
+        Translate several texts with one ChatGPT call.
+
+        Args:
+            tasks (list[tuple[str, str]]): The (text, language) pairs to translate.
+
+        Returns:
+            dict[int, tuple[str, str]]: The detected source language and the
+                translated text by task index, malformed items are left out.
+        """
+        if self.session is None:
+            raise RuntimeError("OpenAIClient is not started")
+
+        payload = [
+            {"index": index, "text": prompt, "to": animal}
+            for index, (prompt, animal) in enumerate(tasks)
+        ]
+        data = {
+            "model": self.model,
+            "response_format": {"type": "json_object"},
+            "messages": [
+                {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+                {"role": "user", "content": json.dumps(payload, ensure_ascii=False)},
+            ],
+        }
+        response_data = await self._post(data)
+
+        answer = response_data["choices"][0]["message"]["content"]
+        with _ANSWER_PARSE.time():
+            return parse_batch_answer(answer, len(tasks))
+
+    async def _post(self, data: dict) -> dict:
+        estimated = estimate_tokens(data)
+        response_data = await self._admit(lambda: self._send(data), estimated)
+        usage = response_data.get("usage") or {}
+        if self.admission is not None:
+            self.admission.record_usage(estimated, usage.get("total_tokens", 0))
+        record_usage(response_data)
+        return response_data
+
+    async def _admit(self, send: Callable[[], Awaitable[T]], tokens: int) -> T:
+        if self.admission is None:
+            return await send()
+        return await self.admission.run(send, tokens)
+
+    @asynccontextmanager
+    async def _hold(
+        self, send: Callable[[], Awaitable[T]], tokens: int
+    ) -> AsyncIterator[T]:
+        if self.admission is None:
+            yield await send()
+            return
+        async with self.admission.hold(send, tokens) as result:
+            yield result
+
+    async def _send(self, data: dict) -> dict:
+        with _OPENAI_REQUEST.time():
+            response = await self._open(data)
+            async with response:
+                try:
+                    return await response.json()
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    raise UpstreamError(
+                        None, reason=f"OpenAI response failed: {e!r}"
+                    ) from e
+
+    async def _open(self, data: dict) -> aiohttp.ClientResponse:
+        try:
+            response = await self.session.post(self.url, json=data)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            OPENAI_RESPONSES.labels("error").inc()
+            raise UpstreamError(None, reason=f"OpenAI request failed: {e!r}") from e
+        OPENAI_RESPONSES.labels(str(response.status)).inc()
+        if response.status != 200:
+            response.release()
+            raise UpstreamError(
+                response.status, parse_retry_after(response.headers.get("Retry-After"))
+            )
+        return response
+
+
+def build_openai_client(
+    model: str | None = None, endpoint: str | None = None, gauges: bool = True
+) -> OpenAIClient:
+    """
+    Build the OpenAI client configured through environment variables.
+
+    API_KEY is required, OPENAI_URL sets the chat completions endpoint.
+
+    Args:
+        model (str | None): The chat model, OPENAI_MODEL by default.
+        endpoint (str | None): The chat completions endpoint, OPENAI_URL by
+            default.
+        gauges (bool): Whether the admission gauges report this client.
+
+    Returns:
+        OpenAIClient: The configured, not yet started client.
 
-        # Parsing of ChatGPT answer below
-        answer = re.split(r":|\n", answer)
-        answer_list = []
-        for a in answer:
-            if a.startswith(" "):
-                a = a[1:]
-            answer_list.append(a)
-        return (answer_list[1], answer_list[3])
+    Raises:
+        MissingEnvironmentVariable: If API_KEY is not set.
+    """
+    settings = get_settings()
+    return OpenAIClient(
+        api_key=settings.api_key,
+        url=endpoint or settings.openai_url,
+        model=model or settings.get("OPENAI_MODEL", "gpt-3.5-turbo"),
+        pool_size=settings.get_int("OPENAI_POOL_SIZE", 100),
+        per_host_limit=settings.get_int("OPENAI_POOL_PER_HOST", 0),
+        connect_timeout=settings.get_float("OPENAI_CONNECT_TIMEOUT", 5),
+        read_timeout=settings.get_float("OPENAI_READ_TIMEOUT", 60),
+        keepalive_timeout=settings.get_float("OPENAI_KEEPALIVE_TIMEOUT", 30),
+        admission=build_admission_controller(gauges),
+        template=settings.get("OPENAI_PROMPT_TEMPLATE", "compact"),
+        stream_template=settings.get("OPENAI_STREAM_PROMPT_TEMPLATE", "compact_lines"),
+    )
@@ -0,0 +1,366 @@
+"""
+Prompt templates for single translations and the parsers of their answers.
+
+A template is the system prompt, the rendering of the user message and the
+parser of the answer. The "legacy" template is the original few-shot prompt,
+"compact" asks for a JSON object in a fraction of the tokens and is the
+default, "compact_lines" keeps the line format that can be parsed while it
+is streamed.
+"""
+import json
+import math
+import re
+from functools import lru_cache
+from typing import Callable
+
+from pydantic import BaseModel, ValidationError, constr
+
+from app.admission import UpstreamError
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tiktoken is optional
+    tiktoken = None
+
+SYSTEM_PROMPT = """You are a translator that came from future and can translate from any language to any language, even from animal to animal.
+                You can translate any animal-like sound to another human language as well.
+                Send only plain-text translation, do not write anything but translation. Be creative with translation.
+                Always try to translate, even when specified species are very different from each other.
+
+                You must use this format of dialogue:
+                Receive: "Mooo! Mooo! to ENGLISH"
+                Answer: "Animal: Cow
+                         Translation: Hi, how are you?"
+
+                Receive: "Mooo! Mooo! to RUSSIAN"
+                Answer: "Animal: Cow
+                         Translation: Устал."
+
+                Receive: "Mooo! Mooo!? to COW"
+                Answer: "Animal: Cow
+                         Translation: Mooo! Mooo!?"
+
+                Receive: "Mooo! Mooo! to FISH"
+                Answer: "Animal: Cow
+                         Translation: Blob blob blob. Blob."
+
+                Receive: "'Hi, I am John' to ENGLISH"
+                Answer: "Animal: Human
+                         Translation: Hi, I am John"
+
+                Receive: "'Hi, I am John' to COW"
+                Answer: "Animal: Human
+                         Translation: Moooooooo!! Mooo."
+
+                Receive: "'Moooo.' to CAT"
+                Answer: "Animal: Cow
+                         Translation: Meow-meow."
+
+                When you will generate translate – look at it again, to be sure you are sending a good translation.
+
+                Your first translation task
+                Receive:
+                """
+
+BATCH_SYSTEM_PROMPT = """You are a translator that came from future and can translate from any language to any language, even from animal to animal.
+You can translate any animal-like sound to another human language as well. Be creative with translation.
+Always try to translate, even when specified species are very different from each other.
+
+You receive a JSON array of tasks: [{"index": 0, "text": "Mooo! Mooo!", "to": "ENGLISH"}, ...].
+Answer only with a JSON object with one entry per task, keeping its index:
+{"translations": [{"index": 0, "animal": "Cow", "translation": "Hi, how are you?"}, ...]}
+"animal" is the species or language the text came from, "translation" is the translated text.
+"""
+
+
+COMPACT_SYSTEM_PROMPT = """Translate the user's text into the "to" language. Any language or animal sound can be translated into any other, be creative.
+Reply only with JSON: {"animal": "<language or animal the text came from>", "translation": "<translated text>"}"""
+
+COMPACT_LINES_SYSTEM_PROMPT = """Translate the text into the given language. Any language or animal sound can be translated into any other, be creative.
+Reply only in this format:
+Animal: <language or animal the text came from>
+Translation: <translated text>"""
+
+_LINE_ANSWER = re.compile(
+    r"Animal\s*:[ \t]*(?P<animal>[^\n]*?)[ \t]*\n"
+    r"\s*Translation\s*:\s*(?P<translation>.*)",
+    re.DOTALL | re.IGNORECASE,
+)
+_CODE_FENCE = re.compile(r"^```(?:json)?\s*(?P<body>.*?)\s*```$", re.DOTALL)
+_WORDS = re.compile(r"\w+|[^\w\s]")
+
+
+class AnswerFormatError(UpstreamError):
+    """The answer of the model does not match the format of the prompt."""
+
+    def __init__(self, answer: str) -> None:
+        super().__init__(None, reason=f"Malformed OpenAI answer: {answer[:100]!r}")
+        self.answer = answer
+
+
+class Answer(BaseModel):
+    """Schema of the JSON answer of the "compact" template."""
+
+    animal: constr(strip_whitespace=True, min_length=1)
+    translation: constr(strip_whitespace=True, min_length=1)
+
+
+def parse_answer(answer: str) -> tuple[str, str]:
+    """
+    Parse a ChatGPT answer into the source language and the translation.
+
+    The labels are searched for, so colons and line breaks inside the
+    translation, text around the answer and quotes wrapping it are kept
+    apart from the parsed values.
+
+    Args:
+        answer (str): The "Animal: ... / Translation: ..." answer of the model.
+
+    Raises:
+        AnswerFormatError: If a label or a value is missing.
+
+    Returns:
+        tuple[str, str]: The detected source language and the translated text.
+    """
+    match = _LINE_ANSWER.search(answer)
+    if match is None:
+        raise AnswerFormatError(answer)
+    animal = match["animal"].strip().strip('"')
+    translation = match["translation"].strip()
+    if answer[: match.start()].rstrip().endswith('"'):
+        translation = translation.removesuffix('"').rstrip()
+    if not animal or not translation:
+        raise AnswerFormatError(answer)
+    return (animal, translation)
+
+
+def parse_json_answer(answer: str) -> tuple[str, str]:
+    """
+    Parse a JSON ChatGPT answer validated against `Answer`.
+
+    Args:
+        answer (str): The answer of the model, a code fence around it is allowed.
+
+    Raises:
+        AnswerFormatError: If the answer is not a JSON object of the schema.
+
+    Returns:
+        tuple[str, str]: The detected source language and the translated text.
+    """
+    text = answer.strip()
+    fence = _CODE_FENCE.match(text)
+    if fence is not None:
+        text = fence["body"]
+    try:
+        parsed = Answer.parse_obj(json.loads(text))
+    except (ValueError, ValidationError) as e:
+        raise AnswerFormatError(answer) from e
+    return (parsed.animal, parsed.translation)
+
+
+def parse_batch_answer(answer: str, size: int) -> dict[int, tuple[str, str]]:
+    """
+    Parse a batched ChatGPT answer.
+
+    Items that are missing or malformed are left out of the result, so the
+    caller can translate them one by one.
+
+    Args:
+        answer (str): The JSON answer of the model, see `BATCH_SYSTEM_PROMPT`.
+        size (int): The number of tasks sent in the batch.
+
+    Returns:
+        dict[int, tuple[str, str]]: The source language and the translated text
+            of every well-formed item, by task index.
+    """
+    try:
+        items = json.loads(answer)["translations"]
+    except (ValueError, TypeError, KeyError):
+        return {}
+    if not isinstance(items, list):
+        return {}
+
+    results = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        index = item.get("index")
+        animal = item.get("animal")
+        translation = item.get("translation")
+        if (
+            isinstance(index, int)
+            and 0 <= index < size
+            and isinstance(animal, str)
+            and animal
+            and isinstance(translation, str)
+            and translation
+        ):
+            results[index] = (animal, translation)
+    return results
+
+
+@lru_cache(maxsize=None)
+def _encoding():
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:  # the encoding is downloaded on first use
+        return None
+
+
+@lru_cache(maxsize=1024)
+def count_tokens(text: str) -> int:
+    """
+    Count the tokens of a text.
+
+    tiktoken is used when it is installed, otherwise the count is estimated
+    as one token per punctuation mark and per started four characters of a
+    word.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        int: The number of tokens.
+    """
+    encoding = _encoding() if tiktoken is not None else None
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return sum(math.ceil(len(word) / 4) for word in _WORDS.findall(text))
+
+
+def count_message_tokens(messages: list[dict]) -> int:
+    """
+    Count the prompt tokens of chat messages, framing of each message included.
+
+    Args:
+        messages (list[dict]): The chat messages.
+
+    Returns:
+        int: The number of tokens.
+    """
+    return sum(count_tokens(message["content"]) + 4 for message in messages) + 3
+
+
+class PromptTemplate:
+    """A system prompt, the rendering of the user message and the answer parser."""
+
+    def __init__(
+        self,
+        name: str,
+        system: str,
+        user: Callable[[str, str], str],
+        parse: Callable[[str], tuple[str, str]],
+        json_output: bool = False,
+    ) -> None:
+        """
+        Initialize a PromptTemplate object.
+
+        Args:
+            name (str): The name the template is registered under.
+            system (str): The system prompt.
+            user (Callable[[str, str], str]): Renders the user message from the
+                text and the language to translate to.
+            parse (Callable[[str], tuple[str, str]]): Parses the answer into the
+                source language and the translation.
+            json_output (bool): Whether the answer is requested as a JSON object.
+        """
+        self.name = name
+        self.system = system
+        self.user = user
+        self.parse = parse
+        self.json_output = json_output
+
+    @property
+    def system_tokens(self) -> int:
+        return count_tokens(self.system)
+
+    def request(self, text: str, language: str) -> dict:
+        """
+        Build the chat completion fields of a translation.
+
+        Args:
+            text (str): The text to translate.
+            language (str): The language to translate to.
+
+        Returns:
+            dict: The messages and, for JSON templates, the response format.
+        """
+        data = {
+            "messages": [
+                {"role": "system", "content": self.system},
+                {"role": "user", "content": self.user(text, language)},
+            ]
+        }
+        if self.json_output:
+            data["response_format"] = {"type": "json_object"}
+        return data
+
+
+TEMPLATES: dict[str, PromptTemplate] = {}
+
+
+def register_template(template: PromptTemplate) -> PromptTemplate:
+    """
+    Add a template to the registry, a template with the same name is replaced.
+
+    Args:
+        template (PromptTemplate): The template.
+
+    Returns:
+        PromptTemplate: The registered template.
+    """
+    TEMPLATES[template.name] = template
+    return template
+
+
+def get_template(name: str) -> PromptTemplate:
+    """
+    Get a registered template.
+
+    Args:
+        name (str): The template name.
+
+    Raises:
+        ValueError: If no template has this name.
+
+    Returns:
+        PromptTemplate: The template.
+    """
+    try:
+        return TEMPLATES[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown prompt template {name!r}, expected one of {sorted(TEMPLATES)}"
+        ) from None
+
+
+def _quoted(text: str, language: str) -> str:
+    return f"'{text}' to {language}"
+
+
+def _json_task(text: str, language: str) -> str:
+    return json.dumps({"text": text, "to": language}, ensure_ascii=False)
+
+
+def _labelled(text: str, language: str) -> str:
+    return f"To {language}: {text}"
+
+
+register_template(PromptTemplate("legacy", SYSTEM_PROMPT, _quoted, parse_answer))
+register_template(
+    PromptTemplate(
+        "compact",
+        COMPACT_SYSTEM_PROMPT,
+        _json_task,
+        parse_json_answer,
+        json_output=True,
+    )
+)
+register_template(
+    PromptTemplate(
+        "compact_lines",
+        COMPACT_LINES_SYSTEM_PROMPT,
+        _labelled,
+        parse_answer,
+    )
+)
@@ -0,0 +1,200 @@
+"""
+Background deletion of languages with many translations.
+
+Deleting a language in one statement deletes all its translations in one
+transaction, which holds their row locks, and on SQLite the write lock, until
+the last one is gone. A purge deletes the translations from and to the
+language in short transactions of `batch_size` rows with a pause between them,
+so concurrent writes wait for one batch at most. Batches skip rows locked
+by other transactions, so the language itself is deleted last, once a batch
+deletes nothing and a count finds no translation left. The ON DELETE CASCADE
+rule takes the translations inserted meanwhile.
+
+Purges run in the process that started them and report their progress there.
+A purge stopped by a restart leaves a language with fewer translations, it is
+finished by purging the language again.
+"""
+import asyncio
+import logging
+import time
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.config import get_settings
+from app.crud import Delete, Read
+from app.registry import LanguageRegistry
+
+logger = logging.getLogger(__name__)
+
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class Purge:
+    """Progress of the purge of one language."""
+
+    def __init__(self, language: str) -> None:
+        self.language = language
+        self.status = RUNNING
+        self.deleted = 0
+        self.batches = 0
+        self.error: str | None = None
+        self.started_at = time.monotonic()
+        self.finished_at: float | None = None
+
+    def elapsed(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+
+class LanguagePurger:
+    """Runs purges of languages as tasks of the current process."""
+
+    def __init__(
+        self,
+        session_maker: async_sessionmaker,
+        language_registry: LanguageRegistry | None = None,
+        batch_size: int = 1000,
+        pause: float = 0.01,
+    ) -> None:
+        """
+        Initialize a LanguagePurger object.
+
+        Args:
+            session_maker (async_sessionmaker): The factory for database sessions.
+            language_registry (LanguageRegistry | None): The registry told
+                about deleted languages.
+            batch_size (int): The maximum number of translations deleted per
+                transaction.
+            pause (float): The time in seconds between two batches.
+        """
+        self.session_maker = session_maker
+        self.language_registry = language_registry
+        self.batch_size = batch_size
+        self.pause = pause
+        self.purges: dict[str, Purge] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+
+    async def __aenter__(self) -> "LanguagePurger":
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """Stop the running purges, the batches deleted so far stay deleted."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = {}
+
+    async def start(self, language: str) -> Purge | None:
+        """
+        Start purging a language, unless a purge of it is running.
+
+        Args:
+            language (str): The name of the language.
+
+        Returns:
+            Purge | None: The progress of the purge, or None if the language
+                does not exist.
+        """
+        purge = self.purges.get(language)
+        if purge is not None and purge.status == RUNNING:
+            return purge
+        if await Read(self.session_maker()).get_language(language) is None:
+            return None
+        purge = self.purges[language] = Purge(language)
+        self._tasks[language] = asyncio.create_task(self._run(purge))
+        return purge
+
+    def get(self, language: str) -> Purge | None:
+        """
+        Get the progress of the latest purge of a language.
+
+        Args:
+            language (str): The name of the language.
+
+        Returns:
+            Purge | None: The progress, or None if this process did not purge
+                the language.
+        """
+        return self.purges.get(language)
+
+    def stats(self) -> dict:
+        """
+        Get purge counters.
+
+        Returns:
+            dict: The number of purges by status and of deleted translations.
+        """
+        statuses = [purge.status for purge in self.purges.values()]
+        return {
+            "running": statuses.count(RUNNING),
+            "done": statuses.count(DONE),
+            "failed": statuses.count(FAILED),
+            "deleted": sum(purge.deleted for purge in self.purges.values()),
+        }
+
+    async def _run(self, purge: Purge) -> None:
+        try:
+            while True:
+                deleted = await Delete(
+                    self.session_maker()
+                ).delete_language_translations(purge.language, self.batch_size)
+                purge.deleted += deleted
+                purge.batches += 1
+                # A short batch may have skipped locked rows, only an empty
+                # batch and a count that waits for no lock mean it is done.
+                if not deleted and await self._delete_language(purge):
+                    break
+                await asyncio.sleep(self.pause)
+            purge.status = DONE
+        except Exception as e:
+            logger.exception("Purge of language %s failed", purge.language)
+            purge.status = FAILED
+            purge.error = f"Purge failed: {type(e).__name__}"
+        finally:
+            purge.finished_at = time.monotonic()
+            if self.language_registry is not None:
+                self.language_registry.invalidate()
+
+    async def _delete_language(self, purge: Purge) -> bool:
+        if await Read(self.session_maker()).count_language_translations(purge.language):
+            return False
+        try:
+            await Delete(self.session_maker()).delete_language(purge.language)
+        except IntegrityError:
+            # Translations inserted meanwhile, and foreign keys without
+            # ON DELETE CASCADE: they go with the next batch.
+            return False
+        return True
+
+
+def build_language_purger(
+    session_maker: async_sessionmaker,
+    language_registry: LanguageRegistry | None = None,
+) -> LanguagePurger:
+    """
+    Build the language purger configured through environment variables.
+
+    LANGUAGE_PURGE_BATCH_SIZE sets the number of translations deleted per
+    transaction, LANGUAGE_PURGE_PAUSE_MS the pause between two batches.
+
+    Args:
+        session_maker (async_sessionmaker): The factory for database sessions.
+        language_registry (LanguageRegistry | None): The registry told about
+            deleted languages.
+
+    Returns:
+        LanguagePurger: The purger.
+    """
+    settings = get_settings()
+    return LanguagePurger(
+        session_maker,
+        language_registry,
+        batch_size=settings.get_int("LANGUAGE_PURGE_BATCH_SIZE", 1000),
+        pause=settings.get_float("LANGUAGE_PURGE_PAUSE_MS", 10) / 1000,
+    )
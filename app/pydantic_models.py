@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic import BaseModel
 
 
@@ -23,6 +25,8 @@ class TranslateOutput(BaseModel):
     id: int
     translated_from: str
     text: str
+    # "stored" when an earlier translation of the same text was returned.
+    source: Literal["model", "cache", "memory", "stored"] = "model"
 
 
 class SpeechOutput(BaseModel):
@@ -31,3 +35,34 @@ class SpeechOutput(BaseModel):
     translated_language: str
     text: str
     translated_text: str
+
+
+class SearchOutput(SpeechOutput):
+    rank: float
+
+
+class JobOutput(BaseModel):
+    id: int
+    status: Literal["pending", "running", "done", "failed"]
+    attempts: int
+    error: str | None = None
+    translation: TranslateOutput | None = None
+
+
+class PurgeOutput(BaseModel):
+    language: str
+    status: Literal["running", "done", "failed"]
+    deleted: int
+    batches: int
+    elapsed: float
+    error: str | None = None
+
+
+class TranslationStatusOutput(BaseModel):
+    id: int
+    status: Literal["updated", "deleted", "not_found"]
+
+
+class LanguageStatusOutput(BaseModel):
+    language: str
+    status: Literal["deleted", "not_found"]
@@ -0,0 +1,137 @@
+import asyncio
+import hashlib
+import time
+from typing import Callable, Iterable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import get_settings
+from app.crud import Read
+
+
+class LanguageRegistry:
+    """
+    In-process copy of the language table.
+
+    The names are loaded lazily on first use and reloaded after an
+    invalidation or once `ttl` seconds have passed, which bounds how stale a
+    worker can be when another worker changes the table. The ETag is derived
+    from the content, so it is the same in every worker.
+    """
+
+    def __init__(
+        self, ttl: float = 60.0, clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        """
+        Initialize a LanguageRegistry object.
+
+        Args:
+            ttl (float): The time in seconds the loaded names stay valid.
+            clock (Callable[[], float]): The time source, used by tests.
+        """
+        self.ttl = ttl
+        self.clock = clock
+        self.loads = 0
+        self._names: frozenset[str] | None = None
+        self._sorted: list[str] = []
+        self._etag = ""
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._names is not None and (self.clock() - self._loaded_at < self.ttl)
+
+    async def names(self, session: AsyncSession) -> list[str]:
+        """
+        Get all language names, loading them if needed.
+
+        Args:
+            session (AsyncSession): The session used to load the names.
+
+        Returns:
+            list[str]: The sorted language names.
+        """
+        await self._ensure_loaded(session)
+        return self._sorted
+
+    async def contains(self, session: AsyncSession, name: str) -> bool:
+        """
+        Check whether a language exists, loading the names if needed.
+
+        Args:
+            session (AsyncSession): The session used to load the names.
+            name (str): The name of the language.
+
+        Returns:
+            bool: True if the language exists.
+        """
+        await self._ensure_loaded(session)
+        return name in self._names
+
+    async def etag(self, session: AsyncSession) -> str:
+        """
+        Get the ETag of the language list, loading the names if needed.
+
+        Args:
+            session (AsyncSession): The session used to load the names.
+
+        Returns:
+            str: The quoted ETag of the current language list.
+        """
+        await self._ensure_loaded(session)
+        return self._etag
+
+    def knows(self, names: Iterable[str]) -> bool:
+        """
+        Check whether the languages are known without touching the database.
+
+        Args:
+            names (Iterable[str]): The language names.
+
+        Returns:
+            bool: True if the names are loaded and all of them exist.
+        """
+        return self.loaded and all(name in self._names for name in names)
+
+    def add(self, *names: str) -> None:
+        """
+        Record languages that were registered in the database.
+
+        Args:
+            *names (str): The names of the registered languages.
+        """
+        if self._names is not None and not self._names.issuperset(names):
+            self._set(self._names.union(names))
+
+    def invalidate(self) -> None:
+        """Drop the loaded names, they are reloaded on next use."""
+        self._names = None
+
+    async def _ensure_loaded(self, session: AsyncSession) -> None:
+        if self.loaded:
+            return
+        async with self._lock:
+            if self.loaded:
+                return
+            names = await Read(session).get_all_language_names()
+            self.loads += 1
+            self._set(frozenset(names))
+            self._loaded_at = self.clock()
+
+    def _set(self, names: frozenset[str]) -> None:
+        self._names = names
+        self._sorted = sorted(names)
+        digest = hashlib.sha1("\n".join(self._sorted).encode()).hexdigest()
+        self._etag = f'"{digest}"'
+
+
+def configure_language_registry(registry: LanguageRegistry) -> None:
+    """
+    Apply the environment variables to a registry, LANGUAGE_REGISTRY_TTL sets
+    its TTL.
+
+    Args:
+        registry (LanguageRegistry): The registry, usually built at import.
+    """
+    registry.ttl = get_settings().get_float("LANGUAGE_REGISTRY_TTL", 60)
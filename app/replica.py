@@ -0,0 +1,161 @@
+import time
+from typing import Callable
+
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import get_settings
+
+# Cookie set on responses to writes, reads carrying it go to the primary.
+STICKY_COOKIE = "read_primary"
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+class ReplicaRouter:
+    """
+    Route read-only queries to a replica.
+
+    Clients that wrote within the last `sticky_window` seconds read from the
+    primary, so they see their own writes despite replication lag. When a
+    replica connection cannot be opened the replica is skipped for
+    `retry_interval` seconds and reads fall back to the primary.
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        sticky_window: float = 5.0,
+        retry_interval: float = 5.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """
+        Initialize a ReplicaRouter object.
+
+        Args:
+            engine (AsyncEngine): The engine of the replica.
+            sticky_window (float): The time in seconds a client reads from the
+                primary after a write.
+            retry_interval (float): The time in seconds a failed replica is
+                skipped.
+            clock (Callable[[], float]): The time source, used by tests.
+        """
+        self.engine = engine
+        self.sticky_window = sticky_window
+        self.retry_interval = retry_interval
+        self.clock = clock
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self.failures = 0
+        self._down_until = 0.0
+
+    @property
+    def available(self) -> bool:
+        return self.clock() >= self._down_until
+
+    async def connect(self, connection: HTTPConnection) -> AsyncConnection | None:
+        """
+        Open a replica connection for a read-only request.
+
+        Args:
+            connection (HTTPConnection): The request.
+
+        Returns:
+            AsyncConnection | None: The replica connection, or None if the
+                request must be served by the primary.
+        """
+        if STICKY_COOKIE in connection.cookies or not self.available:
+            self.primary_reads += 1
+            return None
+        try:
+            replica_connection = await self.engine.connect()
+        except (DBAPIError, OSError):
+            self.failures += 1
+            self.primary_reads += 1
+            self._down_until = self.clock() + self.retry_interval
+            return None
+        self.replica_reads += 1
+        return replica_connection
+
+    def stats(self) -> dict:
+        """
+        Get routing counters.
+
+        Returns:
+            dict: The number of reads served by the replica and by the
+                primary, of failed replica connections and the replica state.
+        """
+        return {
+            "replica_reads": self.replica_reads,
+            "primary_reads": self.primary_reads,
+            "failures": self.failures,
+            "available": self.available,
+        }
+
+
+class StickyPrimaryMiddleware:
+    """
+    ASGI middleware marking clients that wrote to read from the primary.
+
+    Without a `sticky_window` the middleware follows the replica router of the
+    application state, it marks nobody while no replica is configured.
+    """
+
+    def __init__(self, app: ASGIApp, sticky_window: float | None = None) -> None:
+        self.app = app
+        self.sticky_window = sticky_window
+
+    def cookie(self, scope: Scope) -> str | None:
+        sticky_window = self.sticky_window
+        if sticky_window is None:
+            state = getattr(scope.get("app"), "state", None)
+            router = getattr(state, "replica_router", None)
+            if router is None:
+                return None
+            sticky_window = router.sticky_window
+        return (
+            f"{STICKY_COOKIE}=1; Max-Age={max(1, round(sticky_window))}; "
+            "Path=/; HttpOnly; SameSite=Lax"
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+        cookie = self.cookie(scope)
+        if cookie is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                MutableHeaders(scope=message).append("set-cookie", cookie)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+def build_replica_router(engine: AsyncEngine | None) -> ReplicaRouter | None:
+    """
+    Build the replica router configured through environment variables.
+
+    READ_YOUR_WRITES_WINDOW sets the time in seconds a client reads from the
+    primary after a write, REPLICA_RETRY_INTERVAL the time a failed replica
+    is skipped.
+
+    Args:
+        engine (AsyncEngine | None): The engine of the replica, if configured.
+
+    Returns:
+        ReplicaRouter | None: The router, or None without a replica.
+    """
+    if engine is None:
+        return None
+    settings = get_settings()
+    return ReplicaRouter(
+        engine,
+        sticky_window=settings.get_float("READ_YOUR_WRITES_WINDOW", 5),
+        retry_interval=settings.get_float("REPLICA_RETRY_INTERVAL", 5),
+    )
@@ -0,0 +1,73 @@
+"""
+Fast JSON responses for read endpoints.
+
+Read endpoints select only the columns they return and encode the rows in
+one pass, instead of building a Pydantic object per row that FastAPI then
+validates and encodes again with the standard json module. The endpoints
+keep their return annotations, so the OpenAPI schemas are unchanged.
+
+orjson is used when it is installed, with the standard json module as the
+fallback.
+"""
+import json
+from typing import Any, Iterable, Sequence
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Encode a value as compact UTF-8 JSON.
+
+    Args:
+        content (Any): The value, made of dicts, lists, strings and numbers.
+
+    Returns:
+        bytes: The JSON document.
+    """
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def records(fields: Sequence[str], rows: Iterable[Sequence]) -> list[dict]:
+    """
+    Turn rows into JSON objects.
+
+    Args:
+        fields (Sequence[str]): The keys, in the order of the row values.
+        rows (Iterable[Sequence]): The rows, e.g. SQLAlchemy Row tuples.
+
+    Returns:
+        list[dict]: One object per row.
+    """
+    return [dict(zip(fields, row)) for row in rows]
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response encoded with `dumps`, the content is not validated."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def rows_response(
+    fields: Sequence[str], rows: Iterable[Sequence], headers: dict | None = None
+) -> FastJSONResponse:
+    """
+    Build a response with a JSON array of row objects.
+
+    Args:
+        fields (Sequence[str]): The keys, in the order of the row values.
+        rows (Iterable[Sequence]): The rows.
+        headers (dict | None): Headers of the response.
+
+    Returns:
+        FastJSONResponse: The response.
+    """
+    return FastJSONResponse(records(fields, rows), headers=headers)
@@ -0,0 +1,259 @@
+"""
+Translation cache shared by the worker processes of a host.
+
+The cache is a hash table in a memory-mapped file. Every worker maps the same
+file, so a translation cached by one worker is a hit for all of them, and the
+entries survive worker restarts. The file size is the byte budget: it is cut
+into fixed-size slots, an entry that does not fit in a slot is not cached.
+
+Layout: a header page, then `slots` slots of `slot_size` bytes. The header
+counts the filled slots, so the size of the cache is known without a scan. A key hashes
+to a window of `PROBE` consecutive slots, a new entry replaces the same key,
+an empty or expired slot, or else the slot written longest ago in its window.
+
+Reads take no lock. Every slot starts with a sequence number that a writer
+makes odd while it rewrites the slot and even again when it is done (a
+seqlock), a reader copies the slot and retries if the number was odd or
+changed meanwhile. A checksum of the entry guards against the remaining torn
+reads. Writers of different processes exclude each other with an fcntl record
+lock on the byte range of the slot, so writes to different slots do not wait
+for each other.
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import time
+import zlib
+from typing import Callable
+
+from app.cache import CachedTranslation, CacheKey, TranslationCache
+
+MAGIC = b"TRCACHE2"
+# magic, slot size, number of slots
+_HEADER = struct.Struct("<8sII")
+# number of filled slots, after the header fields
+_FILLED = struct.Struct("<Q")
+FILLED_OFFSET = _HEADER.size
+HEADER_SIZE = mmap.PAGESIZE
+# sequence, checksum, key hash, expiry, write time, key length, value length
+_SLOT = struct.Struct("<IIQddHH")
+_SEQUENCE = struct.Struct("<I")
+PROBE = 8
+READ_RETRIES = 4
+
+
+def _encode(first: str, second: str) -> bytes | None:
+    if "\0" in first or "\0" in second:
+        return None
+    return f"{first}\0{second}".encode()
+
+
+def _decode(data: bytes) -> tuple[str, str]:
+    first, second = data.decode().split("\0", 1)
+    return first, second
+
+
+class SharedTranslationCache(TranslationCache):
+    """Cache tier in a memory-mapped file shared by all processes of a host."""
+
+    def __init__(
+        self,
+        path: str,
+        size: int = 64 << 20,
+        slot_size: int = 1024,
+        ttl: float = 3600.0,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        """
+        Initialize a SharedTranslationCache object.
+
+        An existing file with the same layout is reused with its entries,
+        otherwise the file is created or reset.
+
+        Args:
+            path (str): The cache file, e.g. on /dev/shm for a RAM-only cache.
+            size (int): The byte budget of the file.
+            slot_size (int): The bytes per entry, header included.
+            ttl (float): The time in seconds an entry stays valid.
+            clock (Callable[[], float]): The wall clock time source, shared
+                by all processes.
+        """
+        super().__init__()
+        if slot_size <= _SLOT.size:
+            raise ValueError(f"slot_size must be larger than {_SLOT.size}")
+        self.path = path
+        self.slot_size = slot_size
+        self.slots = max(PROBE, (size - HEADER_SIZE) // slot_size)
+        self.ttl = ttl
+        self.clock = clock
+        self.evictions = 0
+        self.too_large = 0
+        self.torn_reads = 0
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        length = HEADER_SIZE + self.slots * slot_size
+        # Workers starting together must not reset the file twice.
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            header = os.pread(self._fd, _HEADER.size, 0)
+            if header != _HEADER.pack(MAGIC, slot_size, self.slots):
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, length)
+                os.pwrite(self._fd, _HEADER.pack(MAGIC, slot_size, self.slots), 0)
+            self._map = mmap.mmap(self._fd, length)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        """Unmap and close the cache file, the entries stay in the file."""
+        self._map.close()
+        os.close(self._fd)
+
+    async def _get(self, key: CacheKey) -> CachedTranslation | None:
+        key_bytes = _encode(*key)
+        if key_bytes is None:
+            return None
+        key_hash = self._hash(key_bytes)
+        now = self.clock()
+        for offset in self._window(key_hash):
+            entry = self._read(offset, key_hash)
+            if entry is None:
+                continue
+            slot_hash, expires_at, _, payload, key_length = entry
+            if slot_hash == 0:
+                # Slots are never emptied, the key would be stored before.
+                return None
+            if slot_hash == key_hash and payload[:key_length] == key_bytes:
+                if expires_at <= now:
+                    return None
+                return _decode(payload[key_length:])
+        return None
+
+    async def _set(self, key: CacheKey, value: CachedTranslation) -> None:
+        key_bytes = _encode(*key)
+        value_bytes = _encode(*value)
+        if key_bytes is None or value_bytes is None:
+            return
+        if _SLOT.size + len(key_bytes) + len(value_bytes) > self.slot_size:
+            self.too_large += 1
+            return
+        key_hash = self._hash(key_bytes)
+        now = self.clock()
+        target, oldest, evicts = None, None, False
+        for offset in self._window(key_hash):
+            entry = self._read(offset, key_hash)
+            if entry is None:
+                target = target or offset
+                continue
+            slot_hash, expires_at, written_at, payload, key_length = entry
+            if slot_hash == key_hash and payload[:key_length] == key_bytes:
+                target, evicts = offset, False
+                break
+            if slot_hash == 0 or expires_at <= now:
+                target = target or offset
+            elif oldest is None or written_at < oldest[1]:
+                oldest = (offset, written_at)
+        if target is None:
+            target, evicts = oldest[0], True
+        self._write(target, key_hash, now + self.ttl, now, key_bytes, value_bytes)
+        self.evictions += evicts
+
+    def stats(self) -> dict:
+        # Slots are never emptied, expired entries count until replaced.
+        (size,) = _FILLED.unpack_from(self._map, FILLED_OFFSET)
+        return {
+            **super().stats(),
+            "size": size,
+            "slots": self.slots,
+            "evictions": self.evictions,
+            "too_large": self.too_large,
+            "torn_reads": self.torn_reads,
+        }
+
+    @staticmethod
+    def _hash(key_bytes: bytes) -> int:
+        # 0 marks an empty slot.
+        digest = hashlib.blake2b(key_bytes, digest_size=8).digest()
+        return int.from_bytes(digest, "little") or 1
+
+    def _window(self, key_hash: int) -> list[int]:
+        first = key_hash % self.slots
+        return [
+            HEADER_SIZE + (first + step) % self.slots * self.slot_size
+            for step in range(PROBE)
+        ]
+
+    def _read(
+        self, offset: int, key_hash: int
+    ) -> tuple[int, float, float, bytes, int] | None:
+        # The payload is only copied from slots holding `key_hash`. None if
+        # the slot is being written, its entry is treated as missing.
+        for _ in range(READ_RETRIES):
+            (
+                before,
+                checksum,
+                slot_hash,
+                expires_at,
+                written_at,
+                key_length,
+                value_length,
+            ) = _SLOT.unpack_from(self._map, offset)
+            if before % 2:
+                continue
+            payload = b""
+            if slot_hash == key_hash:
+                start = offset + _SLOT.size
+                end = min(start + key_length + value_length, offset + self.slot_size)
+                payload = self._map[start:end]
+            (after,) = _SEQUENCE.unpack_from(self._map, offset)
+            if before != after:
+                continue
+            if payload and zlib.crc32(payload) != checksum:
+                continue
+            return slot_hash, expires_at, written_at, payload, key_length
+        self.torn_reads += 1
+        return None
+
+    def _count_filled_slot(self) -> None:
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, _FILLED.size, FILLED_OFFSET)
+        try:
+            (filled,) = _FILLED.unpack_from(self._map, FILLED_OFFSET)
+            _FILLED.pack_into(self._map, FILLED_OFFSET, filled + 1)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, _FILLED.size, FILLED_OFFSET)
+
+    def _write(
+        self,
+        offset: int,
+        key_hash: int,
+        expires_at: float,
+        written_at: float,
+        key_bytes: bytes,
+        value_bytes: bytes,
+    ) -> None:
+        payload = key_bytes + value_bytes
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, self.slot_size, offset)
+        try:
+            (sequence,) = _SEQUENCE.unpack_from(self._map, offset)
+            if not _SLOT.unpack_from(self._map, offset)[2]:
+                self._count_filled_slot()
+            sequence |= 1
+            _SEQUENCE.pack_into(self._map, offset, sequence)
+            _SLOT.pack_into(
+                self._map,
+                offset,
+                sequence,
+                zlib.crc32(payload),
+                key_hash,
+                expires_at,
+                written_at,
+                len(key_bytes),
+                len(value_bytes),
+            )
+            self._map[
+                offset + _SLOT.size : offset + _SLOT.size + len(payload)
+            ] = payload
+            _SEQUENCE.pack_into(self._map, offset, (sequence + 1) & 0xFFFFFFFF)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, self.slot_size, offset)
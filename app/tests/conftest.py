@@ -0,0 +1,19 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.database import init_models
+
+
+@pytest_asyncio.fixture
+async def engine(tmp_path):
+    # A file, so concurrent sessions get their own connections.
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/test.db")
+    await init_models(engine)
+    yield engine
+    await engine.dispose()
+
+
+@pytest.fixture
+def maker(engine):
+    return async_sessionmaker(engine, expire_on_commit=False)
@@ -0,0 +1,176 @@
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app.admission import (
+    AdaptiveLimiter,
+    AdmissionController,
+    CircuitBreaker,
+    TokenBucket,
+    UpstreamError,
+    parse_retry_after,
+)
+from app.openai import OpenAIClient
+from benchmarks.mock_openai import make_app, start_server
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("2") == 2.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(per_minute=6000)
+    bucket.tokens = 0
+    started = time.perf_counter()
+    await bucket.acquire(1)
+    assert time.perf_counter() - started >= 0.009
+
+
+def test_limiter_increases_additively_and_decreases_once_per_cooldown():
+    clock = FakeClock()
+    limiter = AdaptiveLimiter(initial=4, minimum=1, maximum=8, clock=clock)
+    for _ in range(4):
+        limiter.increase()
+    assert int(limiter.limit) == 4
+    limiter.increase()
+    assert int(limiter.limit) == 5
+
+    limiter.decrease()
+    limiter.decrease()
+    assert int(limiter.limit) == 2
+    clock.now = 1
+    limiter.decrease()
+    assert int(limiter.limit) == 1
+
+
+def test_circuit_breaker_opens_and_recovers():
+    clock = FakeClock()
+    breaker = CircuitBreaker(threshold=2, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    breaker.check()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(UpstreamError) as error:
+        breaker.check()
+    assert error.value.retry_after == 10
+
+    clock.now = 10
+    breaker.check()
+    # Only one trial call is let through while half-open.
+    with pytest.raises(UpstreamError) as error:
+        breaker.check()
+    assert error.value.retry_after == 1
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_client_retries_throttled_calls():
+    mock = make_app(error_rate=0.5, seed=0)
+    runner, url = await start_server(mock)
+    admission = AdmissionController(
+        limiter=AdaptiveLimiter(initial=8),
+        breaker=CircuitBreaker(threshold=100),
+        max_retries=20,
+        base_delay=0.001,
+        max_delay=0.01,
+    )
+    try:
+        async with OpenAIClient("key", url=url, admission=admission) as client:
+            for _ in range(10):
+                assert await client.ask_gpt3("Moo", "English") == (
+                    "Human",
+                    "Meow meow.",
+                )
+    finally:
+        await runner.cleanup()
+
+    assert mock["errors"] > 0
+    assert mock["calls"] == 10 + mock["errors"]
+    assert admission.limiter.limit < 8
+
+
+@pytest.mark.asyncio
+async def test_hold_keeps_the_slot_until_the_block_exits():
+    breaker = CircuitBreaker(threshold=1)
+    admission = AdmissionController(breaker=breaker)
+
+    async def send():
+        return "response"
+
+    async with admission.hold(send) as response:
+        assert response == "response"
+        assert admission.limiter.in_flight == 1
+    assert admission.limiter.in_flight == 0
+    assert breaker.state == "closed"
+
+    with pytest.raises(UpstreamError):
+        async with admission.hold(send):
+            raise UpstreamError(None, reason="Stream broke off")
+    assert admission.limiter.in_flight == 0
+    assert breaker.state == "open"
+
+
+@pytest.mark.asyncio
+async def test_client_holds_the_slot_while_streaming():
+    mock = make_app()
+    runner, url = await start_server(mock)
+    admission = AdmissionController()
+    in_flight = []
+    try:
+        async with OpenAIClient("key", url=url, admission=admission) as client:
+            async for _ in client.stream_gpt3("Moo", "English"):
+                in_flight.append(admission.limiter.in_flight)
+    finally:
+        await runner.cleanup()
+
+    assert in_flight and set(in_flight) == {1}
+    assert admission.limiter.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_client_gives_up_after_max_retries():
+    mock = make_app(error_rate=1, seed=0)
+    runner, url = await start_server(mock)
+    admission = AdmissionController(max_retries=2, base_delay=0.001, max_delay=0.01)
+    try:
+        async with OpenAIClient("key", url=url, admission=admission) as client:
+            with pytest.raises(UpstreamError) as error:
+                await client.ask_gpt3("Moo", "English")
+    finally:
+        await runner.cleanup()
+
+    assert error.value.status == 429
+    assert mock["calls"] == 3
+
+
+@pytest.mark.asyncio
+async def test_upstream_error_is_a_503_with_retry_after():
+    from app import main
+    from app.pydantic_models import TranslateInput
+
+    class ThrottledTranslator:
+        async def translate(self, text, language):
+            raise UpstreamError(429, 2.5)
+
+    with pytest.raises(HTTPException) as error:
+        await main.translation(
+            TranslateInput(text="Moo", translate_to_language="English"),
+            ThrottledTranslator(),
+        )
+
+    assert error.value.status_code == 503
+    assert error.value.headers == {"Retry-After": "3"}
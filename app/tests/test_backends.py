@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from app.admission import UpstreamError
+from app.backends import HedgedBackend, RuleBasedBackend, UnsupportedTranslation
+
+
+class FakeBackend:
+    def __init__(self, name: str, delay: float = 0.0, fail: bool = False) -> None:
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+        self.cancelled = 0
+
+    async def ask_gpt3(self, prompt, animal):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.fail:
+            raise UpstreamError(500)
+        return (self.name, prompt)
+
+
+def test_rule_based_backend():
+    backend = RuleBasedBackend()
+
+    assert backend.translate("Mooo! Moo moooo?", "Cat") == ("Cow", "Meow! Meow meow?")
+    assert backend.translate("Hi, I am John", "Dog") == (
+        "Human",
+        "Woof, Woof woof Woof",
+    )
+    assert backend.translate("Meow", "cat") == ("Cat", "Meow")
+    with pytest.raises(UnsupportedTranslation):
+        backend.translate("Mooo!", "English")
+
+
+@pytest.mark.asyncio
+async def test_fast_primary_is_not_hedged():
+    primary, secondary = FakeBackend("primary"), FakeBackend("secondary")
+    hedged = HedgedBackend({"primary": primary, "secondary": secondary})
+
+    assert await hedged.ask_gpt3("Moo", "English") == ("primary", "Moo")
+    assert secondary.calls == 0
+    assert hedged.hedges == 0
+
+
+@pytest.mark.asyncio
+async def test_slow_primary_is_hedged_and_cancelled():
+    primary = FakeBackend("primary", delay=10)
+    secondary = FakeBackend("secondary", delay=0.01)
+    hedged = HedgedBackend(
+        {"primary": primary, "secondary": secondary}, default_delay=0.02
+    )
+
+    assert await hedged.ask_gpt3("Moo", "English") == ("secondary", "Moo")
+    assert primary.cancelled == 1
+    assert hedged.stats()["hedge_wins"] == 1
+    # The cancelled call counts as a lower bound of the primary latency.
+    assert len(hedged.latency["primary"].samples) == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_primary_fails_over_at_once():
+    primary = FakeBackend("primary", fail=True)
+    secondary = FakeBackend("secondary")
+    hedged = HedgedBackend(
+        {"primary": primary, "secondary": secondary}, default_delay=10
+    )
+
+    assert await asyncio.wait_for(hedged.ask_gpt3("Moo", "English"), 1) == (
+        "secondary",
+        "Moo",
+    )
+
+    secondary.fail = True
+    with pytest.raises(UpstreamError):
+        await hedged.ask_gpt3("Moo", "English")
+
+
+def test_hedge_delay_follows_primary_latency():
+    hedged = HedgedBackend(
+        {"primary": FakeBackend("primary"), "secondary": FakeBackend("secondary")},
+        min_delay=0.05,
+        default_delay=2.0,
+        min_samples=20,
+    )
+    assert hedged.hedge_delay() == 2.0
+
+    for index in range(100):
+        hedged.latency["primary"].observe((index + 1) / 100)
+    assert hedged.hedge_delay() == pytest.approx(0.96)
+
+    hedged.latency["primary"].samples.clear()
+    for _ in range(20):
+        hedged.latency["primary"].observe(0.001)
+    assert hedged.hedge_delay() == 0.05
@@ -0,0 +1,86 @@
+import asyncio
+import json
+
+import pytest
+
+from app.batching import TranslationBatcher
+from app.openai import parse_batch_answer
+
+
+class FakeOpenAIClient:
+    def __init__(self, malformed: set[int] = frozenset()) -> None:
+        self.malformed = malformed
+        self.batches = []
+        self.single_calls = []
+
+    async def ask_batch(self, tasks):
+        self.batches.append(tasks)
+        return {
+            index: ("Human", f"{prompt} in {animal}")
+            for index, (prompt, animal) in enumerate(tasks)
+            if index not in self.malformed
+        }
+
+    async def ask_gpt3(self, prompt, animal):
+        self.single_calls.append((prompt, animal))
+        return "Human", f"{prompt} in {animal} (single)"
+
+
+def test_parse_batch_answer_skips_malformed_items():
+    answer = json.dumps(
+        {
+            "translations": [
+                {"index": 0, "animal": "Cow", "translation": "Hi"},
+                {"index": 1, "animal": "Cat"},
+                {"index": 7, "animal": "Dog", "translation": "Woof"},
+                "garbage",
+            ]
+        }
+    )
+
+    assert parse_batch_answer(answer, 3) == {0: ("Cow", "Hi")}
+    assert parse_batch_answer("not json", 3) == {}
+
+
+@pytest.mark.asyncio
+async def test_requests_are_sent_in_one_batch():
+    client = FakeOpenAIClient()
+    async with TranslationBatcher(client, max_size=3, window=1) as batcher:
+        results = await asyncio.gather(
+            batcher.ask_gpt3("a", "Cat"),
+            batcher.ask_gpt3("b", "Cat"),
+            batcher.ask_gpt3("c", "Dog"),
+        )
+
+    assert results == [
+        ("Human", "a in Cat"),
+        ("Human", "b in Cat"),
+        ("Human", "c in Dog"),
+    ]
+    assert client.batches == [[("a", "Cat"), ("b", "Cat"), ("c", "Dog")]]
+    assert batcher.stats() == {"batches": 1, "batched_items": 3, "fallbacks": 0}
+
+
+@pytest.mark.asyncio
+async def test_batch_is_sent_after_window():
+    client = FakeOpenAIClient()
+    batcher = TranslationBatcher(client, max_size=10, window=0.01)
+    results = await asyncio.gather(
+        batcher.ask_gpt3("a", "Cat"), batcher.ask_gpt3("b", "Cat")
+    )
+
+    assert results == [("Human", "a in Cat"), ("Human", "b in Cat")]
+    assert len(client.batches) == 1
+
+
+@pytest.mark.asyncio
+async def test_malformed_item_falls_back_to_single_call():
+    client = FakeOpenAIClient(malformed={1})
+    batcher = TranslationBatcher(client, max_size=2, window=1)
+    results = await asyncio.gather(
+        batcher.ask_gpt3("a", "Cat"), batcher.ask_gpt3("b", "Cat")
+    )
+
+    assert results == [("Human", "a in Cat"), ("Human", "b in Cat (single)")]
+    assert client.single_calls == [("b", "Cat")]
+    assert batcher.stats()["fallbacks"] == 1
@@ -0,0 +1,139 @@
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.cache import (
+    DatabaseTranslationCache,
+    LRUTranslationCache,
+    TieredTranslationCache,
+    normalize_key,
+)
+from app.database import init_models
+from app.models import Language, Translation
+
+TEST_DB_URL = "sqlite+aiosqlite://"
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_normalize_key():
+    assert normalize_key("  Hello \n world ", " English") == (
+        "Hello world",
+        "english",
+    )
+
+
+@pytest.mark.asyncio
+async def test_lru_cache_eviction():
+    cache = LRUTranslationCache(maxsize=2, ttl=60)
+    await cache.set(("a", "cat"), ("Human", "meow"))
+    await cache.set(("b", "cat"), ("Human", "meow meow"))
+    assert await cache.get(("a", "cat")) == ("Human", "meow")
+    await cache.set(("c", "cat"), ("Human", "meow meow meow"))
+
+    assert await cache.get(("b", "cat")) is None
+    assert await cache.get(("a", "cat")) == ("Human", "meow")
+    assert cache.stats()["evictions"] == 1
+    assert cache.hits == 2
+    assert cache.misses == 1
+
+
+@pytest.mark.asyncio
+async def test_lru_cache_ttl():
+    clock = FakeClock()
+    cache = LRUTranslationCache(maxsize=10, ttl=5, clock=clock)
+    await cache.set(("a", "cat"), ("Human", "meow"))
+    clock.now = 4
+    assert await cache.get(("a", "cat")) == ("Human", "meow")
+    clock.now = 5
+    assert await cache.get(("a", "cat")) is None
+    assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_tiered_cache_database_fallback():
+    engine = create_async_engine(TEST_DB_URL, echo=False)
+    maker = async_sessionmaker(engine, expire_on_commit=False)
+    await init_models(engine)
+    async with maker() as session, session.begin():
+        session.add_all([Language(name="Human"), Language(name="Cat")])
+    async with maker() as session, session.begin():
+        session.add(
+            Translation(
+                origin_language="Human",
+                translated_language="Cat",
+                text="Hello",
+                translated_text="Meow",
+            )
+        )
+
+    memory_tier = LRUTranslationCache(maxsize=10, ttl=60)
+    cache = TieredTranslationCache(memory_tier, DatabaseTranslationCache(maker))
+    key = normalize_key("Hello", "cat")
+
+    assert await cache.get(key) == ("Human", "Meow")
+    assert await memory_tier.get(key) == ("Human", "Meow")
+    assert await cache.get(normalize_key("Bye", "cat")) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_translation_cache_hit_skips_openai():
+    from app import main
+    from app.pydantic_models import TranslateInput
+    from app.translator import Translator
+
+    calls = []
+
+    class FakeOpenAIClient:
+        async def ask_gpt3(self, prompt, animal):
+            calls.append((prompt, animal))
+            return "Human", "Meow"
+
+    translator = Translator(FakeOpenAIClient(), LRUTranslationCache(maxsize=10, ttl=60))
+
+    first, _ = await main.translation(
+        TranslateInput(text="Hello", translate_to_language="Cat"), translator
+    )
+    second, _ = await main.translation(
+        TranslateInput(text=" Hello ", translate_to_language="cat"), translator
+    )
+
+    assert first.text == second.text
+    assert (first.source, second.source) == ("model", "cache")
+    assert calls == [("Hello", "Cat")]
+    assert translator.stats()["cache"]["hits"] == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("deltas", [["Sorry, I cannot ", "translate that."], []])
+async def test_malformed_stream_is_not_cached(deltas):
+    from app import main
+    from app.pydantic_models import TranslateInput
+    from app.translator import Translator
+
+    class FakeOpenAIClient:
+        async def stream_gpt3(self, prompt, animal):
+            for delta in deltas:
+                yield delta
+
+    cache = LRUTranslationCache(maxsize=10, ttl=60)
+    translator = Translator(FakeOpenAIClient(), cache)
+    events = [
+        event
+        async for event in main.translation_events(
+            TranslateInput(text="Hello", translate_to_language="Cat"),
+            translator,
+            session=None,
+        )
+    ]
+
+    assert events[-1].startswith(b"event: error")
+    assert await cache.get(normalize_key("Hello", "Cat")) is None
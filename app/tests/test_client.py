@@ -1,11 +1,26 @@
+import json
+
 import pytest
 from httpx import AsyncClient
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 
+import app.main
+from app.admission import UpstreamError
 from app.crud import Read
 from app.database import init_models
-from app.main import application, db_connection, translation
+from app.jobs import JobWorker
+from app.main import (
+    application,
+    db_connection,
+    get_job_worker,
+    get_language_purger,
+    get_translator,
+    language_registry,
+    translation,
+)
 from app.models import Base
+from app.purge import LanguagePurger
 from app.pydantic_models import TranslateInput, TranslateOutput
 
 # Here I am creating test database in memory and overriding the db_connection and animal_translation
@@ -30,6 +45,12 @@ async def override_get_db():
         await db.close()
 
 
+@pytest.fixture(autouse=True)
+def invalidate_language_registry():
+    # Tests recreate the tables behind the back of the application.
+    language_registry.invalidate()
+
+
 @pytest.fixture
 async def get_session():
     obj = override_get_db()
@@ -44,8 +65,26 @@ async def override_chatgpt_translation():
     )
 
 
+class FakeTranslator:
+    async def translate(self, text: str, language: str):
+        if text == "boom":
+            raise KeyError("choices")
+        return "Cat", text.upper(), "model"
+
+    async def stream(self, text: str, language: str):
+        if text == "boom":
+            raise KeyError("choices")
+        yield ("language", "Cat")
+        for word in text.upper().split():
+            if word == "CUT":
+                raise UpstreamError(None, reason="OpenAI stream failed")
+            yield ("token", word + " ")
+
+
 application.dependency_overrides[translation] = override_chatgpt_translation
+application.dependency_overrides[get_translator] = FakeTranslator
 application.dependency_overrides[db_connection] = override_get_db
+application.dependency_overrides[get_language_purger] = lambda: LanguagePurger(maker)
 
 
 @pytest.mark.asyncio
@@ -176,6 +215,61 @@ async def test_update_translation():
         assert response.status_code == 200
         response = await ac.get(f"/api/v1/get_translation?id={id}")
         assert response.json()["translated_text"] == "new!"
+        response = await ac.put(
+            "/api/v1/update_translation",
+            json={"id": id + 1, "new_translation": "new!"},
+        )
+        assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_batch_update_and_delete():
+    await drop_tables(engine)
+    await init_models(engine)
+    async with AsyncClient(app=application, base_url="http://127.0.0.1") as ac:
+        await ac.post(
+            "/api/v1/create_translations_bulk",
+            json=[
+                {"text": "meow", "translate_to_language": "English"},
+                {"text": "purr", "translate_to_language": "English"},
+                {"text": "woof", "translate_to_language": "Dog"},
+            ],
+        )
+        updated = await ac.patch(
+            "/api/v1/translations",
+            json=[
+                {"id": 1, "new_translation": "Hello"},
+                {"id": 9, "new_translation": "Nobody"},
+                {"id": 3, "new_translation": "Bark"},
+            ],
+        )
+        empty = await ac.patch("/api/v1/translations", json=[])
+        texts = [
+            (await ac.get(f"/api/v1/get_translation?id={id}")).json()["translated_text"]
+            for id in (1, 2, 3)
+        ]
+        deleted = await ac.delete("/api/v1/translations?id=2&id=9")
+        missing = await ac.get("/api/v1/get_translation?id=2")
+        languages = await ac.delete("/api/v1/languages?name=Dog&name=Bird")
+        remaining = await ac.get("/api/v1/get_all_languages")
+
+    assert updated.json() == [
+        {"id": 1, "status": "updated"},
+        {"id": 9, "status": "not_found"},
+        {"id": 3, "status": "updated"},
+    ]
+    assert empty.status_code == 422
+    assert texts == ["Hello", "PURR", "Bark"]
+    assert deleted.json() == [
+        {"id": 2, "status": "deleted"},
+        {"id": 9, "status": "not_found"},
+    ]
+    assert missing.status_code == 404
+    assert languages.json() == [
+        {"language": "Dog", "status": "deleted"},
+        {"language": "Bird", "status": "not_found"},
+    ]
+    assert "Dog" not in [item["language"] for item in remaining.json()]
 
 
 @pytest.mark.asyncio
@@ -197,3 +291,389 @@ async def test_delete_language():
         assert response.json()["status"] == "deleted"
         response = await ac.get("api/v1/get_language?name=Cat")
         assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_create_translations_bulk(get_session):
+    await drop_tables(engine)
+    await init_models(engine)
+    items = [
+        {"text": "meow", "translate_to_language": "English"},
+        {"text": "boom", "translate_to_language": "English"},
+        {"text": "purr"},
+        {"text": "mrr", "translate_to_language": "Dog"},
+    ]
+    async with AsyncClient(app=application, base_url="http://127.0.0.1") as ac:
+        response = await ac.post("/api/v1/create_translations_bulk", json=items)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = {
+        line["index"]: line for line in map(json.loads, response.text.splitlines())
+    }
+    assert len(lines) == 4
+    assert lines[0]["text"] == "MEOW"
+    assert lines[1]["error"] == "OpenAI error occured"
+    assert "error" in lines[2]
+    assert lines[3]["translated_from"] == "Cat"
+
+    session = await get_session
+    read_obj = Read(session)
+    translation = await read_obj.get_translation(lines[3]["id"])
+    assert translation.translated_language == "Dog"
+    assert translation.translated_text == "MRR"
+    assert await read_obj.get_language("English") is not None
+
+
+@pytest.mark.asyncio
+async def test_create_translations_bulk_reports_storage_errors(caplog):
+    # Without tables every insert fails.
+    await drop_tables(engine)
+    items = [{"text": "meow", "translate_to_language": "English"}]
+    async with AsyncClient(app=application, base_url="http://127.0.0.1") as ac:
+        response = await ac.post("/api/v1/create_translations_bulk", json=items)
+
+    assert response.status_code == 200
+    assert [json.loads(line) for line in response.text.splitlines()] == [
+        {"index": 0, "error": "Could not store translation"}
+    ]
+    assert "Could not store 1 bulk translations" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_create_translations_bulk_ndjson():
+    await drop_tables(engine)
+    await init_models(engine)
+    body = "\n".join(
+        [
+            json.dumps({"text": "meow", "translate_to_language": "English"}),
+            "not json",
+        ]
+    )
+    async with AsyncClient(app=application, base_url="http://127.0.0.1") as ac:
+        response = await ac.post(
+            "/api/v1/create_translations_bulk",
+            content=body,
+            headers={"Content-Type": "application/x-ndjson"},
+        )
+
+    lines = sorted(
+        map(json.loads, response.text.splitlines()), key=lambda l: l["index"]
+    )
+    assert lines[0]["text"] == "MEOW"
+    assert lines[1]["error"] == "Item is not a JSON object"
+
+
+@pytest.mark.asyncio
+async def test_create_translation_stream(get_session):
+    await drop_tables(engine)
+    await init_models(engine)
+    async with AsyncClient(app=application, base_url="http://127.0.0.1") as ac:
+        response = await ac.post(
+            "/api/v1/create_translation/stream",
+            json={"text": "meow meow", "translate_to_language": "English"},
+        )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [
+        (
+            event.split("\n")[0].removeprefix("event: "),
+            json.loads(event.split("\n")[1].removeprefix("data: ")),
+        )
+        for event in response.text.strip().split("\n\n")
+    ]
+    assert [name for name, _ in events] == ["language", "token", "token", "done"]
+    assert events[0][1] == {"translated_from": "Cat"}
+    done = events[-1][1]
+    assert done["text"] == "MEOW MEOW"
+
+    session = await get_session
+    translation = await Read(session).get_translation(done["id"])
+    assert translation.translated_text == "MEOW MEOW"
+
+
+@pytest.mark.asyncio
+async def test_create_translation_stream_error():
+    async with AsyncClient(app=application, base_url="http://127.0.0.1") as ac:
+        response = await ac.post(
+            "/api/v1/create_translation/stream",
+            json={"text": "boom", "translate_to_language": "English"},
+        )
+
+    assert response.text.startswith("event: error\n")
+
+
+@pytest.mark.asyncio
+async def test_create_translation_stream_broken_off():
+    async with AsyncClient(app=application, base_url="http://127.0.0.1") as ac:
+        response = await ac.post(
+            "/api/v1/create_translation/stream",
+            json={"text": "meow cut", "translate_to_language": "English"},
+        )
+
+    events = [event.split("\n")[0] for event in response.text.strip().split("\n\n")]
+    assert events == ["event: language", "event: token", "event: error"]
+
+
+@pytest.mark.asyncio
+async def test_create_translation_stream_not_stored(monkeypatch):
+    async def persist_translation(*_):
+        raise OperationalError("INSERT", {}, Exception("database is locked"))
+
+    monkeypatch.setattr(app.main, "persist_translation", persist_translation)
+    async with AsyncClient(app=application, base_url="http://127.0.0.1") as ac:
+        response = await ac.post(
+            "/api/v1/create_translation/stream",
+            json={"text": "meow", "translate_to_language": "English"},
+        )
+
+    last = response.text.strip().split("\n\n")[-1]
+    assert last.startswith("event: error\n")
+    assert "Could not store translation" in last
+
+
+@pytest.mark.asyncio
+async def test_create_translation_with_existing_languages():
+    await drop_tables(engine)
+    await init_models(engine)
+    async with AsyncClient(app=application, base_url="http://127.0.0.1") as ac:
+        await ac.post("/api/v1/create_language", json={"language": "Cat"})
+        first = await ac.post(
+            "/api/v1/create_translation",
+            json={"text": "I am kitty", "translate_to_language": "kitten"},
+        )
+        second = await ac.post(
+            "/api/v1/create_translation",
+            json={"text": "I am kitty", "translate_to_language": "kitten"},
+        )
+        response = await ac.get("/api/v1/get_all_languages")
+
+    assert first.status_code == second.status_code == 201
+    assert second.json()["id"] == first.json()["id"] + 1
+    assert len(response.json()) == 2
+
+
+@pytest.mark.asyncio
+async def test_get_languages_etag():
+    await drop_tables(engine)
+    await init_models(engine)
+    async with AsyncClient(app=application, base_url="http://127.0.0.1") as ac:
+        await ac.post("/api/v1/create_language", json={"language": "Cat"})
+        response = await ac.get("/api/v1/get_all_languages")
+        etag = response.headers["ETag"]
+        not_modified = await ac.get(
+            "/api/v1/get_all_languages", headers={"If-None-Match": etag}
+        )
+        await ac.post("/api/v1/create_language", json={"language": "Dog"})
+        modified = await ac.get(
+            "/api/v1/get_all_languages", headers={"If-None-Match": etag}
+        )
+
+    assert not_modified.status_code == 304
+    assert not_modified.headers["ETag"] == etag
+    assert modified.status_code == 200
+    assert modified.headers["ETag"] != etag
+    assert modified.json() == [{"language": "Cat"}, {"language": "Dog"}]
+
+
+@pytest.mark.asyncio
+async def test_get_all_translations_pagination():
+    await drop_tables(engine)
+    await init_models(engine)
+    async with AsyncClient(app=application, base_url="http://127.0.0.1") as ac:
+        await ac.post(
+            "/api/v1/create_translations_bulk",
+            json=[
+                {"text": f"meow {i}", "translate_to_language": "English"}
+                for i in range(5)
+            ]
+            + [{"text": "woof", "translate_to_language": "Dog"}],
+        )
+        first = await ac.get("/api/v1/get_all_translations?limit=2")
+        cursor = first.headers["X-Next-Cursor"]
+        second = await ac.get(f"/api/v1/get_all_translations?limit=2&cursor={cursor}")
+        filtered = await ac.get("/api/v1/get_all_translations?translated_language=Dog")
+
+    assert [t["id"] for t in first.json()] == [1, 2]
+    assert [t["id"] for t in second.json()] == [3, 4]
+    assert [t["text"] for t in filtered.json()] == ["woof"]
+    assert "X-Next-Cursor" not in filtered.headers
+
+
+@pytest.mark.asyncio
+async def test_get_all_translations_stream():
+    await drop_tables(engine)
+    await init_models(engine)
+    async with AsyncClient(app=application, base_url="http://127.0.0.1") as ac:
+        empty = await ac.get("/api/v1/get_all_translations?stream=json")
+        await ac.post(
+            "/api/v1/create_translations_bulk",
+            json=[
+                {"text": f"meow {i}", "translate_to_language": "English"}
+                for i in range(3)
+            ],
+        )
+        as_json = await ac.get("/api/v1/get_all_translations?stream=json&cursor=1")
+        as_ndjson = await ac.get("/api/v1/get_all_translations?stream=ndjson")
+
+    assert empty.json() == []
+    assert [t["id"] for t in as_json.json()] == [2, 3]
+    lines = [json.loads(line) for line in as_ndjson.text.splitlines()]
+    assert [t["translated_text"] for t in lines] == ["MEOW 0", "MEOW 1", "MEOW 2"]
+
+
+@pytest.mark.asyncio
+async def test_get_all_languages_pagination():
+    await drop_tables(engine)
+    await init_models(engine)
+    async with AsyncClient(app=application, base_url="http://127.0.0.1") as ac:
+        for language in ["Cat", "Dog", "Fish"]:
+            await ac.post("/api/v1/create_language", json={"language": language})
+        first = await ac.get("/api/v1/get_all_languages?limit=2")
+        second = await ac.get(
+            f"/api/v1/get_all_languages?limit=2&cursor={first.headers['X-Next-Cursor']}"
+        )
+
+    assert first.json() == [{"language": "Cat"}, {"language": "Dog"}]
+    assert second.json() == [{"language": "Fish"}]
+    assert "X-Next-Cursor" not in second.headers
+
+
+@pytest.mark.asyncio
+async def test_import_export_translations():
+    await drop_tables(engine)
+    await init_models(engine)
+    csv_body = (
+        "origin_language,translated_language,text,translated_text\n"
+        'Cow,English,Mooo,"Hi, how\nare you?"\n'
+        "Human,Cat,Hello,Meow\n"
+    )
+    ndjson_body = json.dumps(
+        {
+            "origin_language": "Dog",
+            "translated_language": "Cat",
+            "text": "Woof",
+            "translated_text": "Meow",
+        }
+    )
+    async with AsyncClient(app=application, base_url="http://127.0.0.1") as ac:
+        imported = await ac.post("/api/v1/import/translation", content=csv_body)
+        imported_ndjson = await ac.post(
+            "/api/v1/import/translation?format=ndjson", content=ndjson_body
+        )
+        malformed = await ac.post(
+            "/api/v1/import/translation", content="origin_language\nCow\n"
+        )
+        null_value = await ac.post(
+            "/api/v1/import/translation?format=ndjson",
+            content=json.dumps(
+                {
+                    "origin_language": "Dog",
+                    "translated_language": "Cat",
+                    "text": None,
+                    "translated_text": 1,
+                }
+            ),
+        )
+        exported = await ac.get("/api/v1/export/translation")
+        exported_ndjson = await ac.get("/api/v1/export/translation?format=ndjson")
+        languages = await ac.get("/api/v1/get_all_languages")
+
+    assert imported.status_code == 201
+    assert imported.json() == {"imported": 2}
+    assert imported_ndjson.json() == {"imported": 1}
+    assert malformed.status_code == 422
+    assert null_value.status_code == 422
+    assert null_value.json()["detail"] == "Column 'text' is not a string: None"
+    assert exported.text.splitlines()[0] == (
+        "id,origin_language,translated_language,text,translated_text"
+    )
+    rows = [json.loads(line) for line in exported_ndjson.text.splitlines()]
+    assert rows[0]["translated_text"] == "Hi, how\nare you?"
+    assert [row["text"] for row in rows] == ["Mooo", "Hello", "Woof"]
+    assert {language["language"] for language in languages.json()} == {
+        "Cat",
+        "Cow",
+        "Dog",
+        "English",
+        "Human",
+    }
+
+
+@pytest.mark.asyncio
+async def test_search_translations():
+    await drop_tables(engine)
+    await init_models(engine)
+    async with AsyncClient(app=application, base_url="http://127.0.0.1") as ac:
+        await ac.post(
+            "/api/v1/create_translations_bulk",
+            json=[
+                {"text": "purr purr meow", "translate_to_language": "English"},
+                {"text": "meow", "translate_to_language": "English"},
+                {"text": "woof", "translate_to_language": "Dog"},
+            ],
+        )
+        await ac.put(
+            "/api/v1/update_translation", json={"id": 3, "new_translation": "Bark"}
+        )
+        found = await ac.get("/api/v1/search_translations?q=meow")
+        filtered = await ac.get(
+            "/api/v1/search_translations?q=meow&translated_language=Dog"
+        )
+        updated = await ac.get("/api/v1/search_translations?q=bark")
+        quoted = await ac.get('/api/v1/search_translations?q="meow OR')
+        await ac.delete("/api/v1/delete_translation/2")
+        deleted = await ac.get("/api/v1/search_translations?q=meow")
+
+    assert [t["id"] for t in found.json()] == [2, 1]
+    assert found.json()[0]["rank"] >= found.json()[1]["rank"]
+    assert filtered.json() == []
+    assert [t["id"] for t in updated.json()] == [3]
+    assert quoted.json() == []
+    assert [t["id"] for t in deleted.json()] == [1]
+
+
+@pytest.mark.asyncio
+async def test_metrics():
+    await drop_tables(engine)
+    await init_models(engine)
+    async with AsyncClient(app=application, base_url="http://127.0.0.1") as ac:
+        await ac.get("/api/v1/get_translation?id=1")
+        response = await ac.get("/metrics")
+
+    assert response.headers["content-type"].startswith("text/plain")
+    assert (
+        'http_request_duration_seconds_count{method="GET",'
+        'route="/api/v1/get_translation",status="404"}'
+    ) in response.text
+
+
+@pytest.mark.asyncio
+async def test_translation_jobs(tmp_path):
+    # Workers need their own connections, the in-memory database has one.
+    jobs_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/jobs.db")
+    await init_models(jobs_engine)
+    jobs_maker = async_sessionmaker(jobs_engine, expire_on_commit=False)
+    async with JobWorker(jobs_maker, FakeTranslator(), poll_interval=0.05) as worker:
+        application.dependency_overrides[get_job_worker] = lambda: worker
+        async with AsyncClient(app=application, base_url="http://127.0.0.1") as ac:
+            created = await ac.post(
+                "/api/v1/translation_jobs",
+                json={"text": "meow", "translate_to_language": "English"},
+            )
+            done = await ac.get(created.headers["Location"] + "?wait=5")
+            missing = await ac.get("/api/v1/translation_jobs/100")
+        del application.dependency_overrides[get_job_worker]
+    await jobs_engine.dispose()
+
+    assert created.status_code == 202
+    assert created.json()["status"] == "pending"
+    assert done.json()["status"] == "done"
+    assert done.json()["translation"] == {
+        "id": 1,
+        "translated_from": "Cat",
+        "text": "MEOW",
+        "source": "model",
+    }
+    assert missing.status_code == 404
@@ -0,0 +1,167 @@
+import json
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import insert, select
+
+from app import main
+from app.config import get_settings
+from app.crud import Create, Read
+from app.dedup import Deduplicator
+from app.jobs import Jobs
+from app.models import Language, Translation, TranslationJob, content_hash
+from app.pydantic_models import TranslateInput, TranslateOutput
+from app.transfer import Transfer
+
+
+def pair(text: str, language: str = "Cat"):
+    return (
+        TranslateInput(text=text, translate_to_language=language),
+        TranslateOutput(id=-1, translated_from="Cow", text="Meow"),
+    )
+
+
+def test_content_hash_normalizes_whitespace():
+    assert content_hash("Moo  moo\n") == content_hash("Moo moo")
+    assert content_hash("Moo moo") != content_hash("moo moo")
+
+
+@pytest.mark.asyncio
+async def test_dedup_returns_existing_rows(maker):
+    first = (await Create(maker()).register_translation(*pair("Moo moo"))).id
+    reused = await Create(maker()).register_translation(*pair(" Moo  moo"), dedup=True)
+    assert reused == (first, "Cow", "Meow", True)
+    assert (await Create(maker()).register_translation(*pair("Moo moo"))).id != first
+
+    ids = await Create(maker()).register_translations(
+        [pair("Moo moo"), pair("Oink"), pair("Oink"), pair("Oink", "Dog")],
+        dedup=True,
+    )
+    assert ids[0] > first
+    assert ids[1] == ids[2]
+    assert len(set(ids)) == 3
+
+    row = await Read(maker()).find_translation("Oink ", "cat")
+    assert row.origin_language == "Cow"
+
+
+@pytest.mark.asyncio
+async def test_backfill_and_collapse_duplicates(maker):
+    async with maker() as session, session.begin():
+        await session.execute(insert(Language), [{"name": "Cow"}, {"name": "Cat"}])
+        # Rows stored before the column existed have no hash.
+        await session.execute(
+            insert(Translation.__table__),
+            [
+                {
+                    "origin_language": "Cow",
+                    "translated_language": "Cat",
+                    "text": text,
+                    "translated_text": "Meow",
+                    "content_hash": None,
+                }
+                for text in ["Moo", "Moo ", "Oink", " Moo"]
+            ],
+        )
+        await session.execute(
+            insert(TranslationJob).values(
+                text="Moo", translate_to_language="Cat", translation_id=1
+            )
+        )
+
+    assert await Deduplicator(maker()).backfill(batch_size=3) == 4
+    assert await Deduplicator(maker()).collapse(batch_size=1) == 2
+
+    async with maker() as session:
+        ids = (await session.scalars(select(Translation.id))).all()
+        job = (await session.scalars(select(TranslationJob))).one()
+    assert sorted(ids) == [3, 4]
+    assert job.translation_id == 4
+
+
+@pytest.mark.asyncio
+async def test_collapse_compares_languages_case_insensitively(maker):
+    first = (await Create(maker()).register_translation(*pair("Moo", "Cat"))).id
+    second = (await Create(maker()).register_translation(*pair("Moo", "cat"))).id
+    reused = await Create(maker()).register_translation(*pair("Moo", "CAT"), dedup=True)
+    assert reused.id == second
+
+    assert await Deduplicator(maker()).collapse() == 1
+    async with maker() as session:
+        ids = (await session.scalars(select(Translation.id))).all()
+    assert ids == [second]
+    assert first != second
+
+
+@pytest.mark.asyncio
+async def test_create_translation_answers_with_reused_row(maker, monkeypatch):
+    answers = iter([("Cow", "Meow"), ("Dog", "Woof")])
+
+    async def translate(input: TranslateInput):
+        language, text = next(answers)
+        return TranslateOutput(id=-1, translated_from=language, text=text), input
+
+    async def db():
+        async with maker() as session:
+            yield session
+
+    monkeypatch.setattr(get_settings(), "dedup_translations", True)
+    overrides = {main.translation: translate, main.db_connection: db}
+    previous = dict(main.application.dependency_overrides)
+    main.application.dependency_overrides.update(overrides)
+    main.language_registry.invalidate()
+    try:
+        async with AsyncClient(app=main.application, base_url="http://127.0.0.1") as ac:
+            body = {"text": "Moo", "translate_to_language": "Cat"}
+            first = await ac.post("/api/v1/create_translation", json=body)
+            second = await ac.post("/api/v1/create_translation", json=body)
+            languages = await ac.get("/api/v1/get_all_languages")
+    finally:
+        main.application.dependency_overrides.clear()
+        main.application.dependency_overrides.update(previous)
+        main.language_registry.invalidate()
+
+    assert second.json() == {
+        "id": first.json()["id"],
+        "translated_from": "Cow",
+        "text": "Meow",
+        "source": "stored",
+    }
+    assert [item["language"] for item in languages.json()] == ["Cat", "Cow"]
+
+
+@pytest.mark.asyncio
+async def test_jobs_and_imports_reuse_stored_rows(maker):
+    first = (await Create(maker()).register_translation(*pair("Moo moo"))).id
+
+    job_id = await Jobs(maker()).enqueue(
+        TranslateInput(text="Moo  moo", translate_to_language="CAT")
+    )
+    (claimed,) = await Jobs(maker()).claim(1, lease=60)
+    stored = await Jobs(maker()).complete(
+        job_id, claimed.attempts, "Cow", "Purr", dedup=True
+    )
+    assert stored == (first, "Cow", "Meow", True)
+
+    lines = [
+        {
+            "origin_language": "Cow",
+            "translated_language": language,
+            "text": text,
+            "translated_text": "Meow",
+        }
+        for text, language in [("Moo moo", "cat"), ("Oink", "Cat"), ("Oink", "cat")]
+    ]
+
+    async def chunks():
+        yield "\n".join(json.dumps(line) for line in lines).encode()
+
+    assert (
+        await Transfer(maker()).import_table(
+            "translation", "ndjson", chunks(), dedup=True
+        )
+        == 3
+    )
+    async with maker() as session:
+        texts = (await session.scalars(select(Translation.text))).all()
+    assert sorted(texts) == ["Moo moo", "Oink"]
@@ -0,0 +1,103 @@
+import pytest
+
+from app.jobs import DONE, FAILED, PENDING, RUNNING, Jobs, JobWorker
+from app.metrics import TRANSLATIONS
+from app.pydantic_models import TranslateInput
+
+
+class FakeTranslator:
+    def __init__(self, failures: int = 0) -> None:
+        self.failures = failures
+        self.calls = 0
+
+    async def translate(self, text: str, language: str):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise KeyError("choices")
+        return "Human", text.upper(), "model"
+
+
+@pytest.mark.asyncio
+async def test_claim_hands_out_each_job_once(maker):
+    for text in ["a", "b", "c"]:
+        await Jobs(maker()).enqueue(
+            TranslateInput(text=text, translate_to_language="Cat")
+        )
+
+    first = await Jobs(maker()).claim(2, lease=60)
+    second = await Jobs(maker()).claim(2, lease=60)
+    third = await Jobs(maker()).claim(2, lease=60)
+
+    assert [job.text for job in first] == ["a", "b"]
+    assert [job.text for job in second] == ["c"]
+    assert third == []
+    assert (await Jobs(maker()).get(first[0].id)).status == RUNNING
+
+
+@pytest.mark.asyncio
+async def test_expired_lease_is_claimed_again(maker):
+    job_id = await Jobs(maker()).enqueue(
+        TranslateInput(text="a", translate_to_language="Cat")
+    )
+    (claimed,) = await Jobs(maker()).claim(1, lease=-1)
+    (reclaimed,) = await Jobs(maker()).claim(1, lease=60)
+
+    assert reclaimed.id == job_id
+    assert reclaimed.attempts == 2
+    # The first attempt lost its lease and cannot store a result anymore.
+    assert await Jobs(maker()).complete(job_id, claimed.attempts, "Human", "A") is None
+    assert (
+        await Jobs(maker()).complete(job_id, reclaimed.attempts, "Human", "A")
+    ).id == 1
+
+
+@pytest.mark.asyncio
+async def test_worker_retries_and_completes_jobs(maker):
+    translator = FakeTranslator(failures=1)
+    translations = TRANSLATIONS.labels("model").value
+    async with JobWorker(
+        maker, translator, concurrency=2, poll_interval=0.05, retry_backoff=0
+    ) as worker:
+        job_id = await worker.enqueue(
+            TranslateInput(text="meow", translate_to_language="Cat")
+        )
+        job = await worker.wait(job_id, timeout=5)
+
+    assert job.status == DONE
+    assert job.attempts == 2
+    assert job.translated_text == "MEOW"
+    assert worker.stats()["retried"] == 1
+    assert TRANSLATIONS.labels("model").value == translations + 1
+
+
+@pytest.mark.asyncio
+async def test_worker_fails_job_after_max_attempts(maker):
+    async with JobWorker(
+        maker,
+        FakeTranslator(failures=10),
+        poll_interval=0.05,
+        max_attempts=2,
+        retry_backoff=0,
+    ) as worker:
+        job_id = await worker.enqueue(
+            TranslateInput(text="meow", translate_to_language="Cat")
+        )
+        job = await worker.wait(job_id, timeout=5)
+
+    assert job.status == FAILED
+    assert job.error == "OpenAI error occured"
+
+
+@pytest.mark.asyncio
+async def test_pending_jobs_survive_a_restart(maker):
+    await Jobs(maker()).enqueue(
+        TranslateInput(text="meow", translate_to_language="Cat")
+    )
+    worker = JobWorker(maker, FakeTranslator(), concurrency=0)
+    async with worker:
+        job = await worker.wait(1, timeout=0)
+    assert job.status == PENDING
+
+    async with JobWorker(maker, FakeTranslator(), poll_interval=0.05) as worker:
+        job = await worker.wait(1, timeout=5)
+    assert job.status == DONE
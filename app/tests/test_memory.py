@@ -0,0 +1,134 @@
+import pytest
+import pytest_asyncio
+
+from app.cache import LRUTranslationCache
+from app.memory import TranslationMemory, normalize_text
+from app.models import Language, Translation
+from app.translator import Translator
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest_asyncio.fixture
+async def maker(maker):
+    async with maker() as session, session.begin():
+        session.add_all([Language(name="Human"), Language(name="Cat")])
+    return maker
+
+
+async def store(maker, text: str, translated_text: str, id: int | None = None) -> None:
+    async with maker() as session, session.begin():
+        session.add(
+            Translation(
+                id=id,
+                origin_language="Human",
+                translated_language="Cat",
+                text=text,
+                translated_text=translated_text,
+            )
+        )
+
+
+def test_normalize_text():
+    assert normalize_text("  Hello,   WORLD!! ") == "hello world"
+    assert normalize_text("ﬁne") == "fine"
+
+
+@pytest.mark.asyncio
+async def test_memory_exact_and_fuzzy_matches(maker):
+    await store(maker, "The quick brown fox jumps over the lazy dog", "Meow")
+    memory = TranslationMemory(maker, threshold=0.8)
+
+    exact = await memory.lookup("the quick brown fox, jumps over the lazy dog!", "cat")
+    fuzzy = await memory.lookup("The quick brown fox jumped over the lazy dog", "Cat")
+    other_language = await memory.lookup("The quick brown fox", "Dog")
+    unrelated = await memory.lookup("Completely different sentence", "Cat")
+
+    assert exact == ("Human", "Meow", 1.0)
+    assert fuzzy.translated_text == "Meow"
+    assert 0.8 <= fuzzy.similarity < 1
+    assert other_language is None
+    assert unrelated is None
+    assert memory.stats()["match_rate"] == 0.5
+
+
+@pytest.mark.asyncio
+async def test_memory_refreshes_incrementally(maker):
+    clock = FakeClock()
+    memory = TranslationMemory(maker, refresh_interval=10, clock=clock)
+    assert await memory.lookup("Hello", "Cat") is None
+
+    await store(maker, "Hello", "Meow")
+    assert await memory.lookup("Hello", "Cat") is None
+    clock.now = 10
+    assert (await memory.lookup("hello.", "Cat")).translated_text == "Meow"
+    assert memory.stats()["refreshes"] == 2
+    assert len(memory) == 1
+
+
+@pytest.mark.asyncio
+async def test_memory_indexes_rows_committed_late(maker):
+    clock = FakeClock()
+    memory = TranslationMemory(maker, refresh_interval=10, clock=clock)
+    await store(maker, "Hello", "Meow", id=5)
+    await memory.refresh()
+
+    # Committed after the refresh, with an ID below the indexed one.
+    await store(maker, "Goodbye", "Hiss", id=3)
+    clock.now = 10
+    assert (await memory.lookup("Goodbye", "Cat")).translated_text == "Hiss"
+    assert len(memory) == 2
+
+
+@pytest.mark.asyncio
+async def test_memory_keeps_the_newest_entries(maker):
+    for index in range(5):
+        await store(maker, f"Text number {index}", f"Meow {index}")
+    memory = TranslationMemory(maker, max_entries=3)
+
+    await memory.refresh()
+    assert len(memory) == 3
+    assert await memory.lookup("Text number 1", "Cat") is None
+    assert (await memory.lookup("Text number 4", "Cat")).translated_text == "Meow 4"
+
+    memory.add(6, "Another text", "Cat", "Human", "Purr")
+    assert len(memory) == 3
+    assert await memory.lookup("Text number 2", "Cat") is None
+    assert memory.stats()["evictions"] == 1
+
+
+@pytest.mark.asyncio
+async def test_translator_reports_memory_source(maker):
+    await store(maker, "Hello there", "Meow meow")
+    calls = []
+
+    class FakeOpenAIClient:
+        async def ask_gpt3(self, prompt, animal):
+            calls.append(prompt)
+            return "Human", "Purr"
+
+    translator = Translator(
+        FakeOpenAIClient(),
+        LRUTranslationCache(maxsize=10, ttl=60),
+        memory=TranslationMemory(maker),
+    )
+
+    assert await translator.translate("Hello there!", "Cat") == (
+        "Human",
+        "Meow meow",
+        "memory",
+    )
+    assert await translator.translate("Hello there!", "Cat") == (
+        "Human",
+        "Meow meow",
+        "cache",
+    )
+    assert await translator.translate("Goodbye", "Cat") == ("Human", "Purr", "model")
+    assert calls == ["Goodbye"]
+    assert translator.stats()["memory"]["exact_hits"] == 1
@@ -0,0 +1,41 @@
+from app.metrics import Histogram, MetricsRegistry
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.histogram(
+        "stage_seconds", "Stage time", labels=("stage",), buckets=(0.1, 1.0)
+    )
+    histogram.labels("parse").observe(0.05)
+    histogram.labels("parse").observe(0.5)
+    histogram.labels("parse").observe(5)
+
+    lines = registry.render().splitlines()
+
+    assert "# TYPE stage_seconds histogram" in lines
+    assert 'stage_seconds_bucket{stage="parse",le="0.1"} 1' in lines
+    assert 'stage_seconds_bucket{stage="parse",le="1.0"} 2' in lines
+    assert 'stage_seconds_bucket{stage="parse",le="+Inf"} 3' in lines
+    assert 'stage_seconds_sum{stage="parse"} 5.55' in lines
+    assert 'stage_seconds_count{stage="parse"} 3' in lines
+
+
+def test_counter_and_gauge():
+    registry = MetricsRegistry()
+    counter = registry.counter("responses_total", "Responses", labels=("status",))
+    counter.labels("200").inc()
+    counter.labels("429").inc(2)
+    registry.gauge("pool_size", "Pool size", lambda: 5)
+
+    lines = registry.render().splitlines()
+
+    assert 'responses_total{status="200"} 1' in lines
+    assert 'responses_total{status="429"} 2' in lines
+    assert "pool_size 5" in lines
+
+
+def test_timer_observes_duration():
+    histogram = Histogram("block_seconds", "Block time")
+    with histogram.time():
+        pass
+    assert histogram.labels().count == 1
@@ -0,0 +1,120 @@
+import pytest
+from sqlalchemy import insert, inspect, select, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.migrations import MIGRATIONS, migrate, schema_version
+from app.models import Language, Translation
+
+
+@pytest.fixture
+def engine(tmp_path):
+    return create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/schema.db", echo=False)
+
+
+def describe(connection) -> tuple[set, set, set]:
+    inspector = inspect(connection)
+    # The inspector skips expression indexes on SQLite.
+    indexes = connection.scalars(
+        text(
+            "SELECT name FROM sqlite_master "
+            "WHERE type = 'index' AND tbl_name = 'translation'"
+        )
+    )
+    return (
+        set(inspector.get_table_names()),
+        set(indexes),
+        {column["name"] for column in inspector.get_columns("translation")},
+    )
+
+
+async def version(engine) -> int:
+    async with engine.connect() as connection:
+        return await connection.scalar(select(schema_version.c.version))
+
+
+@pytest.mark.asyncio
+async def test_migrate_creates_and_stamps_new_database(engine):
+    assert await migrate(engine) == len(MIGRATIONS)
+    assert await version(engine) == len(MIGRATIONS)
+    async with engine.connect() as connection:
+        tables, indexes, columns = await connection.run_sync(describe)
+    assert {"language", "translation", "translation_job", "translation_fts"} <= tables
+    assert "ix_translation_content_hash_lower_language" in indexes
+
+    # An up-to-date database is left alone.
+    assert await migrate(engine) == len(MIGRATIONS)
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_migrate_upgrades_legacy_database(engine):
+    # The schema of the first release: two tables, no indexes.
+    async with engine.begin() as connection:
+        await connection.run_sync(Language.__table__.create)
+        await connection.execute(
+            text(
+                "CREATE TABLE translation (id INTEGER PRIMARY KEY, "
+                "origin_language VARCHAR REFERENCES language (name), "
+                "translated_language VARCHAR REFERENCES language (name), "
+                "text VARCHAR, translated_text VARCHAR, "
+                "created_at DATETIME, last_updated DATETIME)"
+            )
+        )
+        await connection.execute(insert(Language), [{"name": "Cow"}, {"name": "Cat"}])
+        await connection.execute(
+            text(
+                "INSERT INTO translation (origin_language, translated_language, "
+                "text, translated_text) VALUES ('Cow', 'Cat', 'Moo', 'Meow')"
+            )
+        )
+
+    assert await migrate(engine) == len(MIGRATIONS)
+    async with engine.connect() as connection:
+        tables, indexes, columns = await connection.run_sync(describe)
+        matches = await connection.scalar(
+            text(
+                "SELECT count(*) FROM translation_fts WHERE translation_fts MATCH 'moo'"
+            )
+        )
+    assert {"translation_job", "translation_fts"} <= tables
+    assert {
+        "ix_translation_origin_language_id",
+        "ix_translation_content_hash_lower_language",
+    } <= indexes
+    assert "ix_translation_content_hash_language" not in indexes
+    assert "content_hash" in columns
+    assert matches == 1
+
+    # New rows get their content hash from the model.
+    async with engine.begin() as connection:
+        await connection.execute(
+            insert(Translation).values(
+                origin_language="Cow",
+                translated_language="Cat",
+                text="Moo moo",
+                translated_text="Meow meow",
+            )
+        )
+        hashes = (
+            await connection.scalars(
+                select(Translation.content_hash).order_by(Translation.id)
+            )
+        ).all()
+    assert hashes[0] is None and hashes[1] is not None
+
+    assert await migrate(engine) == len(MIGRATIONS)
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_migrate_applies_pending_migrations_only(engine, monkeypatch):
+    await migrate(engine)
+    applied = []
+    monkeypatch.setattr(
+        "app.migrations.MIGRATIONS", [*MIGRATIONS, lambda connection: applied.append(1)]
+    )
+
+    assert await migrate(engine) == len(MIGRATIONS) + 1
+    assert await migrate(engine) == len(MIGRATIONS) + 1
+    assert applied == [1]
+    await engine.dispose()
@@ -0,0 +1,180 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+
+import pytest
+from aiohttp import web
+
+from app.admission import UpstreamError
+from app.openai import AnswerStreamParser, OpenAIClient, estimate_tokens
+from app.prompts import (
+    AnswerFormatError,
+    count_message_tokens,
+    get_template,
+    parse_answer,
+    parse_json_answer,
+)
+
+
+def test_parse_answer():
+    assert parse_answer("Animal: Cow\nTranslation: Hi, how are you?") == (
+        "Cow",
+        "Hi, how are you?",
+    )
+    assert parse_answer(
+        'Sure!\n"Animal: Human\n   Translation: Note: moo.\nMoo: moo!"'
+    ) == ("Human", "Note: moo.\nMoo: moo!")
+    with pytest.raises(AnswerFormatError):
+        parse_answer("Moo moo.")
+
+
+def test_parse_json_answer():
+    answer = '```json\n{"animal": " Cow ", "translation": "Hi: you\\nthere"}\n```'
+    assert parse_json_answer(answer) == ("Cow", "Hi: you\nthere")
+    for answer in ['{"animal": "Cow"}', '{"animal": "", "translation": "Hi"}', "Hi"]:
+        with pytest.raises(AnswerFormatError):
+            parse_json_answer(answer)
+
+
+def test_compact_template_is_smaller():
+    legacy = get_template("legacy").request("Moo", "English")
+    compact = get_template("compact").request("Moo", "English")
+
+    assert compact["response_format"] == {"type": "json_object"}
+    assert json.loads(compact["messages"][1]["content"]) == {
+        "text": "Moo",
+        "to": "English",
+    }
+    assert count_message_tokens(compact["messages"]) * 3 < count_message_tokens(
+        legacy["messages"]
+    )
+    assert estimate_tokens(compact) < estimate_tokens(legacy)
+    with pytest.raises(ValueError):
+        OpenAIClient("key", stream_template="compact")
+
+
+@pytest.mark.asyncio
+async def test_client_reuses_connections():
+    peers = set()
+
+    async def chat_completions(request: web.Request) -> web.Response:
+        peers.add(request.transport.get_extra_info("peername"))
+        content = json.dumps({"animal": "Cow", "translation": "Hello"})
+        return web.json_response({"choices": [{"message": {"content": content}}]})
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    try:
+        url = f"http://127.0.0.1:{port}/v1/chat/completions"
+        async with OpenAIClient("key", url=url, pool_size=1) as client:
+            for _ in range(3):
+                assert await client.ask_gpt3("Moo", "English") == ("Cow", "Hello")
+    finally:
+        await runner.cleanup()
+
+    assert len(peers) == 1
+
+
+def test_answer_stream_parser():
+    parser = AnswerStreamParser()
+    events = []
+    for delta in [
+        "Ani",
+        "mal: C",
+        "ow\n     Transl",
+        "ation:",
+        " Hi, how",
+        " are you?",
+    ]:
+        events.extend(parser.feed(delta))
+    events.extend(parser.finish())
+
+    assert events == [
+        ("language", "Cow"),
+        ("token", "Hi, how"),
+        ("token", " are you?"),
+    ]
+    assert parser.language == "Cow"
+    assert parser.translation == "Hi, how are you?"
+
+
+@asynccontextmanager
+async def serve(chat_completions):
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    try:
+        yield f"http://127.0.0.1:{port}/v1/chat/completions"
+    finally:
+        await runner.cleanup()
+
+
+async def stream_chunks(request: web.Request, chunks: list[bytes], stall: float = 0):
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await response.prepare(request)
+    for chunk in chunks:
+        await response.write(chunk)
+    await asyncio.sleep(stall)
+    await response.write(b"data: [DONE]\n\n")
+    return response
+
+
+def delta_chunk(content: str) -> bytes:
+    chunk = {"choices": [{"delta": {"content": content}}]}
+    return f"data: {json.dumps(chunk)}\n\n".encode()
+
+
+@pytest.mark.asyncio
+async def test_client_streams_deltas():
+    async def chat_completions(request: web.Request) -> web.StreamResponse:
+        contents = ["Animal: Cow\n", "Translation: ", "Hello"]
+        return await stream_chunks(request, [delta_chunk(c) for c in contents])
+
+    async with serve(chat_completions) as url:
+        async with OpenAIClient("key", url=url) as client:
+            deltas = [delta async for delta in client.stream_gpt3("Moo", "English")]
+
+    assert deltas == ["Animal: Cow\n", "Translation: ", "Hello"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "chunk", [b"data: {not json\n\n", b'data: {"choices": []}\n\n']
+)
+async def test_client_rejects_malformed_stream_chunks(chunk):
+    async def chat_completions(request: web.Request) -> web.StreamResponse:
+        return await stream_chunks(request, [delta_chunk("Animal: Cow\n"), chunk])
+
+    async with serve(chat_completions) as url:
+        async with OpenAIClient("key", url=url) as client:
+            deltas = []
+            with pytest.raises(AnswerFormatError):
+                async for delta in client.stream_gpt3("Moo", "English"):
+                    deltas.append(delta)
+
+    assert deltas == ["Animal: Cow\n"]
+
+
+@pytest.mark.asyncio
+async def test_client_stream_timeout_is_an_upstream_error():
+    async def chat_completions(request: web.Request) -> web.StreamResponse:
+        return await stream_chunks(request, [delta_chunk("Animal: Cow\n")], stall=1)
+
+    async with serve(chat_completions) as url:
+        async with OpenAIClient("key", url=url, read_timeout=0.1) as client:
+            deltas = []
+            with pytest.raises(UpstreamError) as error:
+                async for delta in client.stream_gpt3("Moo", "English"):
+                    deltas.append(delta)
+
+    assert deltas == ["Animal: Cow\n"]
+    assert error.value.retryable
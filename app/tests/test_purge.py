@@ -0,0 +1,171 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import main
+from app.crud import Delete
+from app.database import enable_sqlite_foreign_keys, init_models
+from app.models import Language, Translation, TranslationJob
+from app.purge import DONE, LanguagePurger
+
+
+async def make_engine(path, legacy: bool = False):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}", echo=False)
+    enable_sqlite_foreign_keys(engine)
+    if not legacy:
+        await init_models(engine)
+        return engine
+    # Foreign keys without ON DELETE rules, as created by earlier releases.
+    async with engine.begin() as connection:
+        await connection.run_sync(Language.__table__.create)
+        await connection.execute(
+            text(
+                "CREATE TABLE translation (id INTEGER PRIMARY KEY, "
+                "origin_language VARCHAR REFERENCES language (name), "
+                "translated_language VARCHAR REFERENCES language (name), "
+                "text VARCHAR, translated_text VARCHAR, content_hash VARCHAR)"
+            )
+        )
+    return engine
+
+
+async def fill(engine, **counts: int) -> None:
+    # counts maps "Origin_Translated" to the number of translations.
+    async with engine.begin() as connection:
+        await connection.execute(
+            insert(Language), [{"name": name} for name in ("Cat", "Cow", "Dog")]
+        )
+        for pair, count in counts.items():
+            origin, translated = pair.split("_")
+            await connection.execute(
+                insert(Translation.__table__),
+                [
+                    {
+                        "origin_language": origin,
+                        "translated_language": translated,
+                        "text": f"{origin} {index}",
+                        "translated_text": f"{translated} {index}",
+                    }
+                    for index in range(count)
+                ],
+            )
+
+
+async def count(engine, language: str) -> int:
+    async with engine.connect() as connection:
+        return await connection.scalar(
+            select(func.count()).where(
+                (Translation.origin_language == language)
+                | (Translation.translated_language == language)
+            )
+        )
+
+
+@pytest_asyncio.fixture
+async def engine(tmp_path):
+    engine = await make_engine(tmp_path / "purge.db")
+    yield engine
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_delete_language_cascades_both_foreign_keys(engine):
+    await fill(engine, Cat_Cow=3, Cow_Cat=2, Cow_Dog=4)
+    async with engine.begin() as connection:
+        await connection.execute(
+            insert(TranslationJob).values(
+                text="Meow", translate_to_language="Cow", translation_id=1
+            )
+        )
+    maker = async_sessionmaker(engine, expire_on_commit=False)
+
+    assert await Delete(maker()).delete_language("Cat") == "Cat"
+    assert await Delete(maker()).delete_language("Cat") is None
+    assert await count(engine, "Cat") == 0
+    assert await count(engine, "Dog") == 4
+    async with engine.connect() as connection:
+        assert await connection.scalar(select(TranslationJob.translation_id)) is None
+
+
+@pytest.mark.asyncio
+async def test_purge_deletes_in_batches_while_writes_go_on(engine):
+    await fill(engine, Cat_Cow=50, Cow_Cat=30, Cow_Dog=10)
+    maker = async_sessionmaker(engine, expire_on_commit=False)
+    purger = LanguagePurger(maker, batch_size=7, pause=0)
+
+    async def write(index: int) -> None:
+        async with maker() as session, session.begin():
+            session.add(
+                Translation(
+                    origin_language="Cow",
+                    translated_language="Dog",
+                    text=f"Moo {index}",
+                    translated_text=f"Woof {index}",
+                )
+            )
+
+    purge = await purger.start("Cat")
+    assert await purger.start("Cat") is purge
+    assert await purger.start("Bird") is None
+    await asyncio.gather(*(write(index) for index in range(20)))
+    await purger._tasks["Cat"]
+
+    assert purge.status == DONE
+    assert purge.deleted == 80
+    assert purge.batches == 13
+    assert await count(engine, "Cat") == 0
+    assert await count(engine, "Dog") == 30
+    async with maker() as session:
+        assert await session.get(Language, "Cat") is None
+    assert purger.stats() == {"running": 0, "done": 1, "failed": 0, "deleted": 80}
+    await purger.close()
+
+
+@pytest.mark.asyncio
+async def test_purge_without_cascade_rules(tmp_path):
+    engine = await make_engine(tmp_path / "legacy.db", legacy=True)
+    await fill(engine, Cat_Cow=5)
+    purger = LanguagePurger(async_sessionmaker(engine), batch_size=5, pause=0)
+
+    purge = await purger.start("Cat")
+    await purger._tasks["Cat"]
+
+    assert (purge.status, purge.deleted) == (DONE, 5)
+    assert await count(engine, "Cat") == 0
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_purge_endpoints(engine):
+    await fill(engine, Cat_Cow=10)
+    maker = async_sessionmaker(engine, expire_on_commit=False)
+    purger = LanguagePurger(maker, batch_size=4, pause=0)
+
+    async def db():
+        async with maker() as session:
+            yield session
+
+    overrides = {main.db_connection: db, main.get_language_purger: lambda: purger}
+    previous = dict(main.application.dependency_overrides)
+    main.application.dependency_overrides.update(overrides)
+    try:
+        async with AsyncClient(app=main.application, base_url="http://127.0.0.1") as ac:
+            missing = await ac.delete("/api/v1/delete_language/Bird?purge=true")
+            started = await ac.delete("/api/v1/delete_language/Cat?purge=true")
+            await purger._tasks["Cat"]
+            progress = await ac.get(started.headers["Location"])
+            unknown = await ac.get("/api/v1/language_purges/Dog")
+    finally:
+        main.application.dependency_overrides.clear()
+        main.application.dependency_overrides.update(previous)
+
+    assert missing.status_code == 404
+    assert started.status_code == 202
+    assert started.json()["status"] == "running"
+    assert progress.json()["status"] == "done"
+    assert progress.json()["deleted"] == 10
+    assert unknown.status_code == 404
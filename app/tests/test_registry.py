@@ -0,0 +1,51 @@
+import pytest
+
+from app.models import Language
+from app.registry import LanguageRegistry
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.mark.asyncio
+async def test_registry_loads_lazily_and_expires(maker):
+    async with maker() as session, session.begin():
+        session.add(Language(name="Cat"))
+
+    clock = FakeClock()
+    registry = LanguageRegistry(ttl=10, clock=clock)
+    assert not registry.knows(["Cat"])
+    assert registry.loads == 0
+
+    assert await registry.names(maker()) == ["Cat"]
+    assert await registry.contains(maker(), "Cat")
+    assert registry.knows(["Cat"])
+    assert registry.loads == 1
+
+    async with maker() as session, session.begin():
+        session.add(Language(name="Dog"))
+    registry.add("Dog")
+    assert registry.knows(["Cat", "Dog"])
+    assert registry.loads == 1
+
+    clock.now = 10
+    assert not registry.knows(["Cat"])
+    assert await registry.names(maker()) == ["Cat", "Dog"]
+    assert registry.loads == 2
+
+
+@pytest.mark.asyncio
+async def test_registry_etag_follows_content(maker):
+    registry = LanguageRegistry()
+    empty_etag = await registry.etag(maker())
+    registry.add("Cat")
+    cat_etag = await registry.etag(maker())
+    registry.invalidate()
+
+    assert cat_etag != empty_etag
+    assert await registry.etag(maker()) == empty_etag
@@ -0,0 +1,132 @@
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from app import main
+from app.database import init_models
+from app.models import Language, Translation
+from app.replica import STICKY_COOKIE, ReplicaRouter, StickyPrimaryMiddleware
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+async def make_database(path, text: str):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}", echo=False)
+    await init_models(engine)
+    maker = async_sessionmaker(engine, expire_on_commit=False)
+    async with maker() as session, session.begin():
+        session.add_all([Language(name="Human"), Language(name="Cat")])
+        session.add(
+            Translation(
+                origin_language="Human",
+                translated_language="Cat",
+                text=text,
+                translated_text="Meow",
+            )
+        )
+    return engine, maker
+
+
+@pytest_asyncio.fixture
+async def databases(tmp_path):
+    primary, primary_maker = await make_database(tmp_path / "primary.db", "primary")
+    replica, _ = await make_database(tmp_path / "replica.db", "replica")
+
+    async def primary_db():
+        async with primary_maker() as session:
+            yield session
+
+    previous = main.application.dependency_overrides.get(main.db_connection)
+    main.application.dependency_overrides[main.db_connection] = primary_db
+    yield primary, replica
+    if previous is None:
+        del main.application.dependency_overrides[main.db_connection]
+    else:
+        main.application.dependency_overrides[main.db_connection] = previous
+    await primary.dispose()
+    await replica.dispose()
+
+
+async def get_text(cookies: dict | None = None) -> str:
+    async with AsyncClient(
+        app=main.application, base_url="http://127.0.0.1", cookies=cookies
+    ) as ac:
+        response = await ac.get("/api/v1/get_translation?id=1")
+    return response.json()["text"]
+
+
+@pytest.mark.asyncio
+async def test_reads_go_to_replica_unless_sticky(databases, monkeypatch):
+    _, replica = databases
+    router = ReplicaRouter(replica)
+    monkeypatch.setattr(main.application.state, "replica_router", router, raising=False)
+
+    assert await get_text() == "replica"
+    assert await get_text({STICKY_COOKIE: "1"}) == "primary"
+    assert router.stats()["replica_reads"] == 1
+    assert router.stats()["primary_reads"] == 1
+
+
+@pytest.mark.asyncio
+async def test_reads_fall_back_to_primary_when_replica_is_down(
+    databases, tmp_path, monkeypatch
+):
+    down = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path}/missing/replica.db", echo=False
+    )
+    clock = FakeClock()
+    router = ReplicaRouter(down, retry_interval=5, clock=clock)
+    monkeypatch.setattr(main.application.state, "replica_router", router, raising=False)
+
+    assert await get_text() == "primary"
+    assert not router.available
+    assert await get_text() == "primary"
+    assert router.stats()["failures"] == 1
+
+    clock.now = 5
+    assert router.available
+
+
+@pytest.mark.asyncio
+async def test_sticky_cookie_is_set_on_writes():
+    async def endpoint(request):
+        return PlainTextResponse("ok")
+
+    app = StickyPrimaryMiddleware(
+        Starlette(routes=[Route("/", endpoint, methods=["GET", "POST"])]),
+        sticky_window=3,
+    )
+    async with AsyncClient(app=app, base_url="http://127.0.0.1") as ac:
+        read = await ac.get("/")
+        write = await ac.post("/")
+
+    assert "set-cookie" not in read.headers
+    assert write.headers["set-cookie"].startswith(f"{STICKY_COOKIE}=1; Max-Age=3")
+
+
+@pytest.mark.asyncio
+async def test_sticky_cookie_follows_the_replica_router():
+    async def endpoint(request):
+        return PlainTextResponse("ok")
+
+    app = Starlette(routes=[Route("/", endpoint, methods=["POST"])])
+    app.add_middleware(StickyPrimaryMiddleware)
+    async with AsyncClient(app=app, base_url="http://127.0.0.1") as ac:
+        without_replica = await ac.post("/")
+        app.state.replica_router = ReplicaRouter(None, sticky_window=7)
+        with_replica = await ac.post("/")
+
+    assert "set-cookie" not in without_replica.headers
+    assert with_replica.headers["set-cookie"].startswith(
+        f"{STICKY_COOKIE}=1; Max-Age=7"
+    )
@@ -0,0 +1,40 @@
+import json
+
+from app import serialization
+from app.main import application
+from app.serialization import FastJSONResponse, dumps, records
+
+
+def test_dumps_matches_json_with_and_without_orjson(monkeypatch):
+    content = records(("id", "text", "rank"), [(1, 'Мяу "мяу"', 0.5), (2, "", -1.0)])
+    expected = json.loads(json.dumps(content))
+    assert json.loads(dumps(content)) == expected
+
+    monkeypatch.setattr(serialization, "orjson", None)
+    assert json.loads(dumps(content)) == expected
+    assert json.loads(FastJSONResponse(content).body) == expected
+
+
+def test_fast_endpoints_keep_response_schemas():
+    paths = application.openapi()["paths"]
+    schemas = {
+        path: paths[path]["get"]["responses"]["200"]["content"]["application/json"][
+            "schema"
+        ]
+        for path in (
+            "/api/v1/get_translation",
+            "/api/v1/get_all_translations",
+            "/api/v1/get_all_languages",
+            "/api/v1/search_translations",
+        )
+    }
+    assert schemas["/api/v1/get_translation"]["$ref"].endswith("/SpeechOutput")
+    assert schemas["/api/v1/get_all_translations"]["items"]["$ref"].endswith(
+        "/SpeechOutput"
+    )
+    assert schemas["/api/v1/get_all_languages"]["items"]["$ref"].endswith(
+        "/LanguageOutput"
+    )
+    assert schemas["/api/v1/search_translations"]["items"]["$ref"].endswith(
+        "/SearchOutput"
+    )
@@ -0,0 +1,92 @@
+import asyncio
+import multiprocessing
+
+import pytest
+
+from app.cache import LRUTranslationCache, TieredTranslationCache
+from app.shared_cache import HEADER_SIZE, SharedTranslationCache
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def fill(path: str, count: int) -> None:
+    cache = SharedTranslationCache(path, size=1 << 20)
+
+    async def run() -> None:
+        for index in range(count):
+            await cache.set((f"moo {index}", "cat"), ("Cow", f"meow {index}"))
+
+    asyncio.run(run())
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_shared_cache_is_shared_and_persistent(tmp_path):
+    path = str(tmp_path / "cache")
+    first = SharedTranslationCache(path, size=1 << 20)
+    second = SharedTranslationCache(path, size=1 << 20)
+
+    await first.set(("Moo", "cat"), ("Cow", "Meow"))
+    assert await second.get(("Moo", "cat")) == ("Cow", "Meow")
+    assert await second.get(("Moo", "dog")) is None
+    first.close()
+    second.close()
+
+    reopened = SharedTranslationCache(path, size=1 << 20)
+    assert await reopened.get(("Moo", "cat")) == ("Cow", "Meow")
+    reopened.close()
+
+    # A different layout resets the file.
+    resized = SharedTranslationCache(path, size=1 << 21)
+    assert await resized.get(("Moo", "cat")) is None
+    resized.close()
+
+
+@pytest.mark.asyncio
+async def test_shared_cache_evicts_within_budget(tmp_path):
+    clock = FakeClock()
+    # Eight slots, every key shares one probe window.
+    cache = SharedTranslationCache(
+        str(tmp_path / "cache"), size=HEADER_SIZE + 8 * 256, slot_size=256, clock=clock
+    )
+    for index in range(10):
+        clock.now += 1
+        await cache.set((f"moo {index}", "cat"), ("Cow", f"meow {index}"))
+
+    assert await cache.get(("moo 0", "cat")) is None
+    assert await cache.get(("moo 1", "cat")) is None
+    assert await cache.get(("moo 9", "cat")) == ("Cow", "meow 9")
+    await cache.set(("moo" * 100, "cat"), ("Cow", "meow"))
+    stats = cache.stats()
+    assert (stats["size"], stats["evictions"], stats["too_large"]) == (8, 2, 1)
+
+    clock.now += 3600
+    assert await cache.get(("moo 9", "cat")) is None
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_shared_cache_across_processes(tmp_path):
+    path = str(tmp_path / "cache")
+    process = multiprocessing.get_context("fork").Process(target=fill, args=(path, 50))
+    process.start()
+    process.join()
+
+    cache = SharedTranslationCache(path, size=1 << 20)
+    assert await cache.get(("moo 42", "cat")) == ("Cow", "meow 42")
+    assert cache.stats()["size"] == 50
+    cache.close()
+
+
+def test_tiered_cache_closes_the_shared_tier(tmp_path):
+    shared = SharedTranslationCache(str(tmp_path / "cache"), size=1 << 20)
+    cache = TieredTranslationCache(LRUTranslationCache(maxsize=10, ttl=60), shared)
+
+    cache.close()
+    assert shared._map.closed
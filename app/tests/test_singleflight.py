@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+from app.cache import LRUTranslationCache
+from app.singleflight import SingleFlight
+from app.translator import Translator
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_are_coalesced():
+    flight = SingleFlight()
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "result"
+
+    results = await asyncio.gather(*(flight.do("key", work) for _ in range(5)))
+
+    assert results == ["result"] * 5
+    assert calls == 1
+    assert flight.stats() == {"calls": 1, "coalesced": 4, "in_flight": 0}
+
+
+@pytest.mark.asyncio
+async def test_errors_propagate_to_all_waiters():
+    flight = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.01)
+        raise KeyError("choices")
+
+    results = await asyncio.gather(
+        *(flight.do("key", work) for _ in range(3)), return_exceptions=True
+    )
+
+    assert all(isinstance(result, KeyError) for result in results)
+    assert len(flight) == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_cancel_others():
+    flight = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.02)
+        return "result"
+
+    first = asyncio.create_task(flight.do("key", work))
+    second = asyncio.create_task(flight.do("key", work))
+    await asyncio.sleep(0)
+    first.cancel()
+
+    assert await second == "result"
+    assert first.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_call_is_cancelled_when_all_waiters_leave():
+    flight = SingleFlight()
+    started = asyncio.Event()
+    finished = False
+
+    async def work():
+        nonlocal finished
+        started.set()
+        await asyncio.sleep(1)
+        finished = True
+
+    waiter = asyncio.create_task(flight.do("key", work))
+    await started.wait()
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    await asyncio.sleep(0.01)
+
+    assert len(flight) == 0
+    assert not finished
+
+
+@pytest.mark.asyncio
+async def test_translator_coalesces_upstream_calls():
+    calls = 0
+
+    class FakeOpenAIClient:
+        async def ask_gpt3(self, prompt, animal):
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "Human", "Meow"
+
+    translator = Translator(FakeOpenAIClient(), LRUTranslationCache(maxsize=0, ttl=0))
+    results = await asyncio.gather(
+        *(translator.translate("Hello", "Cat") for _ in range(10))
+    )
+
+    assert results == [("Human", "Meow", "model")] * 10
+    assert calls == 1
+    assert translator.stats()["coalescing"]["coalesced"] == 9
@@ -0,0 +1,369 @@
+"""
+Bulk import and export of the language and translation tables.
+
+On PostgreSQL the data is moved with the COPY protocol of psycopg: exports
+stream COPY TO STDOUT, imports stream rows into a temporary staging table with
+COPY FROM STDIN and insert them from there with two set-based statements. Other
+databases fall back to batched inserts. Both directions work row by row, so
+memory usage does not depend on the size of the table.
+
+Usage:
+    python -m app.transfer export translation --format csv > translations.csv
+    python -m app.transfer import translation --format csv < translations.csv
+"""
+import argparse
+import asyncio
+import codecs
+import csv
+import io
+import json
+import sys
+from typing import AsyncIterator, Iterable
+
+from sqlalchemy import select, text
+
+from app.crud import Create, CRUDManager
+from app.models import Language, Translation, content_hash
+
+MODELS = {"language": Language, "translation": Translation}
+EXPORT_COLUMNS = {
+    "language": ("name", "created_at", "last_updated"),
+    "translation": (
+        "id",
+        "origin_language",
+        "translated_language",
+        "text",
+        "translated_text",
+    ),
+}
+# Keys are assigned by the target database, so ids are not imported.
+IMPORT_COLUMNS = {
+    "language": ("name",),
+    "translation": (
+        "origin_language",
+        "translated_language",
+        "text",
+        "translated_text",
+    ),
+}
+FORMATS = ("csv", "ndjson")
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+class Transfer(CRUDManager):
+    async def export_table(
+        self, table: str, format: str, batch_size: int = 5000
+    ) -> AsyncIterator[bytes]:
+        """
+        Export a table.
+
+        This method streams the rows of a table as CSV with a header line,
+        or as NDJSON.
+
+        Args:
+            table (str): "language" or "translation".
+            format (str): "csv" or "ndjson".
+            batch_size (int): The number of rows fetched per round trip on
+                databases without COPY.
+
+        Yields:
+            bytes: Chunks of the exported data.
+        """
+        columns = EXPORT_COLUMNS[table]
+        async with self.session, self.session.begin():
+            if self._is_postgresql():
+                chunks = self._copy_out(table, columns, format)
+            else:
+                chunks = self._select_out(table, columns, format, batch_size)
+            async for chunk in chunks:
+                yield chunk
+
+    async def import_table(
+        self,
+        table: str,
+        format: str,
+        chunks: AsyncIterator[bytes],
+        batch_size: int = 5000,
+        dedup: bool = False,
+    ) -> int:
+        """
+        Import rows into a table.
+
+        This method reads CSV with a header line or NDJSON and inserts the rows
+        in a single transaction. Languages referenced by imported translations
+        are registered in bulk, languages that already exist are skipped.
+        With dedup, translations of a text to a language that is stored or
+        imported already are skipped as in `Create.register_translations`.
+
+        Args:
+            table (str): "language" or "translation".
+            format (str): "csv" or "ndjson".
+            chunks (AsyncIterator[bytes]): The data to import.
+            batch_size (int): The number of rows per insert on databases
+                without COPY.
+            dedup (bool): Whether to skip repeated translations.
+
+        Returns:
+            int: The number of imported rows, skipped ones included.
+
+        Raises:
+            ImportFormatError: If a record cannot be parsed, misses a column or
+                has a value that is not a string.
+        """
+        rows = _parse_rows(chunks, format, IMPORT_COLUMNS[table])
+        async with self.session, self.session.begin():
+            if self._is_postgresql():
+                return await self._copy_in(table, rows, dedup)
+            return await self._insert_in(table, rows, batch_size, dedup)
+
+    def _is_postgresql(self) -> bool:
+        return self.session.bind.dialect.name == "postgresql"
+
+    async def _driver_connection(self):
+        connection = await self.session.connection()
+        return (await connection.get_raw_connection()).driver_connection
+
+    async def _copy_out(
+        self, table: str, columns: Iterable[str], format: str
+    ) -> AsyncIterator[bytes]:
+        driver_connection = await self._driver_connection()
+        column_list = ", ".join(columns)
+        async with driver_connection.cursor() as cursor:
+            if format == "csv":
+                statement = (
+                    f"COPY {table} ({column_list}) TO STDOUT (FORMAT csv, HEADER)"
+                )
+                async with cursor.copy(statement) as copy:
+                    async for data in copy:
+                        yield bytes(data)
+                return
+
+            statement = (
+                f"COPY (SELECT row_to_json(t) FROM (SELECT {column_list} "
+                f"FROM {table}) t) TO STDOUT"
+            )
+            async with cursor.copy(statement) as copy:
+                async for (row,) in copy.rows():
+                    yield row.encode() + b"\n"
+
+    async def _select_out(
+        self, table: str, columns: Iterable[str], format: str, batch_size: int
+    ) -> AsyncIterator[bytes]:
+        model = MODELS[table]
+        stmt = select(*(getattr(model, column) for column in columns))
+        result = await self.session.stream(stmt.execution_options(yield_per=batch_size))
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if format == "csv":
+            writer.writerow(columns)
+        async for partition in result.partitions():
+            for row in partition:
+                if format == "csv":
+                    writer.writerow(row)
+                else:
+                    record = {
+                        column: value.isoformat()
+                        if hasattr(value, "isoformat")
+                        else value
+                        for column, value in zip(columns, row)
+                    }
+                    buffer.write(json.dumps(record, ensure_ascii=False) + "\n")
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+
+    async def _copy_in(
+        self, table: str, rows: AsyncIterator[tuple], dedup: bool
+    ) -> int:
+        columns = IMPORT_COLUMNS[table]
+        if table == "translation":
+            # COPY bypasses the column default, the hash is computed here.
+            columns = (*columns, "content_hash")
+            rows = _with_content_hash(rows, columns.index("text"))
+        columns = ", ".join(columns)
+        await self.session.execute(
+            text(
+                f"CREATE TEMP TABLE {table}_import ON COMMIT DROP AS "
+                f"SELECT {columns} FROM {table} WITH NO DATA"
+            )
+        )
+        driver_connection = await self._driver_connection()
+        count = 0
+        async with driver_connection.cursor() as cursor:
+            async with cursor.copy(
+                f"COPY {table}_import ({columns}) FROM STDIN"
+            ) as copy:
+                async for row in rows:
+                    await copy.write_row(row)
+                    count += 1
+
+        if table == "translation":
+            await self.session.execute(
+                text(
+                    "INSERT INTO language (name, created_at, last_updated) "
+                    "SELECT name, now(), now() FROM ("
+                    "SELECT origin_language AS name FROM translation_import "
+                    "UNION SELECT translated_language FROM translation_import"
+                    ") names ON CONFLICT DO NOTHING"
+                )
+            )
+            if dedup:
+                # The set-based form of Create.add_translation_rows with dedup.
+                select_rows = (
+                    "SELECT DISTINCT ON (content_hash, lower(translated_language)) "
+                    f"{columns} FROM translation_import imported WHERE NOT EXISTS ("
+                    "SELECT 1 FROM translation stored "
+                    "WHERE stored.content_hash = imported.content_hash "
+                    "AND lower(stored.translated_language) = "
+                    "lower(imported.translated_language))"
+                )
+            else:
+                select_rows = f"SELECT {columns} FROM translation_import"
+            await self.session.execute(
+                text(f"INSERT INTO translation ({columns}) {select_rows}")
+            )
+        else:
+            await self.session.execute(
+                text(
+                    "INSERT INTO language (name, created_at, last_updated) "
+                    "SELECT DISTINCT name, now(), now() FROM language_import "
+                    "ON CONFLICT DO NOTHING"
+                )
+            )
+        return count
+
+    async def _insert_in(
+        self, table: str, rows: AsyncIterator[tuple], batch_size: int, dedup: bool
+    ) -> int:
+        columns = IMPORT_COLUMNS[table]
+        count = 0
+        batch = []
+        async for row in rows:
+            batch.append(dict(zip(columns, row)))
+            if len(batch) >= batch_size:
+                count += await self._insert_batch(table, batch, dedup)
+                batch = []
+        if batch:
+            count += await self._insert_batch(table, batch, dedup)
+        return count
+
+    async def _insert_batch(self, table: str, batch: list[dict], dedup: bool) -> int:
+        if table == "translation":
+            for row in batch:
+                row["content_hash"] = content_hash(row["text"])
+            await Create(self.session).add_translation_rows(batch, dedup)
+        else:
+            await self.session.execute(self.insert_ignore(Language), batch)
+        return len(batch)
+
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer
+
+
+async def _records(chunks: AsyncIterator[bytes], format: str) -> AsyncIterator[dict]:
+    if format == "ndjson":
+        async for line in _lines(chunks):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise ImportFormatError(f"Invalid JSON line: {line[:80]!r}")
+            if not isinstance(record, dict):
+                raise ImportFormatError(f"Line is not an object: {line[:80]!r}")
+            yield record
+        return
+
+    header = None
+    pending: list[str] = []
+    async for line in _lines(chunks):
+        pending.append(line)
+        record_text = "\n".join(pending)
+        # A quoted field may contain line breaks, wait for its closing quote.
+        if record_text.count('"') % 2:
+            continue
+        pending = []
+        if not record_text.strip():
+            continue
+        values = next(csv.reader([record_text]))
+        if header is None:
+            header = values
+        else:
+            yield dict(zip(header, values))
+    if pending:
+        raise ImportFormatError("Unterminated quoted field")
+
+
+async def _parse_rows(
+    chunks: AsyncIterator[bytes], format: str, columns: tuple[str, ...]
+) -> AsyncIterator[tuple]:
+    async for record in _records(chunks, format):
+        row = []
+        for column in columns:
+            if column not in record:
+                raise ImportFormatError(f"Missing column {column!r}")
+            value = record[column]
+            # Short CSV lines and JSON nulls give None, JSON numbers stay numbers.
+            if not isinstance(value, str):
+                raise ImportFormatError(f"Column {column!r} is not a string: {value!r}")
+            row.append(value)
+        yield tuple(row)
+
+
+async def _with_content_hash(
+    rows: AsyncIterator[tuple], text_index: int
+) -> AsyncIterator[tuple]:
+    async for row in rows:
+        yield (*row, content_hash(row[text_index]))
+
+
+async def _read_stdin() -> AsyncIterator[bytes]:
+    while chunk := sys.stdin.buffer.read(1 << 16):
+        yield chunk
+
+
+async def main(args: argparse.Namespace) -> None:
+    from app.config import get_settings
+    from app.database import get_database
+
+    database = get_database()
+    transfer = Transfer(database.maker())
+    try:
+        if args.command == "export":
+            async for chunk in transfer.export_table(args.table, args.format):
+                sys.stdout.buffer.write(chunk)
+        else:
+            count = await transfer.import_table(
+                args.table,
+                args.format,
+                _read_stdin(),
+                dedup=get_settings().dedup_translations,
+            )
+            print(f"Imported {count} rows into {args.table}", file=sys.stderr)
+    finally:
+        await database.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("command", choices=("export", "import"))
+    parser.add_argument("table", choices=tuple(MODELS))
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    asyncio.run(main(parser.parse_args()))
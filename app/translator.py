@@ -0,0 +1,153 @@
+from typing import AsyncIterator, NamedTuple
+
+from app.backends import Backend, HedgedBackend
+from app.batching import TranslationBatcher
+from app.cache import CachedTranslation, CacheKey, TranslationCache, normalize_key
+from app.memory import TranslationMemory
+from app.openai import AnswerStreamParser
+from app.prompts import AnswerFormatError
+from app.singleflight import SingleFlight
+
+
+class TranslationResult(NamedTuple):
+    translated_from: str
+    text: str
+    # "cache", "memory" or "model"
+    source: str
+
+
+class Translator:
+    """
+    Translation pipeline in front of the translation backend.
+
+    A request is answered from the cache when possible, then from the
+    translation memory of stored near-duplicates. Otherwise identical requests
+    in flight are coalesced into one upstream call, whose result is stored in
+    the cache.
+    """
+
+    def __init__(
+        self,
+        client: Backend | TranslationBatcher,
+        cache: TranslationCache,
+        flight: SingleFlight | None = None,
+        memory: TranslationMemory | None = None,
+    ) -> None:
+        """
+        Initialize a Translator object.
+
+        Args:
+            client (Backend | TranslationBatcher): The backend used for
+                upstream calls, or a batcher in front of it.
+            cache (TranslationCache): The cache of finished translations.
+            flight (SingleFlight | None): The coalescing stage for upstream calls.
+            memory (TranslationMemory | None): The translation memory, or None
+                to skip reuse of similar stored translations.
+        """
+        self.client = client
+        self.cache = cache
+        self.flight = flight or SingleFlight()
+        self.memory = memory
+
+    async def translate(self, text: str, language: str) -> TranslationResult:
+        """
+        Translate a text.
+
+        Args:
+            text (str): The text to translate.
+            language (str): The language to translate to.
+
+        Returns:
+            TranslationResult: The detected source language, the translated
+                text and the stage that produced them.
+        """
+        key = normalize_key(text, language)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            return TranslationResult(*cached, "cache")
+        remembered = await self._remember(key, text, language)
+        if remembered is not None:
+            return TranslationResult(*remembered, "memory")
+        result = await self.flight.do(key, lambda: self._ask(key, text, language))
+        return TranslationResult(*result, "model")
+
+    async def stream(self, text: str, language: str) -> AsyncIterator[tuple[str, str]]:
+        """
+        Translate a text, streaming the answer as it is generated.
+
+        Cache and memory hits are replayed as one language and one token
+        event. Streamed requests are not coalesced, every caller reads its own
+        stream.
+
+        Args:
+            text (str): The text to translate.
+            language (str): The language to translate to.
+
+        Yields:
+            tuple[str, str]: ("source", stage) first, ("language", name) once
+                the source language is known, then ("token", text) for every
+                piece of the translation.
+
+        Raises:
+            AnswerFormatError: If the streamed answer lacks the language or
+                the translation, nothing is cached then.
+        """
+        key = normalize_key(text, language)
+        cached = await self.cache.get(key)
+        source = "cache"
+        if cached is None:
+            cached = await self._remember(key, text, language)
+            source = "memory"
+        if cached is not None:
+            yield ("source", source)
+            yield ("language", cached[0])
+            yield ("token", cached[1])
+            return
+
+        yield ("source", "model")
+        parser = AnswerStreamParser()
+        async for delta in self.client.stream_gpt3(text, language):
+            for event in parser.feed(delta):
+                yield event
+        for event in parser.finish():
+            yield event
+        if not parser.language or not parser.translation:
+            # Refusals and empty answers must not be served from the cache.
+            raise AnswerFormatError(f"{parser.language}\n{parser.translation}")
+        await self.cache.set(key, (parser.language, parser.translation))
+
+    async def _remember(
+        self, key: CacheKey, text: str, language: str
+    ) -> CachedTranslation | None:
+        if self.memory is None:
+            return None
+        match = await self.memory.lookup(text, language)
+        if match is None:
+            return None
+        result = (match.origin_language, match.translated_text)
+        await self.cache.set(key, result)
+        return result
+
+    async def _ask(self, key: CacheKey, text: str, language: str) -> CachedTranslation:
+        result = await self.client.ask_gpt3(text, language)
+        await self.cache.set(key, result)
+        return result
+
+    def stats(self) -> dict:
+        """
+        Get translation pipeline counters.
+
+        Returns:
+            dict: The counters of the cache, of the coalescing stage and of
+                the memory, batching and hedging stages if enabled.
+        """
+        stats = {"cache": self.cache.stats(), "coalescing": self.flight.stats()}
+        if self.memory is not None:
+            stats["memory"] = self.memory.stats()
+        backend = self.client
+        if isinstance(backend, TranslationBatcher):
+            stats["batching"] = backend.stats()
+            backend = backend.client
+        if isinstance(backend, HedgedBackend):
+            stats["hedging"] = backend.stats()
+        return stats
@@ -0,0 +1,69 @@
+"""
+Per-request latency of the OpenAI client with and without connection pooling.
+
+The "before" case opens a new client session for every call, as ask_gpt3 used
+to do, the "after" case reuses one started OpenAIClient.
+
+Usage:
+    python -m benchmarks.bench_openai_client --requests 500
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+os.environ.setdefault("API_KEY", "bench")
+
+from app.openai import OpenAIClient  # noqa: E402
+from benchmarks.mock_openai import make_app, start_server  # noqa: E402
+
+
+async def per_call_session(url: str, requests: int) -> list[float]:
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        async with OpenAIClient("bench", url=url) as client:
+            await client.ask_gpt3("Moo", "English")
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+async def pooled_session(url: str, requests: int) -> list[float]:
+    latencies = []
+    async with OpenAIClient("bench", url=url) as client:
+        for _ in range(requests):
+            started = time.perf_counter()
+            await client.ask_gpt3("Moo", "English")
+            latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def report(name: str, latencies: list[float]) -> None:
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{name:<18} mean {statistics.mean(latencies) * 1000:7.3f} ms"
+        f"  p50 {statistics.median(latencies) * 1000:7.3f} ms"
+        f"  p95 {p95 * 1000:7.3f} ms"
+    )
+
+
+async def main(requests: int, latency: float) -> None:
+    runner, url = await start_server(make_app(latency))
+    try:
+        await pooled_session(url, 10)  # warm up
+        report("session per call", await per_call_session(url, requests))
+        report("pooled client", await pooled_session(url, requests))
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="mock upstream latency, seconds"
+    )
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.latency))
@@ -0,0 +1,128 @@
+"""
+Prompt tokens of the templates and parse time of their answers.
+
+The token counts cover the messages of every text in the load test corpus.
+Parsing is measured on a corpus of tricky answers: colons and line breaks in
+the translation, chatter around the answer, quotes and code fences. The
+"split" parser is the positional `re.split` parser ask_gpt3 used to call,
+its results are compared with the expected values to count wrong answers.
+
+Usage:
+    python -m benchmarks.bench_prompts --rounds 10000
+"""
+import argparse
+import json
+import os
+import re
+import time
+from pathlib import Path
+
+os.environ.setdefault("API_KEY", "bench")
+
+from app.prompts import (  # noqa: E402
+    TEMPLATES,
+    AnswerFormatError,
+    count_message_tokens,
+    parse_answer,
+    parse_json_answer,
+    tiktoken,
+)
+
+CORPUS = Path(__file__).with_name("corpus.jsonl")
+
+# (animal, translation, line answer), the JSON answer is built from the values.
+TRICKY = [
+    ("Cow", "Hi, how are you?", "Animal: Cow\nTranslation: Hi, how are you?"),
+    ("Human", "Note: moo.", "Animal: Human\nTranslation: Note: moo."),
+    (
+        "Cat",
+        "Meow.\nMeow: meow!",
+        "Animal: Cat\nTranslation: Meow.\nMeow: meow!",
+    ),
+    (
+        "Dog",
+        "Woof woof.",
+        'Sure! Here it is:\n"Animal: Dog\n     Translation: Woof woof."',
+    ),
+    ("Human", "12:30, time to eat", "Animal:Human\nTranslation:12:30, time to eat"),
+    ("Fish", "Blob.", "Animal: Fish\n\nTranslation:   Blob.  \n"),
+    ("Human", "Привет: как дела?", "animal: Human\ntranslation: Привет: как дела?"),
+]
+
+
+def split_parse(answer: str) -> tuple[str, str]:
+    answer = re.split(r":|\n", answer)
+    answer_list = []
+    for a in answer:
+        if a.startswith(" "):
+            a = a[1:]
+        answer_list.append(a)
+    return (answer_list[1], answer_list[3])
+
+
+def json_answers() -> list[str]:
+    answers = []
+    for index, (animal, translation, _) in enumerate(TRICKY):
+        answer = json.dumps({"animal": animal, "translation": translation})
+        if index % 2:
+            answer = f"```json\n{answer}\n```"
+        answers.append(answer)
+    return answers
+
+
+def report_tokens() -> None:
+    requests = [json.loads(line) for line in CORPUS.read_text().splitlines()]
+    tasks = [
+        request["json"]
+        for request in requests
+        if request["path"] == "/api/v1/create_translation"
+    ]
+    counter = "tiktoken" if tiktoken is not None else "estimate"
+    print(f"prompt tokens per request ({counter}, {len(tasks)} texts)")
+    baseline = None
+    for name, template in TEMPLATES.items():
+        tokens = sum(
+            count_message_tokens(
+                template.request(task["text"], task["translate_to_language"])[
+                    "messages"
+                ]
+            )
+            for task in tasks
+        ) / len(tasks)
+        baseline = baseline or tokens
+        print(f"  {name:<14} {tokens:8.1f}  {1 - tokens / baseline:6.1%} saved")
+
+
+def report_parse(name: str, parse, answers: list[str], rounds: int) -> None:
+    wrong = 0
+    for (animal, translation, _), answer in zip(TRICKY, answers):
+        try:
+            wrong += parse(answer) != (animal, translation)
+        except (IndexError, AnswerFormatError):
+            wrong += 1
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for answer in answers:
+            try:
+                parse(answer)
+            except (IndexError, AnswerFormatError):
+                pass
+    elapsed = time.perf_counter() - started
+    per_answer = elapsed / (rounds * len(answers)) * 1e6
+    print(f"  {name:<14} {per_answer:8.2f} us  {wrong}/{len(answers)} wrong")
+
+
+def main(rounds: int) -> None:
+    report_tokens()
+    line_answers = [answer for _, _, answer in TRICKY]
+    print(f"parse time per answer ({len(TRICKY)} tricky answers)")
+    report_parse("split", split_parse, line_answers, rounds)
+    report_parse("lines", parse_answer, line_answers, rounds)
+    report_parse("json", parse_json_answer, json_answers(), rounds)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=10000)
+    args = parser.parse_args()
+    main(args.rounds)
@@ -0,0 +1,67 @@
+"""
+Per-row cost of serializing translation pages.
+
+The "pydantic" path is the one read endpoints used before: a SpeechOutput per
+row, validated again against the response model, encoded by
+jsonable_encoder and the json module. The "fast" path encodes the selected
+column tuples in one pass, see app/serialization.py.
+
+Usage:
+    python -m benchmarks.bench_serialization --rows 10000 1000000
+"""
+import argparse
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import parse_obj_as
+
+from app.pydantic_models import SpeechOutput
+from app.serialization import dumps, orjson, records
+
+FIELDS = tuple(SpeechOutput.__fields__)
+
+
+def make_rows(count: int) -> list[tuple]:
+    return [
+        (index, "Cow", "Cat", f"Moo moo {index}", f"Мяу мяу {index}")
+        for index in range(count)
+    ]
+
+
+def pydantic_path(rows: list[tuple]) -> bytes:
+    output = [SpeechOutput(**dict(zip(FIELDS, row))) for row in rows]
+    validated = parse_obj_as(list[SpeechOutput], output)
+    return JSONResponse(jsonable_encoder(validated)).body
+
+
+def fast_path(rows: list[tuple]) -> bytes:
+    return dumps(records(FIELDS, rows))
+
+
+PATHS = {"pydantic": pydantic_path, "fast": fast_path}
+
+
+def measure(path, rows: list[tuple]) -> tuple[float, int]:
+    started = time.perf_counter()
+    body = path(rows)
+    return time.perf_counter() - started, len(body)
+
+
+def main(args: argparse.Namespace) -> None:
+    print(f"encoder: {'orjson' if orjson is not None else 'json'}")
+    for count in args.rows:
+        rows = make_rows(count)
+        results = {name: measure(path, rows) for name, path in PATHS.items()}
+        for name, (elapsed, size) in results.items():
+            print(
+                f"{count:>9} rows  {name:<8} {elapsed / count * 1e6:7.2f} us/row"
+                f"  total {elapsed:7.2f} s  {size / 1e6:7.1f} MB"
+            )
+        print(f"{'':>15} speedup {results['pydantic'][0] / results['fast'][0]:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 1000000])
+    main(parser.parse_args())
@@ -0,0 +1,84 @@
+"""
+Hit rate and lookup time of the translation cache across worker processes.
+
+Every process plays a uvicorn worker: it looks up keys drawn from a Zipf-like
+distribution and caches the translation on a miss. The "per-process" case
+uses the in-process LRU tier only, so each worker warms its own copy, the
+"shared" case adds the memory-mapped tier every worker reads and writes.
+
+Usage:
+    python -m benchmarks.bench_shared_cache --workers 4 --requests 20000
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from app.cache import LRUTranslationCache, TieredTranslationCache
+from app.shared_cache import SharedTranslationCache
+
+
+def worker(args: tuple) -> tuple[int, int, float]:
+    seed, requests, keys, lru_size, shared_path = args
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(keys)]
+    drawn = rng.choices(range(keys), weights, k=requests)
+    tiers = [LRUTranslationCache(maxsize=lru_size, ttl=3600)]
+    if shared_path:
+        tiers.append(SharedTranslationCache(shared_path, size=64 << 20))
+    cache = TieredTranslationCache(*tiers)
+
+    async def run() -> float:
+        lookups = 0.0
+        for index in drawn:
+            key = (f"Moo moo {index}", "english")
+            started = time.perf_counter()
+            value = await cache.get(key)
+            lookups += time.perf_counter() - started
+            if value is None:
+                await cache.set(key, ("Cow", f"Hello {index}"))
+        return lookups
+
+    lookups = asyncio.run(run())
+    return cache.hits, cache.misses, lookups
+
+
+def run_case(name: str, args: argparse.Namespace, shared_path: str | None) -> None:
+    jobs = [
+        (seed, args.requests, args.keys, args.lru_size, shared_path)
+        for seed in range(args.workers)
+    ]
+    started = time.perf_counter()
+    with multiprocessing.get_context("fork").Pool(args.workers) as pool:
+        results = pool.map(worker, jobs)
+    elapsed = time.perf_counter() - started
+    hits = sum(result[0] for result in results)
+    misses = sum(result[1] for result in results)
+    lookup = sum(result[2] for result in results) / (hits + misses)
+    print(
+        f"{name:<14} hit rate {hits / (hits + misses):6.1%}"
+        f"  misses {misses:7}  lookup {lookup * 1e6:6.2f} us"
+        f"  wall {elapsed:6.2f} s"
+    )
+
+
+def main(args: argparse.Namespace) -> None:
+    print(
+        f"{args.workers} workers, {args.requests} requests each, "
+        f"{args.keys} keys, LRU size {args.lru_size}"
+    )
+    run_case("per-process", args, None)
+    with tempfile.TemporaryDirectory() as directory:
+        run_case("shared", args, os.path.join(directory, "cache"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--keys", type=int, default=50000)
+    parser.add_argument("--lru-size", type=int, default=1024)
+    main(parser.parse_args())
@@ -0,0 +1,118 @@
+"""
+Startup time of the translator service.
+
+A uvicorn process is started against a temporary SQLite database and polled
+until it answers, for a new database and for one already at the latest
+schema version. The import time of app.main and the schema check of an
+up-to-date database, versioned check against create_all, are measured too.
+
+Usage:
+    python -m benchmarks.bench_startup --runs 5
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.database import init_models
+from app.migrations import migrate
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_to_first_request(database_url: str) -> float:
+    port = free_port()
+    env = {**os.environ, "DATABASE_URL": database_url, "API_KEY": "blank"}
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app.main:application",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        env=env,
+    )
+    try:
+        while True:
+            try:
+                httpx.get(f"http://127.0.0.1:{port}/metrics", timeout=1)
+                return time.perf_counter() - started
+            except httpx.TransportError:
+                if server.poll() is not None:
+                    raise RuntimeError("uvicorn exited")
+                time.sleep(0.005)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def import_time() -> float:
+    code = (
+        "import time; started = time.perf_counter(); import app.main; "
+        "print(time.perf_counter() - started)"
+    )
+    env = {**os.environ, "API_KEY": "blank"}
+    output = subprocess.check_output([sys.executable, "-c", code], env=env)
+    return float(output)
+
+
+async def schema_check(database_url: str, runs: int) -> tuple[float, float]:
+    engine = create_async_engine(database_url, echo=False)
+    await migrate(engine)
+    timings = []
+    for check in (migrate, init_models):
+        started = time.perf_counter()
+        for _ in range(runs):
+            await check(engine)
+        timings.append((time.perf_counter() - started) / runs)
+    await engine.dispose()
+    return timings[0], timings[1]
+
+
+def report(name: str, values: list[float]) -> None:
+    values = sorted(values)
+    print(
+        f"{name:<28} median {values[len(values) // 2] * 1e3:8.1f} ms"
+        f"  min {values[0] * 1e3:8.1f} ms"
+    )
+
+
+def main(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        fresh, migrated = [], []
+        for run in range(args.runs):
+            url = f"sqlite+aiosqlite:///{directory}/startup{run}.db"
+            fresh.append(time_to_first_request(url))
+            migrated.append(time_to_first_request(url))
+        report("first request, new db", fresh)
+        report("first request, migrated db", migrated)
+        report("import app.main", [import_time() for _ in range(args.runs)])
+
+        versioned, create_all = asyncio.run(
+            schema_check(f"sqlite+aiosqlite:///{directory}/check.db", args.checks)
+        )
+        report("schema check, versioned", [versioned])
+        report("schema check, create_all", [create_all])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--checks", type=int, default=50)
+    main(parser.parse_args())
@@ -0,0 +1,278 @@
+"""
+Load test of the translator service against a local OpenAI stand-in.
+
+The FastAPI application is served by uvicorn in this process, with the OpenAI
+endpoint pointed at benchmarks/mock_openai.py. The request corpus is replayed
+at the target concurrency, then latency percentiles, throughput and the number
+of upstream calls are reported per endpoint.
+
+Endpoints are named by method and route template. Upstream calls are
+attributed to the endpoint whose request made them. Calls of background work,
+e.g. of the batcher or the job workers, are reported apart. Retries count in
+the total of the stand-in only.
+
+Every corpus line is a JSON object with "method", "path" and an optional
+"json" body, see benchmarks/corpus.jsonl.
+
+Usage:
+    python -m benchmarks.loadtest --requests 2000 --concurrency 50 \\
+        --latency 0.2 --error-rate 0.01
+    python -m benchmarks.loadtest --database-url postgresql+psycopg://... \\
+        --json report.json --max-p95-ms 500
+    OPENAI_RPM=3000 python -m benchmarks.loadtest --upstream-rpm 3000
+
+Application settings, e.g. TRANSLATION_CACHE_SIZE=0, are read from the
+environment as usual.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from urllib.parse import urlsplit
+
+import httpx
+import uvicorn
+from starlette.routing import Match
+
+from app.backends import BACKENDS, register_backend
+from benchmarks.mock_openai import make_app, start_server
+
+BACKGROUND = "(background)"
+# The endpoint of the request being served in the current task.
+ENDPOINT: ContextVar[str] = ContextVar("endpoint", default=BACKGROUND)
+
+
+def endpoint_of(app, method: str, path: str) -> str:
+    """
+    Name the endpoint of a request by its method and route template.
+
+    Requests to a parameterized route, e.g. /api/v1/translation_jobs/{id},
+    share one endpoint. Unrouted paths are named by themselves.
+    """
+    scope = {"type": "http", "method": method, "path": path}
+    for route in app.routes:
+        match, _ = route.matches(scope)
+        if match != Match.NONE:
+            return f"{method} {route.path}"
+    return f"{method} {path}"
+
+
+class EndpointTagger:
+    """ASGI middleware tagging the upstream calls of a request with its endpoint."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "http":
+            ENDPOINT.set(endpoint_of(self.app, scope["method"], scope["path"]))
+        await self.app(scope, receive, send)
+
+
+class CountingBackend:
+    """Backend wrapper counting calls by the endpoint that made them."""
+
+    def __init__(self, backend, calls: Counter) -> None:
+        self.backend = backend
+        self.calls = calls
+
+    def __getattr__(self, name: str):
+        return getattr(self.backend, name)
+
+    async def __aenter__(self) -> "CountingBackend":
+        await self.backend.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.backend.__aexit__(*exc_info)
+
+    async def ask_gpt3(self, prompt: str, animal: str) -> tuple[str, str]:
+        self.calls[ENDPOINT.get()] += 1
+        return await self.backend.ask_gpt3(prompt, animal)
+
+    def stream_gpt3(self, prompt: str, animal: str):
+        self.calls[ENDPOINT.get()] += 1
+        return self.backend.stream_gpt3(prompt, animal)
+
+    async def ask_batch(self, tasks: list[tuple[str, str]]) -> dict:
+        self.calls[ENDPOINT.get()] += 1
+        return await self.backend.ask_batch(tasks)
+
+
+def count_backend_calls(calls: Counter) -> None:
+    for name, factory in list(BACKENDS.items()):
+        register_backend(
+            name, lambda factory=factory: CountingBackend(factory(), calls)
+        )
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(q / 100 * len(values)) - 1))
+    return values[index]
+
+
+def load_corpus(path: str) -> list[dict]:
+    with open(path) as corpus:
+        return [json.loads(line) for line in corpus if line.strip()]
+
+
+async def replay(
+    app, base_url: str, corpus: list[dict], requests: int, concurrency: int
+) -> dict[str, dict]:
+    results: dict[str, dict] = defaultdict(lambda: {"latencies": [], "errors": 0})
+    entries = itertools.islice(itertools.cycle(corpus), requests)
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(
+        base_url=base_url, limits=limits, timeout=60
+    ) as client:
+
+        async def worker() -> None:
+            for entry in entries:
+                path = urlsplit(entry["path"]).path
+                endpoint = endpoint_of(app, entry["method"], path)
+                started = time.perf_counter()
+                try:
+                    response = await client.request(
+                        entry["method"], entry["path"], json=entry.get("json")
+                    )
+                    await response.aread()
+                    failed = response.status_code >= 500
+                except httpx.HTTPError:
+                    failed = True
+                results[endpoint]["latencies"].append(time.perf_counter() - started)
+                results[endpoint]["errors"] += failed
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results
+
+
+def build_report(
+    results: dict[str, dict], elapsed: float, mock, calls: Counter
+) -> dict:
+    report = {
+        "elapsed_s": round(elapsed, 3),
+        "requests": sum(len(r["latencies"]) for r in results.values()),
+        "upstream_calls": mock["calls"],
+        "upstream_errors": mock["errors"],
+        "background_upstream_calls": calls[BACKGROUND],
+        "endpoints": {},
+    }
+    report["rps"] = round(report["requests"] / elapsed, 1)
+    for endpoint, result in sorted(results.items()):
+        latencies = result["latencies"]
+        report["endpoints"][endpoint] = {
+            "requests": len(latencies),
+            "errors": result["errors"],
+            "rps": round(len(latencies) / elapsed, 1),
+            "upstream_calls": calls[endpoint],
+            **{
+                f"p{q}_ms": round(percentile(latencies, q) * 1000, 2)
+                for q in (50, 95, 99)
+            },
+        }
+    return report
+
+
+def print_report(report: dict) -> None:
+    print(
+        f"{report['requests']} requests in {report['elapsed_s']} s, "
+        f"{report['rps']} req/s, {report['upstream_calls']} upstream calls "
+        f"({report['upstream_errors']} errors, "
+        f"{report['background_upstream_calls']} from background work)"
+    )
+    print(
+        f"{'endpoint':<45} {'count':>6} {'errors':>6} {'rps':>8} {'calls':>6}"
+        f" {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+    )
+    for endpoint, stats in report["endpoints"].items():
+        print(
+            f"{endpoint:<45} {stats['requests']:>6} {stats['errors']:>6}"
+            f" {stats['rps']:>8} {stats['upstream_calls']:>6} {stats['p50_ms']:>8}"
+            f" {stats['p95_ms']:>8} {stats['p99_ms']:>8}"
+        )
+
+
+async def main(args: argparse.Namespace) -> dict:
+    mock = make_app(args.latency, args.error_rate, seed=0, rpm=args.upstream_rpm)
+    mock_runner, mock_url = await start_server(mock)
+
+    os.environ["OPENAI_URL"] = mock_url
+    os.environ.setdefault("API_KEY", "loadtest")
+    os.environ["DATABASE_URL"] = args.database_url
+    from app.main import application
+
+    calls: Counter = Counter()
+    count_backend_calls(calls)
+    config = uvicorn.Config(
+        EndpointTagger(application),
+        host="127.0.0.1",
+        port=args.port,
+        log_level="warning",
+    )
+    server = uvicorn.Server(config)
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    try:
+        corpus = load_corpus(args.corpus)
+        started = time.perf_counter()
+        results = await replay(
+            application,
+            f"http://127.0.0.1:{args.port}",
+            corpus,
+            args.requests,
+            args.concurrency,
+        )
+        return build_report(results, time.perf_counter() - started, mock, calls)
+    finally:
+        server.should_exit = True
+        await server_task
+        await mock_runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--corpus", default="benchmarks/corpus.jsonl")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="mock upstream latency, seconds"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="share of upstream 429s"
+    )
+    parser.add_argument(
+        "--upstream-rpm", type=int, default=0, help="mock upstream request quota"
+    )
+    parser.add_argument(
+        "--database-url",
+        default="sqlite+aiosqlite:///"
+        + os.path.join(tempfile.mkdtemp(prefix="loadtest-"), "loadtest.db"),
+    )
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument(
+        "--max-p95-ms", type=float, help="exit with 1 if an endpoint p95 is slower"
+    )
+    args = parser.parse_args()
+
+    report = asyncio.run(main(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(report, output, indent=2)
+    if args.max_p95_ms is not None and any(
+        stats["p95_ms"] > args.max_p95_ms for stats in report["endpoints"].values()
+    ):
+        sys.exit(1)
@@ -0,0 +1,133 @@
+"""Local stand-in for the OpenAI chat completions endpoint."""
+import asyncio
+import json
+import math
+import random
+import time
+from collections import deque
+
+from aiohttp import web
+
+ANSWER = "Animal: Human\nTranslation: Meow meow."
+JSON_ANSWER = json.dumps({"animal": "Human", "translation": "Meow meow."})
+
+
+def completion(content: str = ANSWER) -> dict:
+    return {
+        "id": "chatcmpl-mock",
+        "object": "chat.completion",
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+def batch_answer(tasks: list[dict]) -> str:
+    return json.dumps(
+        {
+            "translations": [
+                {"index": task["index"], "animal": "Human", "translation": "Meow."}
+                for task in tasks
+            ]
+        }
+    )
+
+
+def rate_limited(retry_after: float) -> web.Response:
+    return web.json_response(
+        {"error": {"message": "Rate limit reached", "type": "requests"}},
+        status=429,
+        headers={"Retry-After": str(math.ceil(retry_after))},
+    )
+
+
+def make_app(
+    latency: float = 0.0,
+    error_rate: float = 0.0,
+    seed: int | None = None,
+    rpm: int = 0,
+) -> web.Application:
+    """
+    Build the mock application.
+
+    Args:
+        latency (float): The time in seconds every completion takes.
+        error_rate (float): The share of requests answered with a 429 error body.
+        seed (int | None): The seed for the error generator.
+        rpm (int): The requests accepted in any 60 second window, 0 is
+            unlimited. Requests above the quota are answered with a 429.
+    """
+    rng = random.Random(seed)
+    accepted: deque[float] = deque()
+
+    async def chat_completions(request: web.Request) -> web.StreamResponse:
+        request.app["calls"] += 1
+        if rpm:
+            now = time.monotonic()
+            while accepted and accepted[0] <= now - 60:
+                accepted.popleft()
+            if len(accepted) >= rpm:
+                request.app["errors"] += 1
+                return rate_limited(accepted[0] + 60 - now)
+            accepted.append(now)
+        data = await request.json()
+        if latency:
+            await asyncio.sleep(latency)
+        if error_rate and rng.random() < error_rate:
+            request.app["errors"] += 1
+            return rate_limited(1)
+
+        if "response_format" in data:
+            tasks = json.loads(data["messages"][-1]["content"])
+            if isinstance(tasks, dict):
+                return web.json_response(completion(JSON_ANSWER))
+            return web.json_response(completion(batch_answer(tasks)))
+        if not data.get("stream"):
+            return web.json_response(completion())
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for token in ANSWER.split(" "):
+            chunk = {"choices": [{"delta": {"content": token + " "}}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    app = web.Application()
+    app["calls"] = 0
+    app["errors"] = 0
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    return app
+
+
+async def start_server(
+    app: web.Application, port: int = 0
+) -> tuple[web.AppRunner, str]:
+    """Start the mock server and return its runner and completions URL."""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", port)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}/v1/chat/completions"
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rpm", type=int, default=0)
+    args = parser.parse_args()
+    web.run_app(
+        make_app(args.latency, args.error_rate, rpm=args.rpm),
+        host="127.0.0.1",
+        port=args.port,
+    )